@@ -0,0 +1,262 @@
+"""
+Scaling benchmark for the pipeline stages on synthetic data.
+
+Fits a synthetic profile to the real extract, writes one Parquet file per size
+and times load_any, score_health, detect_promotions and compute_price_index on
+each. Every measurement runs in a fresh process so peak memory is per stage.
+Results (wall time, peak traced memory, rows/sec) go to a JSON file and are
+compared against a stored baseline; slower-than-tolerance stages are flagged.
+
+--engines pandas,duckdb also times the DuckDB engine, which scans the Parquet
+file inside each stage (so its times include the read that load_any does for
+pandas). DuckDB allocates outside the Python heap, so its traced peak is not
+recorded; max RSS of the worker process is, for both engines. --parity runs
+both engines on each file and fails on any output difference beyond --rtol.
+
+Example:
+    python benchmark.py --sizes 1M,10M,50M
+    python benchmark.py --sizes 1M --save_baseline
+    python benchmark.py --sizes 1M,10M --engines pandas,duckdb --parity
+"""
+from __future__ import annotations
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tracemalloc
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from modules.utils import setup_logging
+from modules.logging_utils import get_logger, _max_rss_mb
+from modules.io_ops import load_any
+from modules.synthetic import fit_profile, write_parquet
+from modules.data_quality import score_health
+from modules.promotions import detect_promotions
+from modules.pricing_index import compute_price_index
+from modules.duckdb_engine import ENGINES, DuckDBEngine
+
+logger = get_logger("benchmark")
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+STAGES = {
+    "load_any": None,
+    "score_health": score_health,
+    "detect_promotions": detect_promotions,
+    "compute_price_index": compute_price_index,
+}
+# stage -> DuckDBEngine method (the engine reads the file itself, so there is no load stage)
+SQL_STAGES = {
+    "score_health": "score_health",
+    "detect_promotions": "detect_promotions",
+    "compute_price_index": "compute_price_index",
+}
+
+
+def _version(module: str) -> str | None:
+    try:
+        return __import__(module).__version__
+    except ImportError:
+        return None
+
+
+def parse_size(text: str) -> int:
+    """'500K', '10M', '1_000_000' -> rows."""
+    text = text.strip().upper().replace("_", "")
+    mult = {"K": 1_000, "M": 1_000_000, "B": 1_000_000_000}.get(text[-1:], 1)
+    return int(float(text[:-1] if mult > 1 else text) * mult)
+
+
+def _measure(stage: str, path: str, trace_memory: bool, engine: str = "pandas") -> dict:
+    """Run one stage on the Parquet file at path (in a fresh worker process)."""
+    setup_logging(0)
+    if engine == "duckdb":
+        call = lambda: getattr(DuckDBEngine(path), SQL_STAGES[stage])()
+        trace_memory = False
+    else:
+        df = None if stage == "load_any" else load_any(path)
+        func = STAGES[stage]
+        call = (lambda: load_any(path)) if func is None else (lambda: func(df))
+
+    start = time.perf_counter()
+    call()
+    wall = time.perf_counter() - start
+
+    peak_mb = None
+    if trace_memory:
+        tracemalloc.start()
+        call()
+        peak_mb = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+    return {"wall_s": wall, "peak_mb": peak_mb, "max_rss_mb": _max_rss_mb()}
+
+
+def frame_diffs(a: pd.DataFrame, b: pd.DataFrame, rtol: float = 1e-9) -> list[str]:
+    """Differences between two outputs: columns, row count, dtypes and values (floats within rtol)."""
+    if list(a.columns) != list(b.columns):
+        return [f"columns {list(a.columns)} != {list(b.columns)}"]
+    if len(a) != len(b):
+        return [f"{len(a)} rows != {len(b)} rows"]
+    diffs = []
+    for col in a.columns:
+        x, y = a[col], b[col]
+        if isinstance(x.dtype, pd.CategoricalDtype) and isinstance(y.dtype, pd.CategoricalDtype):
+            x, y = x.astype(object), y.astype(object)  # pandas keeps categories the output does not use
+        if x.dtype != y.dtype:
+            diffs.append(f"{col}: dtype {x.dtype} != {y.dtype}")
+        elif pd.api.types.is_float_dtype(x):
+            same = np.isclose(x.to_numpy(), y.to_numpy(), rtol=rtol, atol=0.0, equal_nan=True)
+            same |= x.to_numpy() == y.to_numpy()  # equal infinities
+            if not same.all():
+                diffs.append(f"{col}: {int((~same).sum())} values differ")
+        elif not (x.isna().equals(y.isna()) and (x[x.notna()] == y[y.notna()]).all()):
+            diffs.append(f"{col}: values differ")
+    return diffs
+
+
+def _parity(path: str, rtol: float) -> dict[str, list[str]]:
+    """Run every stage on both engines (in a fresh worker process) and diff their outputs."""
+    setup_logging(0)
+    df = load_any(path)
+    engine = DuckDBEngine(path)
+    pairs = {
+        "data_quality": (score_health(df), engine.score_health()),
+        "promotions": (detect_promotions(df), engine.detect_promotions()),
+        "promotions_consecutive": (detect_promotions(df, consecutive=True),
+                                   engine.detect_promotions(consecutive=True)),
+        "price_index": (compute_price_index(df), engine.compute_price_index()),
+    }
+    out = {}
+    for name, (expected, got) in pairs.items():
+        if isinstance(expected, pd.DataFrame):
+            expected, got = (expected,), (got,)
+        for i, (a, b) in enumerate(zip(expected, got)):
+            out[f"{name}[{i}]"] = frame_diffs(a, b, rtol)
+    return out
+
+
+def run_parity(sizes: list[int], data_dir: str, seed: int = 0, rtol: float = 1e-9) -> list[dict]:
+    """Compare the pandas and DuckDB outputs on the benchmark files; return the mismatches."""
+    ctx = mp.get_context("spawn")
+    mismatches = []
+    for n in sizes:
+        path = os.path.join(data_dir, f"synthetic_{n}_{seed}.parquet")
+        with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+            diffs = pool.submit(_parity, path, rtol).result()
+        for output, problems in diffs.items():
+            logger.info("parity %-26s rows=%-11d %s", output, n, "; ".join(problems) or "ok")
+            if problems:
+                mismatches.append({"size": n, "output": output, "problems": problems})
+    return mismatches
+
+
+def run_benchmarks(sizes: list[int], stages: list[str], data_dir: str, profile_from: str,
+                   seed: int = 0, trace_memory: bool = True, engines: tuple[str, ...] = ("pandas",)) -> list[dict]:
+    os.makedirs(data_dir, exist_ok=True)
+    profile = fit_profile(load_any(profile_from))
+    ctx = mp.get_context("spawn")
+    results = []
+    for n in sizes:
+        path = os.path.join(data_dir, f"synthetic_{n}_{seed}.parquet")
+        if not os.path.exists(path):
+            write_parquet(profile, n, path, seed=seed)
+        for engine in engines:
+            for stage in stages:
+                if engine == "duckdb" and stage not in SQL_STAGES:
+                    continue
+                with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+                    m = pool.submit(_measure, stage, path, trace_memory, engine).result()
+                m.update(size=n, stage=stage, engine=engine, rows_per_s=n / m["wall_s"] if m["wall_s"] > 0 else None)
+                logger.info("%-6s %-20s rows=%-11d wall=%8.2f s  peak=%s MB  rss=%.0f MB  rows/s=%.0f",
+                            engine, stage, n, m["wall_s"], "n/a" if m["peak_mb"] is None else f"{m['peak_mb']:.0f}",
+                            m["max_rss_mb"] or 0, m["rows_per_s"] or 0)
+                results.append(m)
+    return results
+
+
+def compare(results: list[dict], baseline: list[dict], tolerance: float) -> list[dict]:
+    """Return the results whose wall time exceeds the baseline by more than tolerance."""
+    base = {(b.get("engine", "pandas"), b["stage"], b["size"]): b for b in baseline}
+    regressions = []
+    for r in results:
+        b = base.get((r["engine"], r["stage"], r["size"]))
+        if b is None:
+            continue
+        ratio = r["wall_s"] / b["wall_s"] if b["wall_s"] else float("inf")
+        r["baseline_wall_s"], r["vs_baseline"] = b["wall_s"], ratio
+        status = "REGRESSION" if ratio > 1 + tolerance else "ok"
+        logger.info("%-6s %-20s rows=%-11d %.2f s vs baseline %.2f s (x%.2f) %s",
+                    r["engine"], r["stage"], r["size"], r["wall_s"], b["wall_s"], ratio, status)
+        if ratio > 1 + tolerance:
+            regressions.append(r)
+    return regressions
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(prog="fmcgBusinessCase-benchmark", description="Stage scaling benchmark")
+    p.add_argument("--sizes", default="1M,10M,50M", help="comma-separated row counts, e.g. 1M,10M,50M")
+    p.add_argument("--stages", default=",".join(STAGES), help="comma-separated subset of " + ",".join(STAGES))
+    p.add_argument("--engines", default="pandas", help="comma-separated subset of " + ",".join(ENGINES))
+    p.add_argument("--parity", action="store_true", help="also check that both engines give the same outputs")
+    p.add_argument("--rtol", type=float, default=1e-9, help="--parity: relative tolerance for float columns")
+    p.add_argument("--profile_from", default=os.path.join(ROOT, "data", "Test_Data.xlsx"))
+    p.add_argument("--data_dir", default=os.path.join(ROOT, "bench", "data"))
+    p.add_argument("--results", default=os.path.join(ROOT, "bench", "results.json"))
+    p.add_argument("--baseline", default=os.path.join(ROOT, "bench", "baseline.json"))
+    p.add_argument("--save_baseline", action="store_true", help="store these results as the new baseline")
+    p.add_argument("--tolerance", type=float, default=0.20, help="allowed slowdown vs baseline (0.20 = 20%%)")
+    p.add_argument("--no_memory", action="store_true", help="skip the traced run used for peak memory")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("-v", "--verbose", action="count", default=1)
+    return p.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    setup_logging(args.verbose)
+    sizes = [parse_size(s) for s in args.sizes.split(",") if s.strip()]
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    engines = tuple(e.strip() for e in args.engines.split(",") if e.strip())
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        raise SystemExit(f"Unknown stages: {sorted(unknown)}")
+    if set(engines) - set(ENGINES):
+        raise SystemExit(f"Unknown engines: {sorted(set(engines) - set(ENGINES))}")
+
+    results = run_benchmarks(sizes, stages, args.data_dir, args.profile_from, args.seed, not args.no_memory, engines)
+    mismatches = run_parity(sizes, args.data_dir, args.seed, args.rtol) if args.parity else []
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, "r", encoding="utf-8") as fh:
+            regressions = compare(results, json.load(fh)["results"], args.tolerance)
+
+    report = {
+        "timestamp": pd.Timestamp.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "duckdb": _version("duckdb") if "duckdb" in engines else None,
+        "machine": platform.platform(),
+        "cpus": os.cpu_count(),
+        "results": results,
+        "parity": mismatches if args.parity else None,
+    }
+    for path in [args.results] + ([args.baseline] if args.save_baseline else []):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+        logger.info("Benchmark results written to %s", path)
+    if mismatches:
+        logger.warning("%d output(s) differ between the pandas and DuckDB engines", len(mismatches))
+    if regressions:
+        logger.warning("%d stage(s) slower than baseline by more than %.0f%%",
+                       len(regressions), args.tolerance * 100)
+    return 1 if regressions or mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,49 +4,122 @@ CLI entrypoint orchestrating the pipeline with enhanced logging and timing.
 Subcommands:
 - data-quality  : compute data health scores by store/supplier
 - promos        : detect promotions and compute uplift/coverage/price deltas
+- promos-sweep  : promo uplift/coverage per SKU for a grid of thresholds and min days
 - pricing       : compute Bidco vs peers price index (store + roll-up)
-- profile       : generate ydata-profiling HTML report
-- run-all       : run all stages in sequence
+- profile       : per-column profile (JSON/HTML) from mergeable sketches; --ydata for ydata-profiling
+- run-all       : run all stages (in parallel with --jobs > 1)
+- ingest        : fold a new batch of days into the state store and refresh all outputs
+
+With --engine duckdb, data-quality, promos, pricing and run-all compute their
+stages as SQL in DuckDB over the input files instead of loading them into pandas.
 """
 from __future__ import annotations
+import os
 import time
 import logging
+import tracemalloc
 from typing import Any
 
 from modules.utils import parse_args, setup_logging
-from modules.logging_utils import get_logger, timeit
-from modules.io_ops import load_any, write_table
+from modules.logging_utils import get_logger, timeit, configure_profiling, write_run_manifest
+from modules.io_ops import load_any, iter_source
+from modules.outputs import get_writer, flush_outputs
 from modules.data_quality import score_health
-from modules.promotions import detect_promotions
-from modules.pricing_index import compute_price_index
-from modules.reporting import generate_profile_html
+from modules.dq_rules import get_rules
+from modules.promotions import detect_promotions, detect_episodes, sweep_promotions, episodes_from_daily
+from modules.pricing_index import (compute_price_index, compute_price_cube, compute_price_series,
+                                   price_cube, price_series)
+from modules.duckdb_engine import get_engine
+from modules.reporting import generate_profile_html, write_profile_report
+from modules.profiler import profile_frames
+from modules.scheduler import Stage, run_stages
+from modules.incremental import ingest, outputs_from_state
+from modules.aggregates import shared_cache
+from modules.sharding import score_health_sharded, detect_promotions_sharded, compute_price_index_sharded
+from modules.streaming import score_health_stream
 setup_logging()
 logger = get_logger(__name__)
 
+# Standard columns each subcommand reads; None means every column
+# (data-quality flags a row as missing if any of its columns is null).
+STAGE_COLUMNS = {
+    "data-quality": None,
+    "promos": ["Store_Name", "Item_Code", "Description", "Sub_Department", "Section",
+               "Quantity", "RRP", "Supplier", "Date_Of_Sale", "realised_unit_price"],
+    "promos-sweep": ["Store_Name", "Item_Code", "Description", "Sub_Department", "Section",
+                     "Quantity", "RRP", "Supplier", "Date_Of_Sale", "realised_unit_price"],
+    "pricing": ["Store_Name", "Sub_Department", "Section", "Supplier",
+                "Quantity", "Date_Of_Sale", "realised_unit_price"],
+    "profile": None,
+    "run-all": None,
+    "ingest": None,
+}
+# subcommands --engine duckdb runs as SQL over the input files
+ENGINE_COMMANDS = ("data-quality", "promos", "pricing", "run-all")
+
+
+def write_output(df, name: str, args) -> None:
+    """Hand a table to this process's output writer (see modules.outputs)."""
+    fmt = args.output_format or ("both" if args.save_parquet else "csv")
+    partition_by = tuple(p.strip() for p in args.partition_by.split(",") if p.strip())
+    get_writer(args.output_dir, fmt, partition_by, args.csv_compression,
+               args.parquet_compression, args.writer_threads).write(df, name)
+
+
+def sql_engine(args):
+    """This process's DuckDB engine over the input (see modules.duckdb_engine)."""
+    return get_engine(args.input_path, args.duckdb_threads, args.duckdb_memory_limit, args.duckdb_temp_dir,
+                      cache_dir=None if args.no_cache else args.cache_dir)
+
 
 @timeit(logger, "cmd_data_quality")
 def cmd_data_quality(df, args) -> None:
     """
     Run data health scoring and write outputs.
     """
+    rules = get_rules(args.dq_rules)
     logger.info(
-        "Starting data-quality stage (extreme_price_factor=%s)",
+        "Starting data-quality stage (extreme_price_factor=%s, rules=%s)",
         args.extreme_price_factor,
+        rules.source,
     )
-    dq_store, dq_supplier = score_health(
-        df, extreme_price_factor=args.extreme_price_factor
-    )
+    if args.engine == "duckdb":
+        dq_store, dq_supplier = sql_engine(args).score_health(args.extreme_price_factor, rules)
+    elif args.shards:
+        dq_store, dq_supplier = score_health_sharded(
+            df, args.extreme_price_factor, jobs=args.jobs, n_shards=args.shards, rules=rules
+        )
+    else:
+        dq_store, dq_supplier = score_health(
+            df, extreme_price_factor=args.extreme_price_factor,
+            cache=shared_cache(df), rules=rules,
+        )
     logger.info(
         "Data-quality summaries generated: stores=%d, suppliers=%d",
         len(dq_store),
         len(dq_supplier),
     )
-    write_table(dq_store, args.output_dir,
-                "data_quality_store", args.save_parquet)
-    write_table(
-        dq_supplier, args.output_dir, "data_quality_supplier", args.save_parquet
+    write_output(dq_store, "data_quality_store", args)
+    write_output(dq_supplier, "data_quality_supplier", args)
+    logger.info("Data-quality outputs queued for %s", args.output_dir)
+
+
+@timeit(logger, "cmd_data_quality_stream")
+def cmd_data_quality_stream(args) -> None:
+    """
+    Run data health scoring over the input read in chunks and write outputs.
+    """
+    logger.info(
+        "Starting streamed data-quality stage (chunk_rows=%d, extreme_price_factor=%s)",
+        args.chunk_rows,
+        args.extreme_price_factor,
     )
-    logger.info("Data-quality outputs written to %s", args.output_dir)
+    dq_store, dq_supplier = score_health_stream(
+        args.input_path, args.chunk_rows, args.extreme_price_factor, get_rules(args.dq_rules)
+    )
+    write_output(dq_store, "data_quality_store", args)
+    write_output(dq_supplier, "data_quality_supplier", args)
+    logger.info("Data-quality outputs queued for %s", args.output_dir)
 
 
 @timeit(logger, "cmd_promos")
@@ -55,17 +128,56 @@ def cmd_promos(df, args) -> None:
     Run promotion detection and KPI computation and write outputs.
     """
     logger.info(
-        "Starting promotions stage (discount_threshold=%.2f, min_days=%d)",
+        "Starting promotions stage (discount_threshold=%.2f, min_days=%d, consecutive=%s)",
         args.promo_discount_threshold,
         args.promo_min_days,
+        args.promo_consecutive,
     )
-    promo_summary = detect_promotions(
-        df, args.promo_discount_threshold, args.promo_min_days
-    )
+    if args.engine == "duckdb":
+        engine = sql_engine(args)
+        promo_summary = engine.detect_promotions(
+            args.promo_discount_threshold, args.promo_min_days, args.promo_consecutive,
+        )
+    elif args.shards:
+        promo_summary = detect_promotions_sharded(
+            df, args.promo_discount_threshold, args.promo_min_days,
+            jobs=args.jobs, n_shards=args.shards, consecutive=args.promo_consecutive,
+        )
+    else:
+        promo_summary = detect_promotions(
+            df, args.promo_discount_threshold, args.promo_min_days,
+            cache=shared_cache(df), consecutive=args.promo_consecutive,
+        )
     logger.info("Promo summary shape: rows=%d, cols=%d", *promo_summary.shape)
-    write_table(promo_summary, args.output_dir,
-                "promo_summary", args.save_parquet)
-    logger.info("Promotions output written to %s", args.output_dir)
+    write_output(promo_summary, "promo_summary", args)
+    if args.engine == "duckdb":
+        episodes = episodes_from_daily(
+            sql_engine(args).daily_grain(args.promo_discount_threshold), args.episode_window_days
+        )
+    else:
+        episodes = detect_episodes(
+            df, args.promo_discount_threshold, args.episode_window_days,
+            cache=shared_cache(df),
+        )
+    write_output(episodes, "promo_episodes", args)
+    logger.info("Promotions output queued for %s", args.output_dir)
+
+
+@timeit(logger, "cmd_promos_sweep")
+def cmd_promos_sweep(df, args) -> None:
+    """
+    Run the promotion KPIs for a grid of thresholds and min days and write one tidy table.
+    """
+    thresholds = [float(t) for t in args.sweep_thresholds.split(",") if t.strip()]
+    min_days = [int(m) for m in args.sweep_min_days.split(",") if m.strip()]
+    logger.info(
+        "Starting promotions sweep (thresholds=%s, min_days=%s)",
+        thresholds,
+        min_days,
+    )
+    sweep = sweep_promotions(df, thresholds, min_days, cache=shared_cache(df))
+    write_output(sweep, "promo_sweep", args)
+    logger.info("Promotions sweep output queued for %s", args.output_dir)
 
 
 @timeit(logger, "cmd_pricing")
@@ -74,26 +186,69 @@ def cmd_pricing(df, args) -> None:
     Run Bidco vs peers pricing index and write outputs.
     """
     logger.info("Starting pricing stage")
-    price_idx, rollup = compute_price_index(df)
+    if args.engine == "duckdb":
+        engine = sql_engine(args)
+        price_idx, rollup = engine.compute_price_index()
+    elif args.shards:
+        price_idx, rollup = compute_price_index_sharded(df, jobs=args.jobs, n_shards=args.shards)
+    else:
+        price_idx, rollup = compute_price_index(df, cache=shared_cache(df))
     logger.info(
         "Computed pricing index (grain rows=%d), roll-up available=%s",
         len(price_idx),
         not rollup.empty,
     )
-    write_table(price_idx, args.output_dir, "price_index", args.save_parquet)
-    write_table(rollup, args.output_dir,
-                "price_index_rollup", args.save_parquet)
-    logger.info("Pricing outputs written to %s", args.output_dir)
+    write_output(price_idx, "price_index", args)
+    write_output(rollup, "price_index_rollup", args)
+    if args.engine == "duckdb":
+        cube = price_cube(engine.supplier_grain())
+    else:
+        cube = compute_price_cube(df, cache=shared_cache(df))
+    write_output(cube, "price_index_cube", args)
+    if args.engine == "duckdb":
+        series = price_series(engine.supplier_grain(["Date_Of_Sale"]))
+    else:
+        series = compute_price_series(df, cache=shared_cache(df))
+    write_output(series, "price_index_series", args)
+    logger.info("Pricing outputs queued for %s", args.output_dir)
 
 
 @timeit(logger, "cmd_profile")
 def cmd_profile(df, args) -> None:
     """
-    Generate a ydata-profiling HTML report.
+    Profile the frame (or, with chunk_rows and no df, the input read in chunks)
+    and write the JSON/HTML report; --ydata uses ydata-profiling instead.
     """
     logger.info("Starting profiling stage (reports_dir=%s)", args.reports_dir)
-    path = generate_profile_html(df, args.reports_dir)
-    logger.info("Profile report generated at %s", path)
+    if args.ydata:
+        path = generate_profile_html(df, args.reports_dir, sample_rows=args.ydata_sample or None)
+        logger.info("Profile report generated at %s", path)
+        return
+    frames = df if df is not None else iter_source(args.input_path, args.chunk_rows)
+    json_path, html_path = write_profile_report(profile_frames(frames), args.reports_dir)
+    logger.info("Profile report generated at %s (JSON: %s)", html_path, json_path)
+
+
+@timeit(logger, "cmd_ingest")
+def cmd_ingest(df, args) -> None:
+    """
+    Fold the loaded batch into the state store and rewrite every output from it.
+    """
+    logger.info("Starting incremental ingest (state_dir=%s)", args.state_dir)
+    rules = get_rules(args.dq_rules)
+    tables = ingest(
+        df, args.state_dir,
+        discount_threshold=args.promo_discount_threshold,
+        extreme_price_factor=args.extreme_price_factor,
+        reset=args.reset_state,
+        rules=rules,
+    )
+    outputs = outputs_from_state(
+        tables, args.promo_min_days, args.promo_consecutive, args.episode_window_days, rules
+    )
+    for name, out in outputs.items():
+        write_output(out, name, args)
+    logger.info("Incremental outputs queued for %s", args.output_dir)
 
 
 def main() -> None:
@@ -102,6 +257,13 @@ def main() -> None:
     """
     args = parse_args()
     setup_logging(args.verbose)
+    started = time.time()
+    if args.trace_memory:
+        tracemalloc.start()
+    configure_profiling(
+        [s.strip() for s in args.profile_stages.split(",") if s.strip()],
+        kind=args.profiler, out_dir=args.reports_dir,
+    )
 
     logger.info("=== Duck × Bidco Case Pipeline Started ===")
     try:
@@ -110,24 +272,65 @@ def main() -> None:
         # In rare cases, argparse namespace may not be serializable; ignore.
         pass
 
-    logger.info("Loading data from %s", args.input_path)
-    df = load_any(args.input_path)
-    logger.info("Loaded %d rows", len(df))
+    # streamed data-quality / profile runs read the input chunk by chunk instead of loading it whole
+    # with --engine duckdb the stages scan the input themselves
+    sql = args.engine == "duckdb" and args.command in ENGINE_COMMANDS
+    streamed = not sql and args.chunk_rows > 0 and (
+        args.command == "data-quality" or (args.command == "profile" and not args.ydata)
+    )
+    df = None
+    if not streamed and not sql:
+        logger.info("Loading data from %s", args.input_path)
+        df = timeit(logger, "load_any")(load_any)(
+            args.input_path,
+            columns=STAGE_COLUMNS[args.command],
+            cache_dir=None if args.no_cache else args.cache_dir,
+            rebuild_cache=args.rebuild_cache,
+            jobs=args.load_jobs,
+        )
+        logger.info("Loaded %d rows", len(df))
 
-    if args.command == "data-quality":
+    if streamed and args.command == "data-quality":
+        cmd_data_quality_stream(args)
+    elif args.command == "data-quality":
         cmd_data_quality(df, args)
     elif args.command == "promos":
         cmd_promos(df, args)
+    elif args.command == "promos-sweep":
+        cmd_promos_sweep(df, args)
     elif args.command == "pricing":
         cmd_pricing(df, args)
     elif args.command == "profile":
         cmd_profile(df, args)
+    elif args.command == "ingest":
+        cmd_ingest(df, args)
     elif args.command == "run-all":
-        cmd_data_quality(df, args)
-        cmd_promos(df, args)
-        cmd_pricing(df, args)
+        stages = [
+            Stage("data-quality", cmd_data_quality),
+            Stage("promos", cmd_promos),
+            Stage("pricing", cmd_pricing),
+        ]
+        if sql and args.jobs > 1:
+            logger.info("--engine duckdb runs the stages in-process on %s DuckDB thread(s); ignoring --jobs",
+                        args.duckdb_threads or "all")
+        run_stages(stages, df, args, jobs=1 if sql else args.jobs)
+        if df is not None and args.jobs <= 1:
+            shared_cache(df).log_stats()
         logger.info("Pipeline completed (run-all).")
 
+    outputs = flush_outputs()
+    logger.info("%d output file(s) written", sum(len(o["files"]) for o in outputs))
+    manifest = write_run_manifest(
+        os.path.join(args.output_dir, "run_manifest.json"),
+        command=args.command,
+        inputs=df.attrs.get("inputs") if df is not None else None,
+        outputs=outputs,
+        args=vars(args),
+        started=time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(started)),
+        total_s=time.time() - started,
+    )
+    logger.info("Run manifest written to %s", manifest)
+
 
 if __name__ == "__main__":
     start_time = time.time()
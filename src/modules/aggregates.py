@@ -0,0 +1,74 @@
+"""
+Per-run memo of intermediate aggregates shared between pipeline stages.
+
+Stages build their grains (store × item × day, supplier price sums, health
+flags and counters) through `cached`, which looks them up in the AggregateCache
+of the input frame: the first stage that needs a grain builds it, later stages
+with the same grain and parameters get the same object back. Cached aggregates
+are shared, so callers must treat them as read-only.
+
+One cache exists per input frame object (see shared_cache); stages that run in
+the same process on the same frame share it, including pool workers, which map
+the input once.
+"""
+from __future__ import annotations
+import time
+import weakref
+from typing import Any, Callable
+import pandas as pd
+from .logging_utils import get_logger
+
+logger = get_logger(__name__)
+
+_CACHES: dict[int, "AggregateCache"] = {}
+
+
+def _freeze(value):
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    return value
+
+
+class AggregateCache:
+    """Aggregates of one frame, keyed by grain name and build parameters."""
+
+    def __init__(self, df: pd.DataFrame):
+        self._df = weakref.ref(df)
+        self._entries: dict[tuple, Any] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, grain: str, build: Callable[..., Any], **params) -> Any:
+        """Return build(df, **params), building it only on the first request."""
+        key = (grain, _freeze(params))
+        if key in self._entries:
+            self.hits += 1
+            logger.info("Aggregate cache hit: %s %s", grain, params or "")
+            return self._entries[key]
+        self.misses += 1
+        start = time.perf_counter()
+        value = self._entries[key] = build(self._df(), **params)
+        logger.info("Aggregate cache miss: %s %s built in %.1f ms", grain, params or "",
+                    (time.perf_counter() - start) * 1000.0)
+        return value
+
+    def log_stats(self) -> None:
+        logger.info("Aggregate cache: %d entries, %d hits, %d misses", len(self._entries), self.hits, self.misses)
+
+
+def shared_cache(df: pd.DataFrame) -> AggregateCache:
+    """The AggregateCache of this frame object, created on first use and dropped with the frame."""
+    cache = _CACHES.get(id(df))
+    if cache is None:
+        cache = _CACHES[id(df)] = AggregateCache(df)
+        weakref.finalize(df, _CACHES.pop, id(df), None)
+    return cache
+
+
+def cached(cache: AggregateCache | None, df: pd.DataFrame, grain: str, build: Callable[..., Any], **params) -> Any:
+    """Build a grain of df through cache (when it belongs to df), else directly."""
+    if cache is None or cache._df() is not df:
+        return build(df, **params)
+    return cache.get(grain, build, **params)
@@ -1,49 +1,110 @@
-"""Data health scoring per store/supplier with logging."""
+"""Data health scoring per store/supplier with logging.
+
+Scoring is split into mergeable pieces so it can run on partitions of the data:
+partial_health counts flagged rows and RRP moments per group, merge_health sums
+partials, and finalize_health turns the merged counters into rates and scores.
+The row checks and score weights come from a rule set (see dq_rules); the
+default one is the built-in DEFAULT_RULES.
+"""
 from __future__ import annotations
 import pandas as pd, numpy as np
 from .logging_utils import get_logger, timeit
+from .aggregates import AggregateCache, cached
+from .dq_rules import RuleSet, count_flags, get_rules
 
 logger = get_logger(__name__)
 
+
+def dup_key_cols(df: pd.DataFrame, rules: RuleSet | None = None) -> list[str] | None:
+    """Duplicate key of the rule set for df (by default store/date/item, or store/date/barcode/description
+    if item codes are missing); None without a duplicate rule."""
+    return (rules or get_rules()).key_cols(df)
+
+
+def flag_rows(df: pd.DataFrame, extreme_price_factor: float = 10.0, key_cols: list[str] | None = None,
+              with_dups: bool = True, rules: RuleSet | None = None) -> np.ndarray:
+    """Bit-packed health flags per row: one word per row, bit i set when rule i flags it.
+
+    with_dups=False leaves out the duplicate rule, for callers that see only
+    part of the rows a duplicate could span (see streaming.score_health_stream).
+    """
+    return (rules or get_rules()).flag_words(df, {"extreme_price_factor": extreme_price_factor},
+                                             key_cols, with_dups)
+
+
+def partial_health(df: pd.DataFrame, group_cols: list[str], extreme_price_factor: float = 10.0,
+                   key_cols: list[str] | None = None, flags: np.ndarray | None = None,
+                   rules: RuleSet | None = None):
+    """
+    Mergeable health counters for one partition: (counts, rrp) where counts holds
+    rows and flagged-row counts per group and rrp holds n/mean/var of RRP per
+    group × Item_Code.
+    """
+    rules = rules or get_rules()
+    if flags is None:
+        flags = flag_rows(df, extreme_price_factor, key_cols, rules=rules)
+    keys = [df[c] for c in group_cols]
+    counts = count_flags(keys, flags, rules.flags)
+    r = df["RRP"].groupby(keys + [df["Item_Code"]], observed=True)
+    rrp = pd.DataFrame({"n": r.count(), "mean": r.mean(), "var": r.var()})
+    return counts.reset_index(), rrp.reset_index()
+
+
+def _merge_moments(rrp: pd.DataFrame, keys: list[str]) -> pd.DataFrame:
+    """Combine per-partition RRP n/mean/var per key (Chan et al.); keys seen once pass through as-is."""
+    by = [rrp[k] for k in keys]
+    n = rrp["n"].astype(float)
+    tot_n = n.groupby(by, observed=True).transform("sum")
+    cmean = (rrp["mean"] * n).where(n > 0, 0.0).groupby(by, observed=True).transform("sum") / tot_n.where(tot_n > 0)
+    m2 = (rrp["var"] * (n - 1)).where(n > 1, 0.0) + (n * (rrp["mean"] - cmean) ** 2).where(n > 0, 0.0)
+    out = pd.DataFrame({"n": n, "mean": rrp["mean"], "var": rrp["var"], "cmean": cmean, "m2": m2}).groupby(
+        by, observed=True, sort=True).agg(
+        parts=("n", "size"), n=("n", "sum"), mean=("mean", "first"), var=("var", "first"),
+        cmean=("cmean", "first"), m2=("m2", "sum"))
+    multi = out["parts"] > 1
+    out["mean"] = out["mean"].where(~multi, out["cmean"])
+    out["var"] = out["var"].where(~multi, out["m2"] / (out["n"] - 1).where(out["n"] > 1))
+    return out[["n", "mean", "var"]].astype({"n": "int64"}).reset_index()
+
+
+def merge_health(partials: list[tuple[pd.DataFrame, pd.DataFrame]], group_cols: list[str]):
+    """Sum counters and combine RRP moments from several partial_health results."""
+    counts = pd.concat([c for c, _ in partials], ignore_index=True)
+    counts = counts.groupby(group_cols, observed=True, sort=True).sum().reset_index()
+    rrp = _merge_moments(pd.concat([r for _, r in partials], ignore_index=True), group_cols + ["Item_Code"])
+    return counts, rrp
+
+
+def finalize_health(counts: pd.DataFrame, rrp: pd.DataFrame, group_cols: list[str],
+                    rules: RuleSet | None = None) -> pd.DataFrame:
+    """Rates, component scores and the weighted data_health_score per group."""
+    rules = rules or get_rules()
+    res = counts[group_cols + ["rows"]].copy()
+    for flag, rate in rules.flags.items():
+        res[rate] = counts[flag] / counts["rows"]
+    for score, rates in rules.scores.items():
+        res[score] = 1 - res[rates].max(axis=1)
+    std = pd.Series(np.sqrt(rrp["var"].to_numpy()), index=rrp.index)
+    stab = std.groupby([rrp[c] for c in group_cols], observed=True).mean().reset_index(name="avg_rrp_std")
+    res = res.merge(stab, on=group_cols, how="left")
+    s = res["avg_rrp_std"]
+    res["score_consistency"] = 1 - (s - s.min()) / (s.max() - s.min()) if s.notna().sum()>1 else 1.0
+    total = None
+    for score, w in rules.weights.items():
+        total = res[score]*w if total is None else total + res[score]*w
+    res["data_health_score"] = total * 100
+    num_cols = [*rules.flags.values(), "data_health_score"]
+    res[num_cols] = res[num_cols].round(4)
+    return res
+
+
 @timeit(logger, "score_health")
-def score_health(df: pd.DataFrame, extreme_price_factor: float = 10.0):
-    work = df.copy()
-    logger.info("Scoring data health on %d rows", len(work))
-    work["missing_any"] = work.isna().any(axis=1)
-    work["neg_qty"] = work["Quantity"] < 0
-    work["bad_rrp"] = (work["RRP"] <= 0) | (work["RRP"].isna())
-    work["extreme_price"] = (work["realised_unit_price"] > extreme_price_factor * work["RRP"]) | (work["realised_unit_price"] < (1.0/extreme_price_factor) * work["RRP"])
-
-    key_cols = ["Store_Name","Date_Of_Sale","Item_Code"]
-    if work[key_cols].isna().any().any():
-        key_cols = ["Store_Name","Date_Of_Sale","Item_Barcode","Description"]
-    work["dup_key"] = work.duplicated(subset=key_cols, keep=False)
-
-    def summarize(group_cols):
-        g = work.groupby(group_cols)
-        res = pd.DataFrame({
-            "rows": g.size(),
-            "missing_rate": g["missing_any"].mean(),
-            "dup_rate": g["dup_key"].mean(),
-            "neg_qty_rate": g["neg_qty"].mean(),
-            "bad_rrp_rate": g["bad_rrp"].mean(),
-            "extreme_price_rate": g["extreme_price"].mean(),
-        }).reset_index()
-        validity_penalty = res[["neg_qty_rate","bad_rrp_rate","extreme_price_rate"]].max(axis=1)
-        res["score_completeness"] = 1 - res["missing_rate"]
-        res["score_uniqueness"] = 1 - res["dup_rate"]
-        res["score_validity"] = 1 - validity_penalty
-        rrps = work.groupby(group_cols + ["Item_Code"])["RRP"].agg(["mean","std"]).reset_index()
-        stab = rrps.groupby(group_cols)["std"].mean().reset_index().rename(columns={"std":"avg_rrp_std"})
-        res = res.merge(stab, on=group_cols, how="left")
-        s = res["avg_rrp_std"]
-        res["score_consistency"] = 1 - (s - s.min()) / (s.max() - s.min()) if s.notna().sum()>1 else 1.0
-        w = {"score_completeness":0.30, "score_uniqueness":0.30, "score_validity":0.25, "score_consistency":0.15}
-        res["data_health_score"] = (res["score_completeness"]*w["score_completeness"] + res["score_uniqueness"]*w["score_uniqueness"] + res["score_validity"]*w["score_validity"] + res["score_consistency"]*w["score_consistency"]) * 100
-        num_cols = ["missing_rate","dup_rate","neg_qty_rate","bad_rrp_rate","extreme_price_rate","data_health_score"]
-        res[num_cols] = res[num_cols].round(4)
-        return res
-
-    store, supplier = summarize(["Store_Name"]), summarize(["Supplier"])
+def score_health(df: pd.DataFrame, extreme_price_factor: float = 10.0, cache: AggregateCache | None = None,
+                 rules: RuleSet | None = None):
+    rules = rules or get_rules()
+    logger.info("Scoring data health on %d rows (%d rules from %s)", len(df), len(rules.rules), rules.source)
+    flags = cached(cache, df, "health_flags", flag_rows, extreme_price_factor=extreme_price_factor, rules=rules)
+    store = finalize_health(*partial_health(df, ["Store_Name"], flags=flags, rules=rules), ["Store_Name"], rules)
+    supplier = finalize_health(*partial_health(df, ["Supplier"], flags=flags, rules=rules), ["Supplier"], rules)
     logger.info("Health summaries — stores: %d, suppliers: %d", len(store), len(supplier))
     return store, supplier
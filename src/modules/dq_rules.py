@@ -0,0 +1,215 @@
+"""
+Declarative data-quality rules behind the health scores.
+
+A rule set is a JSON document (--dq_rules; DEFAULT_RULES is the built-in one)
+listing row checks and the weights of the score components:
+
+    {"rules": [{"name": "neg_qty", "check": "compare", "column": "Quantity", "op": "<", "value": 0,
+                "rate": "neg_qty_rate", "score": "score_validity"}, ...],
+     "weights": {"score_completeness": 0.30, "score_uniqueness": 0.30,
+                 "score_validity": 0.25, "score_consistency": 0.15}}
+
+Checks:
+- missing   : any of `columns` (default: every column) is null
+- duplicate : the row's key (`keys`, or `fallback` when a key column has nulls
+              anywhere) occurs on more than one row; at most one per rule set
+- compare   : `column` <op> `value`, or <op> `factor` × `ref`; with "null": true
+              rows where the column is null are flagged too
+- ratio     : `column` above `factor` × `ref` or below `ref` / `factor`
+
+Rule columns must be SCHEMA columns or realised_unit_price, and `factor` must
+be > 0. `value` and `factor` may name a run parameter instead of a number (e.g.
+"extreme_price_factor"; its factor is checked once resolved). Each rule gives its groups a rate column (`rate`,
+default <name>_rate); a component score is 1 minus the largest rate of its
+rules, and score_consistency always comes from RRP variability per item.
+
+RuleSet.flag_words evaluates the rules in one pass into a bit-packed flag word
+per row (bit i for rule i: uint8 up to 8 rules, up to uint64 for 64), so more
+rules do not mean more columns; count_flags counts flagged rows per group from
+the distinct (group, word) pairs. Duplicate keys are compared as 64-bit hashes
+(key_hash), so a false duplicate needs a hash collision.
+"""
+from __future__ import annotations
+import json
+import operator
+import numpy as np
+import pandas as pd
+from .io_ops import SCHEMA
+from .logging_utils import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_RULES = {
+    "rules": [
+        {"name": "missing_any", "check": "missing", "rate": "missing_rate", "score": "score_completeness"},
+        {"name": "dup_key", "check": "duplicate", "keys": ["Store_Name", "Date_Of_Sale", "Item_Code"],
+         "fallback": ["Store_Name", "Date_Of_Sale", "Item_Barcode", "Description"],
+         "rate": "dup_rate", "score": "score_uniqueness"},
+        {"name": "neg_qty", "check": "compare", "column": "Quantity", "op": "<", "value": 0,
+         "rate": "neg_qty_rate", "score": "score_validity"},
+        {"name": "bad_rrp", "check": "compare", "column": "RRP", "op": "<=", "value": 0, "null": True,
+         "rate": "bad_rrp_rate", "score": "score_validity"},
+        {"name": "extreme_price", "check": "ratio", "column": "realised_unit_price", "ref": "RRP",
+         "factor": "extreme_price_factor", "rate": "extreme_price_rate", "score": "score_validity"},
+    ],
+    "weights": {"score_completeness": 0.30, "score_uniqueness": 0.30, "score_validity": 0.25,
+                "score_consistency": 0.15},
+}
+CHECKS = {"missing": (), "duplicate": ("keys",), "compare": ("column", "op"), "ratio": ("column", "ref", "factor")}
+OPS = {"<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge,
+       "==": operator.eq, "!=": operator.ne}
+CONSISTENCY = "score_consistency"  # scored from RRP variability, not from rules
+WORD_TYPES = (np.uint8, np.uint16, np.uint32, np.uint64)
+COLUMNS = set(SCHEMA) | {"realised_unit_price"}  # what load_any gives the rules to check
+
+_RULES: dict[str | None, "RuleSet"] = {}
+
+
+def key_hash(df: pd.DataFrame, key_cols: list[str]) -> np.ndarray:
+    """64-bit hash of each row's key values; equal keys hash equally whatever the frame's dtypes."""
+    cols = {}
+    for c in key_cols:
+        s = df[c]
+        base = s.cat.categories if isinstance(s.dtype, pd.CategoricalDtype) else s
+        # a chunk with nulls parses integer codes as floats; hash every numeric key as float64
+        cols[c] = s.astype("float64") if pd.api.types.is_numeric_dtype(base.dtype) else s
+    return pd.util.hash_pandas_object(pd.DataFrame(cols), index=False).to_numpy()
+
+
+class RuleSet:
+    """A validated rule set: the rules in bit order, flag -> rate names and the score weights."""
+
+    def __init__(self, config: dict, source: str = "built-in"):
+        rules, weights = config.get("rules"), config.get("weights")
+        if not isinstance(rules, list) or not rules or not isinstance(weights, dict):
+            raise ValueError(f"{source}: a rule set needs a non-empty 'rules' list and a 'weights' object")
+        if len(rules) > 64:
+            raise ValueError(f"{source}: {len(rules)} rules; at most 64 fit in a flag word")
+        for rule in rules:
+            name, check = rule.get("name"), rule.get("check")
+            if check not in CHECKS:
+                raise ValueError(f"{source}: rule {name!r} has unknown check {check!r}; "
+                                 f"expected one of {sorted(CHECKS)}")
+            missing = [k for k in CHECKS[check] + ("name", "score") if k not in rule]
+            if missing:
+                raise ValueError(f"{source}: rule {name!r} ({check}) lacks {missing}")
+            if check == "compare" and (rule["op"] not in OPS or ("value" in rule) == ("ref" in rule)):
+                raise ValueError(f"{source}: compare rule {name!r} needs an op in {sorted(OPS)} "
+                                 "and exactly one of 'value' or 'ref'")
+            cols = [rule[k] for k in ("column", "ref") if k in rule]
+            cols += [c for k in ("keys", "fallback", "columns") for c in rule.get(k) or []]
+            unknown = [c for c in cols if c not in COLUMNS]
+            if unknown:
+                raise ValueError(f"{source}: rule {name!r} refers to unknown columns {unknown}; "
+                                 f"expected columns of {sorted(COLUMNS)}")
+            factor = rule.get("factor", 1.0)
+            if not isinstance(factor, str) and not (isinstance(factor, (int, float)) and factor > 0):
+                raise ValueError(f"{source}: rule {name!r} needs a factor > 0, got {factor!r}")
+            if rule["score"] not in weights or rule["score"] == CONSISTENCY:
+                raise ValueError(f"{source}: rule {name!r} scores {rule['score']!r}, which is not a weighted "
+                                 f"rule component ({sorted(set(weights) - {CONSISTENCY})})")
+        names = [r["name"] for r in rules]
+        if len(set(names)) != len(names):
+            raise ValueError(f"{source}: rule names must be unique")
+        dups = [r for r in rules if r["check"] == "duplicate"]
+        if len(dups) > 1:
+            raise ValueError(f"{source}: at most one duplicate rule is supported")
+        unscored = [s for s in weights if s != CONSISTENCY and all(r["score"] != s for r in rules)]
+        if unscored:
+            raise ValueError(f"{source}: weighted components {unscored} have no rules")
+
+        self.config = config
+        self.source = source
+        self.rules = rules
+        self.weights = {s: float(w) for s, w in weights.items()}
+        self.flags = {r["name"]: r.get("rate", f"{r['name']}_rate") for r in rules}
+        self.scores = {s: [self.flags[r["name"]] for r in rules if r["score"] == s]
+                       for s in weights if s != CONSISTENCY}
+        self.duplicate = dups[0] if dups else None
+        self.word_type = next(t for t in WORD_TYPES if len(rules) <= 8 * np.dtype(t).itemsize)
+
+    def __repr__(self) -> str:
+        return f"RuleSet({self.source}, {len(self.rules)} rules)"
+
+    @property
+    def is_default(self) -> bool:
+        return self.config == DEFAULT_RULES
+
+    def key_cols(self, df: pd.DataFrame) -> list[str] | None:
+        """The duplicate rule's key for df: its keys, or its fallback if a key column has nulls."""
+        if self.duplicate is None:
+            return None
+        keys, fallback = self.duplicate["keys"], self.duplicate.get("fallback")
+        return fallback if fallback and df[keys].isna().any().any() else keys
+
+    def param(self, value, params: dict) -> float:
+        if isinstance(value, str):
+            if value not in params:
+                raise ValueError(f"{self.source}: unknown rule parameter {value!r}; known: {sorted(params)}")
+            return params[value]
+        return value
+
+    def factor(self, rule: dict, params: dict) -> float:
+        """The rule's factor (default 1), resolved from params if it names one; must be > 0."""
+        f = self.param(rule.get("factor", 1.0), params)
+        if not f > 0:
+            raise ValueError(f"{self.source}: rule {rule['name']!r} needs a factor > 0, got {f!r}")
+        return f
+
+    def flag_words(self, df: pd.DataFrame, params: dict, key_cols: list[str] | None = None,
+                   with_dups: bool = True) -> np.ndarray:
+        """One flag word per row of df, bit i set when rules[i] flags the row (dups left 0 unless with_dups)."""
+        words = np.zeros(len(df), dtype=self.word_type)
+        for bit, rule in enumerate(self.rules):
+            check = rule["check"]
+            if check == "duplicate" and not with_dups:
+                continue
+            if check == "missing":
+                mask = np.zeros(len(df), dtype=bool)
+                for c in rule.get("columns") or df.columns:
+                    mask |= df[c].isna().to_numpy()
+            elif check == "duplicate":
+                h = key_hash(df, key_cols or self.key_cols(df))
+                mask = pd.Series(h).duplicated(keep=False).to_numpy()
+            elif check == "compare":
+                col = df[rule["column"]]
+                rhs = (self.param(rule["value"], params) if "value" in rule
+                       else self.factor(rule, params) * df[rule["ref"]])
+                mask = OPS[rule["op"]](col, rhs)
+                if rule.get("null"):
+                    mask = mask | col.isna()
+            else:
+                col, ref, f = df[rule["column"]], df[rule["ref"]], self.factor(rule, params)
+                mask = (col > f * ref) | (col < (1.0 / f) * ref)
+            words[np.asarray(mask, dtype=bool)] |= self.word_type(1 << bit)
+        return words
+
+
+def count_flags(keys: list, words: np.ndarray, names) -> pd.DataFrame:
+    """
+    Rows and flagged-row counts (columns rows, *names) per group of keys (as
+    for groupby, observed groups only), from flag words with bit i for names[i].
+    """
+    w = pd.Series(words, index=keys[0].index if isinstance(keys[0], pd.Series) else None)
+    sizes = w.groupby(list(keys) + [w], observed=True).size()
+    levels = list(range(len(keys)))
+    patterns = sizes.index.get_level_values(-1).to_numpy()
+    out = {"rows": sizes.groupby(level=levels, observed=True).sum()}
+    for bit, name in enumerate(names):
+        hit = (patterns >> patterns.dtype.type(bit)) & 1
+        out[name] = sizes.where(hit.astype(bool), 0).groupby(level=levels, observed=True).sum()
+    return pd.DataFrame(out).astype("int64")
+
+
+def get_rules(path: str | None = None) -> RuleSet:
+    """The rule set in the JSON file at path, or the built-in DEFAULT_RULES; read once per path."""
+    rules = _RULES.get(path)
+    if rules is None:
+        if path is None:
+            rules = RuleSet(DEFAULT_RULES)
+        else:
+            with open(path, "r", encoding="utf-8") as fh:
+                rules = RuleSet(json.load(fh), source=path)
+            logger.info("Loaded %d data-quality rules from %s", len(rules.rules), path)
+        _RULES[path] = rules
+    return rules
@@ -0,0 +1,369 @@
+"""
+DuckDB compute backend (--engine duckdb) for the health, promo and price stages.
+
+DuckDBEngine scans the input (CSV or Parquet: a file, a directory or a glob)
+straight from disk through a view that applies load_any's column mapping and
+dtypes in SQL, so the input is never materialized as a pandas frame. Other
+inputs (Excel) are loaded with load_any and the frame is scanned in place.
+Queries run on DuckDB's thread pool and spill to temp_dir when they outgrow
+memory_limit.
+
+Each stage computes in SQL the aggregates its pandas counterpart builds (health
+counters and RRP moments, the store × item × day grain, supplier price sums)
+and the results on top of them; results come back with the pandas path's
+columns, dtypes and row order. finalize_health and the grain-based builders
+(episodes, price cube and series) are shared with the pandas path.
+"""
+from __future__ import annotations
+import os
+import pandas as pd
+from .logging_utils import get_logger, timeit
+from .io_ops import ALIASES, SCHEMA, _norm_name, expand_inputs
+from .data_quality import finalize_health
+from .dq_rules import RuleSet, get_rules
+from .promotions import ATTR_COLS
+from .pricing_index import KEYS
+
+logger = get_logger(__name__)
+
+ENGINES = ("pandas", "duckdb")
+SCANS = {".parquet": "read_parquet", ".pq": "read_parquet", ".csv": "read_csv", ".txt": "read_csv"}
+SQL_OPS = {"<": "<", "<=": "<=", ">": ">", ">=": ">=", "==": "=", "!=": "<>"}
+
+_ENGINES: dict[tuple, "DuckDBEngine"] = {}
+
+
+def _ident(name: str) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _literal(text: str) -> str:
+    return "'" + str(text).replace("'", "''") + "'"
+
+
+def _not_null(cols) -> str:
+    return " AND ".join(f"{_ident(c)} IS NOT NULL" for c in cols)
+
+
+def _standard_column(std: str, sources: list[str]) -> str:
+    """SQL for one standard column from its source aliases (NULL when the input has none)."""
+    kind = SCHEMA[std]["dtype"]
+    if kind == "float":
+        # to_numeric(errors="coerce"); pandas counts NaN as missing, DuckDB does not
+        cast = [f"nullif(TRY_CAST({_ident(s)} AS DOUBLE), 'NaN'::DOUBLE)" for s in sources]
+    elif kind == "datetime":
+        cast = [f"date_trunc('day', TRY_CAST({_ident(s)} AS TIMESTAMP))" for s in sources]
+    else:
+        cast = [_ident(s) for s in sources]
+    if not cast:
+        return {"float": "NULL::DOUBLE", "datetime": "NULL::TIMESTAMP"}.get(kind, "NULL")
+    return cast[0] if len(cast) == 1 else f"coalesce({', '.join(cast)})"
+
+
+def _grouped_sum(col: str, order: str) -> str:
+    """
+    SQL for pandas' grouped sum of col (NULL for NaN). pandas sums with Kahan
+    compensation, which turns a group's sum into NaN once an infinite value
+    (a depth over RRP 0) is followed by any other value in `order`.
+    """
+    inf = f"count(*) FILTER (WHERE isinf({col}))"
+    return (f"CASE WHEN {inf} = 0 OR ({inf} = 1 AND isinf(arg_max({col}, {order}) FILTER (WHERE {col} IS NOT NULL))) "
+            f"THEN coalesce(sum({col}), 0) ELSE 'NaN'::DOUBLE END")
+
+
+def _flag_sql(rule: dict, rules: RuleSet, params: dict, args: list, columns: list[str],
+              key_cols: list[str] | None) -> str:
+    """A rule of dq_rules as a boolean SQL expression over `sales` (numbers are bound as $n into args)."""
+    def bind(value) -> str:
+        args.append(float(rules.param(value, params)))
+        return f"${len(args)}"
+    check = rule["check"]
+    if check == "missing":
+        return "(" + " OR ".join(f"{_ident(c)} IS NULL" for c in rule.get("columns") or columns) + ")"
+    if check == "duplicate":
+        return f"count(*) OVER (PARTITION BY {', '.join(map(_ident, key_cols))}) > 1"
+    col = _ident(rule["column"])
+    if check == "compare":
+        rhs = bind(rule["value"]) if "value" in rule else f"{bind(rules.factor(rule, params))} * {_ident(rule['ref'])}"
+        expr = f"coalesce({col} {SQL_OPS[rule['op']]} {rhs}, false)"
+        return f"({expr} OR {col} IS NULL)" if rule.get("null") else expr
+    f, ref = float(rules.factor(rule, params)), _ident(rule["ref"])
+    return f"coalesce({col} > {bind(f)} * {ref} OR {col} < {bind(1.0 / f)} * {ref}, false)"
+
+
+def _as_schema(df: pd.DataFrame) -> pd.DataFrame:
+    """Give result columns the dtypes load_any gives them: SCHEMA dimensions become ordered categoricals."""
+    for col in df.columns:
+        if SCHEMA.get(col, {}).get("dtype") == "category":
+            s = df[col]
+            if isinstance(s.dtype, pd.CategoricalDtype):
+                df[col] = s.cat.set_categories(s.cat.categories.sort_values(), ordered=True)
+            else:
+                df[col] = s.astype(pd.CategoricalDtype(ordered=True))
+        elif pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = df[col].astype("datetime64[ns]")
+    return df
+
+
+class DuckDBEngine:
+    """An in-process DuckDB connection over one input, exposed as the view `sales`."""
+
+    def __init__(self, source, threads: int = 0, memory_limit: str = "", temp_dir: str = "",
+                 cache_dir: str | None = None):
+        try:
+            import duckdb
+        except ImportError as exc:
+            raise ImportError("--engine duckdb needs the duckdb package (pip install duckdb, "
+                              "see requirements.txt); use --engine pandas without it") from exc
+        self.con = duckdb.connect()
+        if threads > 0:
+            self.con.execute(f"SET threads = {int(threads)}")
+        if memory_limit:
+            self.con.execute(f"SET memory_limit = {_literal(memory_limit)}")
+        if temp_dir:
+            os.makedirs(temp_dir, exist_ok=True)
+            self.con.execute(f"SET temp_directory = {_literal(temp_dir)}")
+        self._daily: dict[float, str] = {}
+        self.scanned = self._open(source, cache_dir)
+        self.columns = [r[0] for r in self.con.execute("DESCRIBE sales").fetchall()]
+        logger.info("DuckDB engine over %s (%s, %s threads)",
+                    "a loaded frame" if not self.scanned else source,
+                    "scanned from disk" if self.scanned else "in memory",
+                    self.con.execute("SELECT current_setting('threads')").fetchone()[0])
+
+    def _open(self, source, cache_dir: str | None = None) -> bool:
+        """Create the standardized view `sales`; True when it scans the files directly."""
+        if isinstance(source, pd.DataFrame):
+            self.con.register("frame", source)
+            self.con.execute("CREATE VIEW sales AS SELECT * FROM frame")
+            return False
+        files = expand_inputs(source)
+        scans = {SCANS.get(os.path.splitext(f)[1].lower()) for f in files}
+        if len(scans) != 1 or None in scans:
+            # Excel (or a mix of formats): load_any parses it, DuckDB scans the frame
+            from .io_ops import load_any
+            return self._open(load_any(source, cache_dir=cache_dir))
+        scan = f"{scans.pop()}([{', '.join(_literal(f) for f in files)}], union_by_name = true)"
+        by_norm: dict[str, list[str]] = {}
+        for (name,) in self.con.execute(f"SELECT column_name FROM (DESCRIBE SELECT * FROM {scan})").fetchall():
+            by_norm.setdefault(_norm_name(name), []).append(name)
+        cols = {std: _standard_column(std, [s for c in cands for s in by_norm.get(c, [])])
+                for std, cands in ALIASES.items()}
+        select = ", ".join(f"{expr} AS {_ident(std)}" for std, expr in cols.items())
+        self.con.execute(
+            f"CREATE VIEW sales AS SELECT *, CASE WHEN Quantity > 0 THEN Total_Sales / Quantity END "
+            f"AS realised_unit_price FROM (SELECT {select} FROM {scan})")
+        return True
+
+    def frame(self, query: str, params: list | None = None, categories: bool = True) -> pd.DataFrame:
+        """Run query and fetch it through Arrow; SCHEMA dimensions arrive as categoricals unless categories=False."""
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        table = self.con.execute(query, params or []).to_arrow_table()
+        for i, name in enumerate(table.column_names):
+            kind = table.schema.field(i).type
+            if categories and SCHEMA.get(name, {}).get("dtype") == "category" and pa.types.is_string(kind):
+                # one Python string per distinct value instead of one per row
+                table = table.set_column(i, name, pc.dictionary_encode(table.column(i)))
+            elif pa.types.is_dictionary(kind) and pa.types.is_unsigned_integer(kind.index_type):
+                # ENUMs (categoricals of a scanned frame) use unsigned indices, which to_pandas rejects
+                table = table.set_column(i, name, table.column(i).cast(pa.dictionary(pa.int32(), kind.value_type)))
+            elif pa.types.is_decimal(kind):
+                # integer sums come back as DECIMAL/HUGEINT; pandas would hold Decimal objects
+                table = table.set_column(i, name, pc.cast(table.column(i), pa.float64()))
+        return table.to_pandas()
+
+    # -- data health ---------------------------------------------------------
+
+    def health_partials(self, extreme_price_factor: float = 10.0, rules: RuleSet | None = None):
+        """
+        Health counters per store and per supplier (one GROUPING SETS pass over
+        the rules of the rule set compiled to SQL) and RRP moments per group ×
+        Item_Code: {group column: (counts, rrp)} as partial_health returns them.
+        """
+        rules = rules or get_rules()
+        key = None
+        if rules.duplicate is not None:
+            keys, fallback = rules.duplicate["keys"], rules.duplicate.get("fallback")
+            keyed = self.con.execute(f"SELECT bool_or(NOT ({_not_null(keys)})) FROM sales").fetchone()[0]
+            key = fallback if keyed and fallback else keys
+        args: list = []
+        params = {"extreme_price_factor": extreme_price_factor}
+        flags = ", ".join(f"{_flag_sql(rule, rules, params, args, self.columns, key)} AS {_ident(rule['name'])}"
+                          for rule in rules.rules)
+        sums = ", ".join(f"sum({_ident(flag)}::BIGINT) AS {_ident(flag)}" for flag in rules.flags)
+        counts = self.frame(
+            f"SELECT grouping(Store_Name) AS by_supplier, Store_Name, Supplier, count(*) AS rows, {sums} "
+            f"FROM (SELECT Store_Name, Supplier, {flags} FROM sales) "
+            "GROUP BY GROUPING SETS ((Store_Name), (Supplier))",
+            args, categories=False)
+        moments = self.frame(
+            "SELECT grouping(Store_Name) AS by_supplier, Store_Name, Supplier, Item_Code, count(RRP) AS n, "
+            "avg(RRP) AS mean, var_samp(RRP) AS var FROM sales WHERE Item_Code IS NOT NULL "
+            "GROUP BY GROUPING SETS ((Store_Name, Item_Code), (Supplier, Item_Code))", categories=False)
+        out = {}
+        for side, col in ((0, "Store_Name"), (1, "Supplier")):
+            c = counts[(counts["by_supplier"] == side) & counts[col].notna()]
+            r = moments[(moments["by_supplier"] == side) & moments[col].notna()]
+            out[col] = (c[[col, "rows", *rules.flags]].sort_values(col).reset_index(drop=True),
+                        r[[col, "Item_Code", "n", "mean", "var"]].sort_values([col, "Item_Code"]).reset_index(drop=True))
+        return out
+
+    @timeit(logger, "duckdb_score_health")
+    def score_health(self, extreme_price_factor: float = 10.0, rules: RuleSet | None = None):
+        """data_quality.score_health: (per-store, per-supplier) summaries."""
+        rules = rules or get_rules()
+        partials = self.health_partials(extreme_price_factor, rules)
+        store, supplier = (_as_schema(finalize_health(*partials[c], [c], rules)) for c in ("Store_Name", "Supplier"))
+        logger.info("Health summaries — stores: %d, suppliers: %d", len(store), len(supplier))
+        return store, supplier
+
+    # -- promotions ----------------------------------------------------------
+
+    def daily_table(self, discount_threshold: float = 0.10) -> str:
+        """
+        Build promotions.daily_grain, without its item attributes, as a DuckDB
+        temp table (once per threshold) and return its name.
+        """
+        name = self._daily.get(discount_threshold)
+        if name is not None:
+            return name
+        name = self._daily[discount_threshold] = f"daily_{len(self._daily)}"
+        self.con.execute(
+            f"CREATE TEMP TABLE {name} AS "
+            "SELECT Store_Name, Item_Code, Date_Of_Sale, "
+            "coalesce(sum(Quantity), 0) AS units, "
+            "coalesce(sum(price), 0) AS price_sum, count(price) AS price_n, "
+            "coalesce(sum(rrp), 0) AS rrp_sum, count(rrp) AS rrp_n, "
+            f"{_grouped_sum('depth', '_row')} AS depth_sum, count(depth) AS depth_n, "
+            "coalesce(bool_or(price <= $1 * rrp), false) AS promo "
+            "FROM (SELECT *, row_number() OVER () AS _row, realised_unit_price AS price, RRP AS rrp, "
+            "nullif((RRP - realised_unit_price) / RRP, 'NaN'::DOUBLE) AS depth FROM sales) "
+            "WHERE Store_Name IS NOT NULL AND Item_Code IS NOT NULL AND Date_Of_Sale IS NOT NULL "
+            "GROUP BY Store_Name, Item_Code, Date_Of_Sale",
+            [1 - discount_threshold])
+        return name
+
+    @timeit(logger, "duckdb_daily_grain")
+    def daily_grain(self, discount_threshold: float = 0.10) -> pd.DataFrame:
+        """promotions.daily_grain as a pandas frame, without the item attributes (for episodes_from_daily)."""
+        return _as_schema(self.frame(f"SELECT * FROM {self.daily_table(discount_threshold)} "
+                                     "ORDER BY Store_Name, Item_Code, Date_Of_Sale"))
+
+    @timeit(logger, "duckdb_detect_promotions")
+    def detect_promotions(self, discount_threshold: float = 0.10, promo_min_days: int = 2,
+                          consecutive: bool = False) -> pd.DataFrame:
+        """promotions.detect_promotions: the SKU/store promo summary (summarize_daily in SQL)."""
+        daily = self.daily_table(discount_threshold)
+        attrs = [c for c in ATTR_COLS if c in self.columns]
+        # _first_attrs per day, then per SKU by date: the first non-null value by date, then input order
+        first = ", ".join(f"arg_min({_ident(c)}, (Date_Of_Sale, _row)) FILTER (WHERE {_ident(c)} IS NOT NULL) "
+                          f"AS {_ident(c)}" for c in attrs)
+        if consecutive:
+            # longest run of promo days on consecutive dates (gaps-and-islands)
+            on_promo = "coalesce(r.longest, 0) >= $1"
+            runs = (
+                "LEFT JOIN (SELECT Store_Name, Item_Code, max(n) AS longest FROM ("
+                "SELECT Store_Name, Item_Code, count(*) AS n FROM ("
+                "SELECT Store_Name, Item_Code, date_diff('day', DATE '1970-01-01', Date_Of_Sale::DATE) "
+                "- row_number() OVER (PARTITION BY Store_Name, Item_Code ORDER BY Date_Of_Sale) AS island "
+                f"FROM {daily} WHERE promo) GROUP BY Store_Name, Item_Code, island) "
+                "GROUP BY Store_Name, Item_Code) r USING (Store_Name, Item_Code)"
+            )
+        else:
+            on_promo, runs = "s.promo_days >= $1", ""
+        mean = "CASE WHEN {n} > 0 THEN {total} / {n} END"
+        nan_null = "nullif({}, 'NaN'::DOUBLE)"
+        depth = nan_null.format(mean.format(total="depth_sum", n="depth_n"))
+        summary = self.frame(
+            f"WITH days AS (SELECT *, {mean.format(total='price_sum', n='price_n')} AS price FROM {daily}), "
+            "sku AS (SELECT s.*, " + on_promo + " AS on_promo FROM ("
+            "SELECT Store_Name, Item_Code, "
+            "count(*) FILTER (WHERE promo) AS promo_days, count(*) FILTER (WHERE NOT promo) AS base_days, "
+            "coalesce(sum(units) FILTER (WHERE promo), 0) AS promo_total, "
+            "coalesce(sum(units) FILTER (WHERE NOT promo), 0) AS base_total "
+            f"FROM days GROUP BY Store_Name, Item_Code) s {runs}), "
+            f"attrs AS (SELECT Store_Name, Item_Code, {first} FROM (SELECT *, row_number() OVER () AS _row FROM sales) "
+            "WHERE Store_Name IS NOT NULL AND Item_Code IS NOT NULL AND Date_Of_Sale IS NOT NULL "
+            "GROUP BY Store_Name, Item_Code), "
+            "stats AS (SELECT d.Item_Code, k.on_promo, sum(price_sum) AS price_sum, sum(price_n) AS price_n, "
+            "sum(rrp_sum) AS rrp_sum, sum(rrp_n) AS rrp_n, sum(depth_n) AS depth_n, "
+            f"{_grouped_sum(nan_null.format('depth_sum'), '(Store_Name, Item_Code, Date_Of_Sale)')} AS depth_sum, "
+            "sum(units) AS units FROM days d JOIN sku k USING (Store_Name, Item_Code) GROUP BY ALL), "
+            "item AS (SELECT Item_Code, "
+            f"avg({mean.format(total='price_sum', n='price_n')}) AS avg_price_all, "
+            f"avg({mean.format(total='rrp_sum', n='rrp_n')}) AS avg_rrp_all, "
+            f"{_grouped_sum(depth, 'on_promo')} / nullif(count({depth}), 0) AS avg_discount_depth_all, "
+            "sum(units) AS units_all FROM stats GROUP BY Item_Code), "
+            "coverage AS (SELECT Item_Code, avg(on_promo::DOUBLE) AS promo_coverage_sku FROM sku GROUP BY Item_Code), "
+            "prices AS (SELECT Item_Code, avg(price) FILTER (WHERE NOT promo) AS baseline_avg_price, "
+            "avg(price) FILTER (WHERE promo) AS promo_avg_price FROM days GROUP BY Item_Code), "
+            "uplift AS (SELECT *, "
+            "CASE WHEN base_days > 0 THEN base_total / base_days ELSE 0.0 END AS baseline_units, "
+            "CASE WHEN promo_days > 0 THEN promo_total / promo_days ELSE 0.0 END AS promo_units FROM sku) "
+            "SELECT Store_Name, Item_Code, baseline_units, promo_units, "
+            "promo_days AS promo_days_count, base_days AS baseline_days_count, "
+            "CASE WHEN base_days >= 2 AND promo_days >= 2 AND baseline_units > 0 AND promo_units <> 0 "
+            "THEN (promo_units - baseline_units) / baseline_units END AS promo_uplift_pct, "
+            + "".join(f"{_ident(c)}, " for c in attrs)
+            + "promo_coverage_sku, avg_price_all, avg_rrp_all, avg_discount_depth_all, units_all, "
+            "baseline_avg_price, promo_avg_price, on_promo "
+            "FROM uplift LEFT JOIN attrs USING (Store_Name, Item_Code) LEFT JOIN coverage USING (Item_Code) LEFT JOIN item USING (Item_Code) "
+            "LEFT JOIN prices USING (Item_Code) ORDER BY Store_Name, Item_Code",
+            [promo_min_days])
+        logger.info("SKUs on_promo across stores: %d", int(summary.pop("on_promo").sum()))
+        logger.info("Promotion summary rows: %d", len(summary))
+        return _as_schema(summary)
+
+    # -- price index ---------------------------------------------------------
+
+    @timeit(logger, "duckdb_supplier_grain")
+    def supplier_grain(self, extra_keys: list[str] | None = None) -> pd.DataFrame:
+        """pricing_index.supplier_grain (for price_cube and price_series)."""
+        keys = ", ".join(map(_ident, KEYS + ["Supplier"] + (extra_keys or [])))
+        return _as_schema(self.frame(
+            f"SELECT {keys}, coalesce(sum(realised_unit_price), 0) AS price_sum, "
+            f"count(realised_unit_price) AS price_n, coalesce(sum(Quantity), 0) AS units FROM sales "
+            f"WHERE {_not_null(KEYS + ['Supplier'] + (extra_keys or []))} GROUP BY {keys} ORDER BY {keys}"))
+
+    @timeit(logger, "duckdb_compute_price_index")
+    def compute_price_index(self):
+        """pricing_index.compute_price_index: (price index per KEYS, one-row roll-up)."""
+        keys = ", ".join(map(_ident, KEYS))
+        side = (
+            "SELECT {keys}, CASE WHEN sum(units) > 0 AND NOT bool_or(avg_price IS NULL) "
+            "THEN sum(avg_price * units) / sum(units) END AS {p}_avg_price, sum(units) AS {p}_units "
+            "FROM suppliers WHERE {cond} GROUP BY {keys}"
+        )
+        self.con.execute(
+            "CREATE OR REPLACE TEMP TABLE price_index AS "
+            f"WITH suppliers AS (SELECT {keys}, CASE WHEN price_n > 0 THEN price_sum / price_n END AS avg_price, "
+            "units, contains(lower(Supplier::VARCHAR), 'bidco') AS bidco FROM ("
+            f"SELECT {keys}, Supplier, coalesce(sum(realised_unit_price), 0) AS price_sum, "
+            "count(realised_unit_price) AS price_n, coalesce(sum(Quantity), 0) AS units FROM sales "
+            f"WHERE {_not_null(KEYS + ['Supplier'])} GROUP BY {keys}, Supplier)) "
+            f"SELECT {keys}, bidco_avg_price, bidco_units, peer_avg_price, peer_units, "
+            "bidco_avg_price / peer_avg_price AS price_index "
+            f"FROM ({side.format(keys=keys, p='bidco', cond='bidco')}) "
+            f"FULL OUTER JOIN ({side.format(keys=keys, p='peer', cond='NOT bidco')}) USING ({keys}) "
+            f"ORDER BY bidco_units IS NULL, {keys}")  # the pandas outer merge: Bidco groups, then peer-only ones
+        idx = _as_schema(self.frame("SELECT * FROM price_index"))
+        logger.info("Computed price index rows: %d", len(idx))
+        wavg = ("sum({p}_avg_price * {p}_units) FILTER (WHERE {p}_avg_price IS NOT NULL AND {p}_units IS NOT NULL) "
+                "/ sum({p}_units) FILTER (WHERE {p}_avg_price IS NOT NULL AND {p}_units IS NOT NULL)")
+        rollup = self.frame(
+            f"SELECT *, bidco_avg_price_rollup / peer_avg_price_rollup AS price_index_rollup FROM ("
+            f"SELECT {wavg.format(p='bidco')} AS bidco_avg_price_rollup, "
+            f"{wavg.format(p='peer')} AS peer_avg_price_rollup FROM price_index)")
+        logger.info("Roll-up price index: %s", rollup["price_index_rollup"].iloc[0])
+        return idx, rollup
+
+
+def get_engine(source: str, threads: int = 0, memory_limit: str = "", temp_dir: str = "",
+               cache_dir: str | None = None) -> DuckDBEngine:
+    """The process's engine over source with these settings, opened on first use (stages share it)."""
+    key = (source, threads, memory_limit, temp_dir, cache_dir)
+    engine = _ENGINES.get(key)
+    if engine is None:
+        engine = _ENGINES[key] = DuckDBEngine(source, threads, memory_limit, temp_dir, cache_dir)
+    return engine
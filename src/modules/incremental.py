@@ -0,0 +1,213 @@
+"""
+Incremental daily ingestion backed by a local state store of per-date aggregates.
+
+Each ingested batch is reduced to per-store, per-date partials (store × item ×
+day promo grain, supplier price grain by day, health counters and RRP moments by
+group, store and day) and written into --state_dir, replacing whatever the store
+held for the (store, date) pairs in the batch. A batch is therefore
+authoritative for every store-day it contains: re-sending a store's day with
+corrections replaces that store's day and leaves other stores' rows for the date
+alone. Outputs are then rebuilt from the state, never from the raw history.
+
+The duplicate rule's key (its keys, or the fallback when key columns have
+nulls) is chosen from the first batch and kept in the manifest, so every batch
+counts duplicates on the same key, as a one-shot run does for the whole input.
+
+Every ingest reloads and rewrites the state tables whole; they hold aggregates
+(one row per store × item × day at most), so this stays small next to the raw
+history.
+"""
+from __future__ import annotations
+import os
+import json
+import pandas as pd
+from .logging_utils import get_logger, timeit
+from .io_ops import SCHEMA
+from .data_quality import dup_key_cols, flag_rows, partial_health, merge_health, finalize_health
+from .dq_rules import RuleSet, get_rules
+from .promotions import DAY_KEYS, daily_grain, summarize_daily, episodes_from_daily
+from .pricing_index import supplier_grain, index_from_grain, price_cube, price_series
+
+logger = get_logger(__name__)
+
+STATE_VERSION = 3  # 2: supplier health partials are kept per store; 3: the duplicate key is stored
+DATE = "Date_Of_Sale"
+STORE = "Store_Name"
+BATCH_KEY = [STORE, DATE]  # a batch replaces the state's rows for the (store, date) pairs it holds
+TABLES = ["promo_daily", "price_grain", "health_store", "health_store_rrp",
+          "health_supplier", "health_supplier_rrp"]
+SERIES = "price_index_series"  # kept as an output table, appended from the earliest batch date
+
+
+def _recategorize(df: pd.DataFrame) -> pd.DataFrame:
+    """Restore ordered categoricals for schema dimensions after concatenating batches."""
+    for col in df.columns:
+        if col in SCHEMA and SCHEMA[col]["dtype"] == "category":
+            df[col] = df[col].astype(pd.CategoricalDtype(ordered=True))
+    return df
+
+
+def batch_partials(df: pd.DataFrame, discount_threshold: float, extreme_price_factor: float,
+                   rules: RuleSet | None = None, key_cols: list[str] | None = None) -> dict[str, pd.DataFrame]:
+    """Per-store, per-date mergeable aggregates of one batch (duplicates by key_cols), keyed like the state tables."""
+    rules = rules or get_rules()
+    flags = flag_rows(df, extreme_price_factor, key_cols or dup_key_cols(df, rules), rules=rules)
+    store, store_rrp = partial_health(df, BATCH_KEY, flags=flags, rules=rules)
+    supplier, supplier_rrp = partial_health(df, ["Supplier"] + BATCH_KEY, flags=flags, rules=rules)
+    return {
+        "promo_daily": daily_grain(df, discount_threshold),
+        "price_grain": supplier_grain(df, [DATE]),
+        "health_store": store, "health_store_rrp": store_rrp,
+        "health_supplier": supplier, "health_supplier_rrp": supplier_rrp,
+    }
+
+
+class StateStore:
+    """Parquet tables plus a JSON manifest (parameters and ingested dates) in one directory."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.meta_path = os.path.join(path, "state.json")
+
+    def _table_path(self, name: str) -> str:
+        return os.path.join(self.path, f"{name}.parquet")
+
+    def load_meta(self) -> dict | None:
+        if not os.path.exists(self.meta_path):
+            return None
+        with open(self.meta_path, "r", encoding="utf-8") as fh:
+            return json.load(fh)
+
+    def load(self, name: str) -> pd.DataFrame | None:
+        path = self._table_path(name)
+        return pd.read_parquet(path) if os.path.exists(path) else None
+
+    def save(self, tables: dict[str, pd.DataFrame], meta: dict) -> None:
+        """Write every table and then the manifest, each via temp file + rename."""
+        os.makedirs(self.path, exist_ok=True)
+        for name, df in tables.items():
+            tmp = self._table_path(name) + ".tmp"
+            df.to_parquet(tmp, index=False)
+            os.replace(tmp, self._table_path(name))
+        with open(self.meta_path + ".tmp", "w", encoding="utf-8") as fh:
+            json.dump(meta, fh, indent=2)
+        os.replace(self.meta_path + ".tmp", self.meta_path)
+
+
+def _drop_keys(prev: pd.DataFrame, keys: pd.DataFrame) -> pd.DataFrame:
+    """Rows of a state table whose (store, date) pair is not in keys."""
+    replaced = pd.MultiIndex.from_frame(prev[BATCH_KEY].astype({STORE: object})).isin(
+        pd.MultiIndex.from_frame(keys.astype({STORE: object})))
+    return prev[~replaced]
+
+
+def _check_params(meta: dict, params: dict) -> None:
+    if meta.get("version") != STATE_VERSION:
+        raise ValueError(
+            f"State has layout version {meta.get('version')}, this code writes {STATE_VERSION}; "
+            "rerun with --reset_state to rebuild it from the full history"
+        )
+    changed = {k: (meta["params"].get(k), v) for k, v in params.items() if meta["params"].get(k) != v}
+    if changed:
+        raise ValueError(
+            f"State was built with different parameters {changed} (stored, requested); "
+            "rerun with --reset_state to rebuild it from the full history"
+        )
+
+
+@timeit(logger, "ingest_batch")
+def ingest(df: pd.DataFrame, state_dir: str, discount_threshold: float = 0.10,
+           extreme_price_factor: float = 10.0, reset: bool = False,
+           rules: RuleSet | None = None) -> dict[str, pd.DataFrame]:
+    """
+    Fold a batch into the state store and return the merged state tables.
+
+    Store-days already in the store are replaced by the batch's rows for them
+    (late corrections); new ones are appended, so a batch holding one store's
+    day leaves the other stores' rows for that day in place. Rows without a
+    sale date or a store cannot be placed in a store-day and are left out of
+    the state. The health counters are kept per rule, so a state built with
+    other --dq_rules must be reset.
+    """
+    store = StateStore(state_dir)
+    rules = rules or get_rules()
+    params = {"discount_threshold": discount_threshold, "extreme_price_factor": extreme_price_factor,
+              "dq_rules": None if rules.is_default else rules.config}
+    meta = None if reset else store.load_meta()
+    if meta is not None:
+        _check_params(meta, params)
+    done = set(meta["dates"]) if meta else set()
+
+    unkeyed = df[BATCH_KEY].isna().any(axis=1)
+    if unkeyed.any():
+        logger.warning("Skipping %d rows without %s or %s (they cannot be assigned to a store-day)",
+                       int(unkeyed.sum()), STORE, DATE)
+        df = df[~unkeyed]
+    dates = pd.DatetimeIndex(df[DATE].unique()).sort_values()
+    batch_days = {d.date().isoformat() for d in dates}
+    keys = df[BATCH_KEY].drop_duplicates()
+    prev_keys = None if meta is None else store.load("health_store")
+    late = 0 if prev_keys is None else len(keys) - len(_drop_keys(keys, prev_keys[BATCH_KEY]))
+    logger.info("Ingesting %d rows over %d dates and %d store-days (%d new, %d already ingested and replaced)",
+                len(df), len(batch_days), len(keys), len(keys) - late, late)
+
+    batch_key = dup_key_cols(df, rules)
+    key_cols = meta.get("dup_key") if meta else None
+    if key_cols is None:
+        key_cols = batch_key
+    elif batch_key != key_cols:
+        logger.warning("Batch alone would count duplicates by %s; keeping the state's key %s "
+                       "(rerun with --reset_state over the full history to switch)", batch_key, key_cols)
+    partials = batch_partials(df, discount_threshold, extreme_price_factor, rules, key_cols)
+    tables, last_day = {}, None
+    for name in TABLES:
+        prev = None if meta is None else store.load(name)
+        if prev is not None:
+            if name == "price_grain" and len(prev):
+                last_day = prev[DATE].max()
+            prev = _drop_keys(prev, keys)
+        merged = pd.concat([t for t in (prev, partials[name]) if t is not None], ignore_index=True)
+        tables[name] = _recategorize(merged)
+
+    # only windows ending on or after the earliest batch date can change, and windows ending
+    # after the state's last day were cut off there (so days without sales since then are new too)
+    since = dates.min() if len(dates) else None
+    if since is not None and last_day is not None:
+        since = min(since, last_day + pd.Timedelta(days=1))
+    prev = None if meta is None else store.load(SERIES)
+    if prev is not None and since is not None:
+        prev = prev[prev["date"] < since]
+    fresh = price_series(tables["price_grain"], since=since) if since is not None else None
+    kept = [t for t in (prev, fresh) if t is not None]
+    if kept:
+        tables[SERIES] = pd.concat(kept, ignore_index=True)
+
+    meta = {"version": STATE_VERSION, "params": params, "dup_key": key_cols, "dates": sorted(done | batch_days)}
+    store.save(tables, meta)
+    logger.info("State at %s now covers %d dates", state_dir, len(meta["dates"]))
+    return tables
+
+
+def _health_from_state(counts: pd.DataFrame, rrp: pd.DataFrame, group: str, rules: RuleSet | None) -> pd.DataFrame:
+    keys = [c for c in BATCH_KEY if c != group]
+    merged = merge_health([(counts.drop(columns=keys), rrp.drop(columns=keys))], [group])
+    return finalize_health(*merged, [group], rules)
+
+
+def outputs_from_state(tables: dict[str, pd.DataFrame], promo_min_days: int = 2, consecutive: bool = False,
+                       window_days: int = 7, rules: RuleSet | None = None) -> dict[str, pd.DataFrame]:
+    """Rebuild the data-quality, promotions and pricing outputs from merged state tables."""
+    daily = tables["promo_daily"].sort_values(DAY_KEYS, ignore_index=True)
+    price_idx, rollup = index_from_grain(tables["price_grain"])
+    return {
+        "data_quality_store": _health_from_state(tables["health_store"], tables["health_store_rrp"],
+                                                 "Store_Name", rules),
+        "data_quality_supplier": _health_from_state(tables["health_supplier"], tables["health_supplier_rrp"],
+                                                    "Supplier", rules),
+        "promo_summary": summarize_daily(daily, promo_min_days, consecutive),
+        "promo_episodes": episodes_from_daily(daily, window_days),
+        "price_index": price_idx,
+        "price_index_rollup": rollup,
+        "price_index_cube": price_cube(tables["price_grain"]),
+        "price_index_series": tables[SERIES] if SERIES in tables else price_series(tables["price_grain"]),
+    }
@@ -1,63 +1,429 @@
 """I/O helpers for loading data and writing outputs."""
 from __future__ import annotations
 import os
+import glob
+import json
+import time
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import numpy as np
+from .logging_utils import get_logger
 
-ALIASES = {
-    "Store_Name": ["Store", "StoreName", "Store_Name"],
-    "Item_Code": ["Item_Code", "ItemCode", "SKU", "Sku_Code"],
-    "Item_Barcode": ["Item_Barcode", "Barcode", "ItemBarcode"],
-    "Description": ["Description", "Item_Description", "ItemDesc"],
-    "Category": ["Category"],
-    "Department": ["Department"],
-    "Sub_Department": ["Sub_Department", "SubDepartment", "Sub_Dept"],
-    "Section": ["Section", "Segment"],
-    "Quantity": ["Quantity", "Qty", "Units"],
-    "Total_Sales": ["Total_Sales", "Sales_Value", "Sales"],
-    "RRP": ["RRP", "Price_RRP"],
-    "Supplier": ["Supplier", "Vendor", "Manufacturer"],
-    "Date_Of_Sale": ["Date_Of_Sale", "Sale_Date", "Transaction_Date", "Date"],
+logger = get_logger(__name__)
+
+# Standard schema: accepted source aliases and the compact dtype each column is
+# loaded as. Dimensions become categoricals, dates stay datetime64 and integer
+# codes are downcast. Measures stay float64: float32 would change groupby sums.
+SCHEMA = {
+    "Store_Name": {"aliases": ["Store", "StoreName", "Store_Name"], "dtype": "category"},
+    "Item_Code": {"aliases": ["Item_Code", "ItemCode", "SKU", "Sku_Code"], "dtype": "category"},
+    "Item_Barcode": {"aliases": ["Item_Barcode", "Barcode", "ItemBarcode"], "dtype": "integer"},
+    "Description": {"aliases": ["Description", "Item_Description", "ItemDesc"], "dtype": "category"},
+    "Category": {"aliases": ["Category"], "dtype": "category"},
+    "Department": {"aliases": ["Department"], "dtype": "category"},
+    "Sub_Department": {"aliases": ["Sub_Department", "SubDepartment", "Sub_Dept"], "dtype": "category"},
+    "Section": {"aliases": ["Section", "Segment"], "dtype": "category"},
+    "Quantity": {"aliases": ["Quantity", "Qty", "Units"], "dtype": "float"},
+    "Total_Sales": {"aliases": ["Total_Sales", "Sales_Value", "Sales"], "dtype": "float"},
+    "RRP": {"aliases": ["RRP", "Price_RRP"], "dtype": "float"},
+    "Supplier": {"aliases": ["Supplier", "Vendor", "Manufacturer"], "dtype": "category"},
+    "Date_Of_Sale": {"aliases": ["Date_Of_Sale", "Sale_Date", "Transaction_Date", "Date"], "dtype": "datetime"},
 }
+ALIASES = {std: spec["aliases"] for std, spec in SCHEMA.items()}
+
+# Bump when the standardized frame produced by load_any changes shape or dtypes,
+# so stale cache entries are rebuilt instead of being served.
+CACHE_VERSION = 2
+
+EXCEL = (".xlsx", ".xls")
+SUPPORTED = EXCEL + (".csv", ".txt", ".parquet", ".pq")
+
 
+def _norm_name(col) -> str:
+    return str(col).strip().replace(" ", "_").replace("-", "_")
 
-def _map_columns(df: pd.DataFrame) -> pd.DataFrame:
-    """Map aliases to a standard schema."""
-    df.columns = [c.strip().replace(" ", "_").replace("-", "_")
-                  for c in df.columns]
+
+def _map_columns(df: pd.DataFrame, columns: list[str] | None = None) -> pd.DataFrame:
+    """Map aliases to a standard schema (optionally only the given standard columns)."""
+    df.columns = [_norm_name(c) for c in df.columns]
     out = {}
     for std, cands in ALIASES.items():
+        if columns is not None and std not in columns:
+            continue
         chosen = next((c for c in cands if c in df.columns), None)
         out[std] = df[chosen] if chosen else np.nan
-    return pd.DataFrame(out)
+    return pd.DataFrame(out, index=df.index)
+
+
+def _needed_columns(columns: list[str] | None) -> list[str] | None:
+    """Standard columns to parse for a projection (realised price needs its inputs)."""
+    if columns is None:
+        return None
+    need = [c for c in ALIASES if c in columns]
+    if "realised_unit_price" in columns:
+        need += [c for c in ("Quantity", "Total_Sales") if c not in need]
+    return need
+
 
+def _mem_mb(df: pd.DataFrame) -> float:
+    return df.memory_usage(deep=True).sum() / 1e6
 
-def load_any(path: str) -> pd.DataFrame:
-    """Load Excel/CSV/Parquet and standardize columns and dtypes."""
+
+def _apply_schema(df: pd.DataFrame, log: bool = True) -> pd.DataFrame:
+    """Coerce standard columns to their SCHEMA dtypes and derive realised_unit_price."""
+    before = _mem_mb(df)
+    for col in df.columns:
+        kind = SCHEMA[col]["dtype"]
+        if kind == "float":
+            df[col] = pd.to_numeric(df[col], errors="coerce")
+        elif kind == "datetime":
+            df[col] = pd.to_datetime(df[col], errors="coerce").dt.normalize()
+        elif kind == "category":
+            # ordered: pandas only sorts observed=True groupby keys for ordered categoricals
+            df[col] = df[col].astype(pd.CategoricalDtype(ordered=True))
+        elif kind == "integer" and pd.api.types.is_integer_dtype(df[col]):
+            df[col] = pd.to_numeric(df[col], downcast="integer")
+    if "Quantity" in df.columns and "Total_Sales" in df.columns:
+        df["realised_unit_price"] = np.where(
+            df["Quantity"] > 0, df["Total_Sales"]/df["Quantity"], np.nan)
+    if log:
+        logger.info("Frame memory: %.2f MB as parsed -> %.2f MB with schema dtypes",
+                    before, _mem_mb(df))
+    return df
+
+
+def _usecols(need: list[str] | None):
+    if need is None:
+        return None
+    wanted = {a for std in need for a in ALIASES[std]}
+    return lambda c: _norm_name(c) in wanted
+
+
+def _read_source(path: str, columns: list[str] | None = None, sheet=0) -> pd.DataFrame:
+    """Parse Excel (one sheet)/CSV/Parquet, reading only the source columns a projection needs."""
+    need = _needed_columns(columns)
+    usecols = _usecols(need)
     ext = os.path.splitext(path)[1].lower()
     if ext in [".xlsx", ".xls"]:
-        raw = pd.read_excel(path)
+        raw = pd.read_excel(path, sheet_name=sheet, usecols=usecols)
     elif ext in [".csv", ".txt"]:
-        raw = pd.read_csv(path)
+        raw = pd.read_csv(path, usecols=usecols)
+    elif ext in [".parquet", ".pq"]:
+        if usecols is not None:
+            import pyarrow.parquet as pq
+            names = [c for c in pq.read_schema(path).names if usecols(c)]
+            raw = pd.read_parquet(path, columns=names)
+        else:
+            raw = pd.read_parquet(path)
+    else:
+        raise ValueError(f"Unsupported file type: {ext}")
+    return _apply_schema(_map_columns(raw, need))
+
+
+def expand_inputs(path: str) -> list[str]:
+    """Input files named by path: the file itself, or a directory's or glob's supported files (sorted)."""
+    if os.path.isdir(path):
+        files = [os.path.join(path, f) for f in os.listdir(path)]
+    elif any(ch in path for ch in "*?["):
+        files = glob.glob(path, recursive=True)
+    else:
+        return [path]
+    files = sorted(
+        f for f in files
+        if os.path.isfile(f) and os.path.splitext(f)[1].lower() in SUPPORTED
+        and not os.path.basename(f).startswith(("~$", "."))  # Excel lock files, hidden files
+    )
+    if not files:
+        raise FileNotFoundError(f"No supported input files ({', '.join(SUPPORTED)}) match {path}")
+    return files
+
+
+def input_sources(path: str) -> list[tuple[str, object]]:
+    """(file, sheet) pairs to load for path; every sheet of a multi-sheet workbook is its own source."""
+    sources = []
+    for f in expand_inputs(path):
+        sheets = [0]
+        if os.path.splitext(f)[1].lower() in EXCEL:
+            try:
+                with pd.ExcelFile(f) as book:
+                    if len(book.sheet_names) > 1:
+                        sheets = list(book.sheet_names)
+            except Exception:  # unreadable workbook: its load reports the error
+                pass
+        sources += [(f, sheet) for sheet in sheets]
+    return sources
+
+
+def _label(path: str, sheet) -> str:
+    return path if sheet == 0 else f"{path}[{sheet}]"
+
+
+def iter_source(path: str, chunk_rows: int, columns: list[str] | None = None):
+    """
+    Yield the standardized input in frames of at most chunk_rows rows.
+
+    CSV is parsed with a chunked reader and Parquet by record batch, so only one
+    chunk is in memory at a time. Excel has no streaming reader; it is loaded
+    whole and sliced. Chunks carry their own categories, so dimension codes are
+    not comparable across chunks (compare values). A directory, glob or
+    multi-sheet workbook is read source by source in input_sources order.
+    """
+    for src, sheet in input_sources(path):
+        yield from _iter_file(src, chunk_rows, columns, sheet)
+
+
+def _iter_file(path: str, chunk_rows: int, columns: list[str] | None, sheet=0):
+    need = _needed_columns(columns)
+    usecols = _usecols(need)
+    ext = os.path.splitext(path)[1].lower()
+    if ext in [".csv", ".txt"]:
+        raws = pd.read_csv(path, usecols=usecols, chunksize=chunk_rows)
     elif ext in [".parquet", ".pq"]:
-        raw = pd.read_parquet(path)
+        import pyarrow.parquet as pq
+        pf = pq.ParquetFile(path)
+        names = [c for c in pf.schema_arrow.names if usecols is None or usecols(c)]
+        raws = (b.to_pandas() for b in pf.iter_batches(batch_size=chunk_rows, columns=names))
+    elif ext in [".xlsx", ".xls"]:
+        logger.warning("Excel input cannot be streamed; reading %s whole and slicing it", _label(path, sheet))
+        raw = pd.read_excel(path, sheet_name=sheet, usecols=usecols)
+        raws = (raw.iloc[i:i + chunk_rows] for i in range(0, len(raw), chunk_rows))
     else:
         raise ValueError(f"Unsupported file type: {ext}")
-    df = _map_columns(raw)
-    df["Quantity"] = pd.to_numeric(df["Quantity"], errors="coerce")
-    df["Total_Sales"] = pd.to_numeric(df["Total_Sales"], errors="coerce")
-    df["RRP"] = pd.to_numeric(df["RRP"], errors="coerce")
-    df["Date_Of_Sale"] = pd.to_datetime(
-        df["Date_Of_Sale"], errors="coerce").dt.date
-    df["realised_unit_price"] = np.where(
-        df["Quantity"] > 0, df["Total_Sales"]/df["Quantity"], np.nan)
+    for raw in raws:
+        yield _project(_apply_schema(_map_columns(raw, need), log=False), columns)
+
+
+def _project(df: pd.DataFrame, columns: list[str] | None) -> pd.DataFrame:
+    if columns is None:
+        return df
+    return df[[c for c in df.columns if c in columns]]
+
+
+def _source_key(path: str, sheet=0) -> dict:
+    """Identify a source file (and sheet) by path, size, mtime and content hash."""
+    st = os.stat(path)
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(block)
+    key = {
+        "version": CACHE_VERSION,
+        "path": os.path.abspath(path),
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "sha256": digest.hexdigest(),
+    }
+    if sheet != 0:
+        key["sheet"] = sheet
+    return key
+
+
+def _cache_paths(path: str, cache_dir: str, sheet=0) -> tuple[str, str]:
+    """Return (arrow, meta) paths of the cache entry for a source file (and sheet)."""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    ident = os.path.abspath(path) if sheet == 0 else f"{os.path.abspath(path)}[{sheet}]"
+    tag = hashlib.sha1(ident.encode("utf-8")).hexdigest()[:12]
+    base = os.path.join(cache_dir, f"{stem}-{tag}")
+    return base + ".arrow", base + ".json"
+
+
+def _read_cache(arrow_path: str, meta_path: str, key: dict, columns: list[str] | None = None):
+    """Return the cached frame (projected to columns) if its stored key matches, else None."""
+    import pyarrow as pa
+    if not (os.path.exists(arrow_path) and os.path.exists(meta_path)):
+        return None
+    with open(meta_path, "r", encoding="utf-8") as fh:
+        stored = json.load(fh)
+    if stored != key:
+        return None
+    with pa.memory_map(arrow_path, "r") as source:
+        table = pa.ipc.open_file(source).read_all()
+        if columns is not None:
+            table = table.select([c for c in table.column_names if c in columns])
+        return table.to_pandas()
+
+
+def _write_cache(df: pd.DataFrame, arrow_path: str, meta_path: str, key: dict) -> None:
+    """Persist the standardized frame as Arrow IPC plus its key (atomic renames)."""
+    import pyarrow as pa
+    os.makedirs(os.path.dirname(arrow_path), exist_ok=True)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    tmp = arrow_path + ".tmp"
+    with pa.OSFile(tmp, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp, arrow_path)
+    with open(meta_path + ".tmp", "w", encoding="utf-8") as fh:
+        json.dump(key, fh, indent=2)
+    os.replace(meta_path + ".tmp", meta_path)
+
+
+def _load_one(path: str, columns: list[str] | None = None, cache_dir: str | None = None,
+              rebuild_cache: bool = False, sheet=0) -> pd.DataFrame:
+    """load_any for a single file (one sheet of a workbook)."""
+    start = time.perf_counter()
+    label = _label(path, sheet)
+    if cache_dir is None:
+        df = _project(_read_source(path, columns, sheet), columns)
+        logger.info("Loaded %s in %.1f ms (cache disabled)",
+                    label, (time.perf_counter() - start) * 1000.0)
+        return df
+
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        logger.warning("pyarrow not installed; loading %s without cache", label)
+        return _load_one(path, columns, sheet=sheet)
+
+    key = _source_key(path, sheet)
+    arrow_path, meta_path = _cache_paths(path, cache_dir, sheet)
+    if rebuild_cache:
+        status = "miss (rebuild requested)"
+    else:
+        df = _read_cache(arrow_path, meta_path, key, columns)
+        if df is not None:
+            logger.info("Loaded %s in %.1f ms (cache hit: %s, %.2f MB in memory)",
+                        label, (time.perf_counter() - start) * 1000.0, arrow_path, _mem_mb(df))
+            return df
+        status = "miss (no entry)" if not os.path.exists(meta_path) else "miss (source changed)"
+
+    df = _read_source(path, sheet=sheet)
+    try:
+        _write_cache(df, arrow_path, meta_path, key)
+    except Exception as exc:  # unconvertible object columns etc.; keep the run going
+        logger.warning("Could not write load cache %s: %s", arrow_path, exc)
+    logger.info("Loaded %s in %.1f ms (cache %s)",
+                label, (time.perf_counter() - start) * 1000.0, status)
+    return _project(df, columns)
+
+
+def _load_part(path: str, sheet, columns: list[str] | None, cache_dir: str | None,
+               rebuild_cache: bool) -> tuple[object, str | None, float]:
+    """Pool task: one source as an Arrow table, or the error that stopped it, and its load time."""
+    import pyarrow as pa
+    start = time.perf_counter()
+    try:
+        df = _load_one(path, columns, cache_dir, rebuild_cache, sheet)
+        if not df.notna().to_numpy().any():
+            raise ValueError("no standard columns with data")
+        table = pa.Table.from_pandas(df, preserve_index=False).replace_schema_metadata(None)
+        return table, None, time.perf_counter() - start
+    except Exception as exc:
+        return None, f"{type(exc).__name__}: {exc}", time.perf_counter() - start
+
+
+def _common_type(types: list):
+    """Arrow type every source's column can be cast to (a dictionary when any source has one)."""
+    import pyarrow as pa
+    if all(t == types[0] for t in types):
+        return types[0]
+    values = [t.value_type if pa.types.is_dictionary(t) else t for t in types]
+    if all(pa.types.is_integer(v) for v in values):
+        base = pa.int64()
+    elif all(pa.types.is_integer(v) or pa.types.is_floating(v) for v in values):
+        base = pa.float64()
+    elif all(pa.types.is_timestamp(v) for v in values):
+        base = pa.timestamp("ns")
+    else:
+        base = pa.string()
+    return pa.dictionary(pa.int32(), base) if any(pa.types.is_dictionary(t) for t in types) else base
+
+
+def _concat_tables(tables: list):
+    """Concatenate per-source tables (zero-copy) after casting columns whose types differ between sources."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    names = tables[0].column_names
+    columns = {}
+    for name in names:
+        # an all-null column (e.g. one a source lacks) takes the other sources' type
+        typed = [t.schema.field(name).type for t in tables if t.column(name).null_count < t.num_rows]
+        target = _common_type(typed) if typed else tables[0].schema.field(name).type
+        cols = []
+        for t in tables:
+            col = t.column(name)
+            if col.type != target and col.null_count == t.num_rows:
+                col = pa.chunked_array([pa.nulls(t.num_rows, target)])
+            elif col.type != target:
+                if pa.types.is_dictionary(col.type):
+                    col = pc.cast(col, col.type.value_type)
+                col = pc.cast(col, target.value_type if pa.types.is_dictionary(target) else target)
+                if pa.types.is_dictionary(target):
+                    col = pc.dictionary_encode(col)
+            cols.append(col)
+        columns[name] = cols
+    return pa.concat_tables([pa.table([columns[n][i] for n in names], names=names) for i in range(len(tables))])
+
+
+def _restore_schema(df: pd.DataFrame) -> pd.DataFrame:
+    """Re-establish SCHEMA dtypes after a concat: sorted ordered categories and narrow integers."""
+    for col in df.columns:
+        kind = SCHEMA.get(col, {}).get("dtype")
+        if kind == "category":
+            s = df[col]
+            if isinstance(s.dtype, pd.CategoricalDtype):
+                df[col] = s.cat.set_categories(s.cat.categories.sort_values(), ordered=True)
+            else:
+                df[col] = s.astype(pd.CategoricalDtype(ordered=True))
+        elif kind == "integer" and pd.api.types.is_integer_dtype(df[col]):
+            df[col] = pd.to_numeric(df[col], downcast="integer")
     return df
 
 
-def write_table(df: pd.DataFrame, out_dir: str, name: str, save_parquet: bool = False) -> str:
-    """Write CSV (and optional Parquet)."""
-    csv_path = os.path.join(out_dir, f"{name}.csv")
-    df.to_csv(csv_path, index=False)
-    if save_parquet:
-        df.to_parquet(os.path.join(out_dir, f"{name}.parquet"), index=False)
-    return csv_path
+def _load_many(sources: list[tuple[str, object]], columns: list[str] | None, cache_dir: str | None,
+               rebuild_cache: bool, jobs: int) -> pd.DataFrame:
+    """Load sources in a process pool and concatenate them; failed sources are reported and skipped."""
+    start = time.perf_counter()
+    workers = max(1, min(len(sources), jobs or os.cpu_count() or 1))
+    tasks = [(path, sheet, columns, cache_dir, rebuild_cache) for path, sheet in sources]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_load_part, *zip(*tasks)))
+    else:
+        results = [_load_part(*task) for task in tasks]
+
+    report, tables = [], []
+    for (path, sheet), (table, error, secs) in zip(sources, results):
+        report.append({"source": _label(path, sheet), "rows": None if table is None else table.num_rows,
+                       "seconds": secs, "error": error})
+        if error is not None:
+            logger.warning("Skipped input %s: %s", _label(path, sheet), error)
+        elif table.num_rows:
+            tables.append(table)
+    failed = [r for r in report if r["error"]]
+    if not tables:
+        raise ValueError(f"None of the {len(sources)} input sources could be loaded: "
+                         + "; ".join(f"{r['source']}: {r['error']}" for r in failed))
+
+    df = _restore_schema(_concat_tables(tables).to_pandas(split_blocks=True, self_destruct=True))
+    df.attrs["inputs"] = report
+    logger.info("Loaded %d rows from %d of %d sources on %d worker(s) in %.1f ms "
+                "(slowest source %.1f ms, %d failed, %.2f MB in memory)",
+                len(df), len(tables), len(sources), workers, (time.perf_counter() - start) * 1000.0,
+                max(r["seconds"] for r in report) * 1000.0, len(failed), _mem_mb(df))
+    return df
+
+
+def load_any(path: str, columns: list[str] | None = None, cache_dir: str | None = None,
+             rebuild_cache: bool = False, jobs: int = 0) -> pd.DataFrame:
+    """
+    Load Excel/CSV/Parquet and standardize columns and dtypes (see SCHEMA).
+
+    columns projects the result to a subset of the standard columns; only the
+    source columns needed for it are parsed. When cache_dir is given, the full
+    standardized frame is kept there as Arrow IPC, keyed on the source path, size,
+    mtime and content hash. A matching entry is reloaded memory-mapped (projected
+    on read); any change to the source (or rebuild_cache) reparses it.
+
+    path may also be a directory, a glob or a multi-sheet workbook (see
+    input_sources). Each source is then loaded (and cached) on its own in a pool
+    of `jobs` processes (0 = one per CPU), returned as Arrow and concatenated
+    without a pandas round trip. A source that fails to load is logged and
+    skipped; per-source rows, times and errors are in df.attrs["inputs"].
+    """
+    sources = input_sources(path)
+    if len(sources) == 1:
+        src, sheet = sources[0]
+        return _load_one(src, columns, cache_dir, rebuild_cache, sheet)
+    return _load_many(sources, columns, cache_dir, rebuild_cache, jobs)
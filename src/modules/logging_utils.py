@@ -1,22 +1,167 @@
 """
-Shared logging helpers: get_logger and a simple timing decorator.
+Shared logging helpers: get_logger and a timing/metrics decorator.
+
+timeit records, per decorated stage, monotonic wall time, CPU time, process
+peak RSS, tracemalloc peak (when tracing is on), input/output row counts and
+rows/sec. Records accumulate in-process (see drain_metrics) and are written to
+a JSON run manifest by write_run_manifest. Stages named via configure_profiling
+additionally run under cProfile or a sampling profiler (pyinstrument).
 """
 from __future__ import annotations
+import io
+import os
+import sys
+import json
 import logging, time
+import pstats
+import tracemalloc
 from functools import wraps
 
+_METRICS: list[dict] = []
+_PEAK_STACK: list[int] = []
+_PROFILING = {"stages": set(), "kind": "cprofile", "out_dir": None, "top": 25}
+
+
 def get_logger(name: str) -> logging.Logger:
     return logging.getLogger(name)
 
+
+def configure_profiling(stages, kind: str = "cprofile", out_dir: str | None = None, top: int = 25) -> None:
+    """Profile the timeit stages whose label is in stages ('all' for every stage)."""
+    _PROFILING.update(stages=set(stages or ()), kind=kind, out_dir=out_dir, top=top)
+
+
+def profiling_config() -> dict:
+    return dict(_PROFILING)
+
+
+def drain_metrics() -> list[dict]:
+    """Return and clear the stage metrics recorded in this process."""
+    out = list(_METRICS)
+    _METRICS.clear()
+    return out
+
+
+def record_metrics(records: list[dict]) -> None:
+    """Add metrics recorded elsewhere (e.g. returned by worker processes)."""
+    _METRICS.extend(records)
+
+
+def _max_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024.0 * 1024.0) if sys.platform == "darwin" else rss / 1024.0  # bytes vs KiB
+
+
+def _rows(obj):
+    if hasattr(obj, "shape") and hasattr(obj, "columns"):
+        return len(obj)
+    if isinstance(obj, (tuple, list)):
+        counts = [_rows(o) for o in obj]
+        return sum(counts) if counts and all(c is not None for c in counts) else None
+    return None
+
+
+def _wants_profile(label: str) -> bool:
+    stages = _PROFILING["stages"]
+    return bool(stages) and ("all" in stages or label in stages)
+
+
+def _run_profiled(label: str, logger: logging.Logger, call):
+    """Run call() under the configured profiler and dump its hot functions."""
+    out_dir = _PROFILING["out_dir"]
+    if _PROFILING["kind"] == "sampling":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            logger.warning("pyinstrument not installed; profiling %s with cProfile instead", label)
+        else:
+            profiler = Profiler()
+            profiler.start()
+            try:
+                return call()
+            finally:
+                profiler.stop()
+                logger.info("Sampling profile for %s:\n%s", label, profiler.output_text(unicode=True))
+                if out_dir:
+                    path = os.path.join(out_dir, f"profile_{label}.html")
+                    with open(path, "w", encoding="utf-8") as fh:
+                        fh.write(profiler.output_html())
+                    logger.info("Profile for %s written to %s", label, path)
+
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        return call()
+    finally:
+        profiler.disable()
+        buf = io.StringIO()
+        pstats.Stats(profiler, stream=buf).sort_stats("cumulative").print_stats(_PROFILING["top"])
+        logger.info("cProfile hot functions for %s:\n%s", label, buf.getvalue())
+        if out_dir:
+            path = os.path.join(out_dir, f"profile_{label}.prof")
+            profiler.dump_stats(path)
+            logger.info("Profile for %s written to %s", label, path)
+
+
 def timeit(logger: logging.Logger, label: str):
     def decorator(func):
         @wraps(func)
         def wrapped(*args, **kwargs):
-            start = time.time()
+            tracing = tracemalloc.is_tracing()
+            if tracing:
+                _PEAK_STACK.append(0)
+                tracemalloc.reset_peak()
+            rows_in = _rows(args[0]) if args else None
+            start, cpu_start = time.perf_counter(), time.process_time()
+            result = None
             try:
-                return func(*args, **kwargs)
+                if _wants_profile(label):
+                    result = _run_profiled(label, logger, lambda: func(*args, **kwargs))
+                else:
+                    result = func(*args, **kwargs)
+                return result
             finally:
-                dur = (time.time() - start) * 1000.0
-                logger.info("%s completed in %.1f ms", label, dur)
+                wall = time.perf_counter() - start
+                cpu = time.process_time() - cpu_start
+                traced = None
+                if tracing:
+                    traced = max(tracemalloc.get_traced_memory()[1], _PEAK_STACK.pop())
+                    if _PEAK_STACK:  # keep the enclosing stage's peak, which reset_peak discarded
+                        _PEAK_STACK[-1] = max(_PEAK_STACK[-1], traced)
+                rec = {
+                    "stage": label,
+                    "wall_s": wall,
+                    "cpu_s": cpu,
+                    "max_rss_mb": _max_rss_mb(),
+                    "traced_peak_mb": None if traced is None else traced / 1e6,
+                    "rows_in": rows_in,
+                    "rows_out": _rows(result),
+                    "rows_per_s": rows_in / wall if rows_in and wall > 0 else None,
+                    "pid": os.getpid(),
+                }
+                _METRICS.append(rec)
+                logger.info(
+                    "%s completed in %.1f ms (cpu %.1f ms, rows in=%s out=%s%s%s%s)",
+                    label, wall * 1000.0, cpu * 1000.0, rows_in, rec["rows_out"],
+                    f", {rec['rows_per_s']:.0f} rows/s" if rec["rows_per_s"] else "",
+                    f", max rss {rec['max_rss_mb']:.0f} MB" if rec["max_rss_mb"] is not None else "",
+                    f", traced peak {rec['traced_peak_mb']:.1f} MB" if traced is not None else "",
+                )
         return wrapped
     return decorator
+
+
+def write_run_manifest(path: str, **info) -> str:
+    """Write the metrics recorded so far (plus any run info) as a JSON manifest."""
+    manifest = dict(info)
+    manifest["stages"] = list(_METRICS)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(manifest, fh, indent=2, default=str)
+    os.replace(tmp, path)
+    return path
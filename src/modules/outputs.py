@@ -0,0 +1,202 @@
+"""
+Output writer: pipeline tables as CSV and/or Parquet, optionally Hive-partitioned.
+
+Every file is written to a temporary name and renamed into place, so readers
+never see a half-written table. A partitioned table is a directory
+(`<name>.parquet/Store_Name=FEDHA/part-0.parquet`, values URL-encoded, nulls as
+__HIVE_DEFAULT_PARTITION__) built next to the old one and swapped in with two
+renames; its _columns.json lists the table's columns in order, since Hive
+readers append the partition columns at the end. With threads > 0 writes run on a background thread pool, so
+serializing one table overlaps with computing the next; flush_outputs waits for
+them. Each written table yields a record (rows, columns, files with byte sizes
+and SHA-256) that main adds to the run manifest.
+
+Background writes hold a reference to the frame: callers must not modify a
+frame after handing it to write.
+"""
+from __future__ import annotations
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from urllib.parse import quote
+import pandas as pd
+from .logging_utils import get_logger
+
+logger = get_logger(__name__)
+
+FORMATS = ("csv", "parquet", "both")
+# --partition_by names -> candidate columns (the first one a table has is used)
+PARTITION_KEYS = {"store": ("Store_Name",), "date": ("date", "Date_Of_Sale")}
+CSV_COMPRESSION = {"none": "", "gzip": ".gz", "bz2": ".bz2", "xz": ".xz"}  # codecs pandas writes without extra packages
+PARQUET_COMPRESSION = ("snappy", "zstd", "gzip", "lz4", "brotli", "none")
+NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+COLUMNS_FILE = "_columns.json"  # column order of a partitioned table; dataset readers skip "_" files
+
+_WRITERS: dict[tuple, "OutputWriter"] = {}
+_RECORDS: list[dict] = []
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _partition_value(v) -> str:
+    if v is None or (not isinstance(v, str) and pd.isna(v)):
+        return NULL_PARTITION
+    if isinstance(v, pd.Timestamp):
+        v = v.strftime("%Y-%m-%d") if v == v.normalize() else v.isoformat()
+    return quote(str(v), safe="")
+
+
+def _swap_in(tmp: str, final: str) -> None:
+    """Rename tmp over final; a directory (or a file replacing one) moves the old entry aside first."""
+    if not (os.path.isdir(tmp) or os.path.isdir(final)):
+        os.replace(tmp, final)
+        return
+    old = None
+    if os.path.exists(final):
+        old = f"{final}.old-{uuid.uuid4().hex[:8]}"
+        os.replace(final, old)
+    os.replace(tmp, final)
+    if old is not None:
+        _discard(old)
+
+
+def _discard(path: str) -> None:
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+class OutputWriter:
+    """Writes tables to out_dir in one format (or both) with the given partitioning and compression."""
+
+    def __init__(self, out_dir: str, fmt: str = "csv", partition_by: tuple[str, ...] = (),
+                 csv_compression: str = "none", parquet_compression: str = "snappy", threads: int = 0):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown output format {fmt!r}; expected one of {FORMATS}")
+        unknown = set(partition_by) - set(PARTITION_KEYS)
+        if unknown:
+            raise ValueError(f"Unknown partition keys {sorted(unknown)}; expected {sorted(PARTITION_KEYS)}")
+        self.out_dir = out_dir
+        self.formats = ["csv", "parquet"] if fmt == "both" else [fmt]
+        self.partition_by = tuple(partition_by)
+        self.csv_compression = csv_compression
+        self.parquet_compression = parquet_compression
+        if threads > 0 and "parquet" in self.formats:
+            # import before the threads do: a first import racing in two writers can leave one
+            # without pyarrow's pandas metadata, and its categoricals come back as plain strings
+            import pyarrow.parquet  # noqa: F401
+        self._pool = ThreadPoolExecutor(threads, thread_name_prefix="output") if threads > 0 else None
+        self._pending: list[Future] = []
+
+    def write(self, df: pd.DataFrame, name: str) -> None:
+        """Write df as table `name` (in the background when the writer has threads)."""
+        if self._pool is None:
+            _RECORDS.extend(self._write(df, name))
+        else:
+            self._pending.append(self._pool.submit(self._write, df, name))
+
+    def flush(self) -> None:
+        """Wait for the background writes; the first failure is raised here."""
+        pending, self._pending = self._pending, []
+        for fut in pending:
+            _RECORDS.extend(fut.result())
+
+    def _partition_cols(self, df: pd.DataFrame) -> list[str]:
+        cols = []
+        for key in self.partition_by:
+            col = next((c for c in PARTITION_KEYS[key] if c in df.columns), None)
+            if col is not None:
+                cols.append(col)
+        return cols
+
+    def _suffix(self, fmt: str) -> str:
+        return ".parquet" if fmt == "parquet" else ".csv" + CSV_COMPRESSION[self.csv_compression]
+
+    def _write_file(self, df: pd.DataFrame, path: str, fmt: str) -> dict:
+        if fmt == "parquet":
+            codec = None if self.parquet_compression == "none" else self.parquet_compression
+            df.to_parquet(path, index=False, compression=codec)
+        else:
+            codec = None if self.csv_compression == "none" else self.csv_compression
+            df.to_csv(path, index=False, compression=codec)
+        return {"rows": len(df), "bytes": os.path.getsize(path), "sha256": _sha256(path)}
+
+    def _write(self, df: pd.DataFrame, name: str) -> list[dict]:
+        cols = self._partition_cols(df)
+        records = []
+        for fmt in self.formats:
+            start = time.perf_counter()
+            suffix = self._suffix(fmt)
+            final = os.path.join(self.out_dir, name + (f".{fmt}" if cols else suffix))
+            tmp = f"{final}.tmp-{uuid.uuid4().hex[:8]}"
+            files = []
+            try:
+                if not cols:
+                    files.append({"path": os.path.basename(final), **self._write_file(df, tmp, fmt)})
+                else:
+                    os.makedirs(tmp)
+                    with open(os.path.join(tmp, COLUMNS_FILE), "w", encoding="utf-8") as fh:
+                        json.dump([str(c) for c in df.columns], fh)
+                    by = cols if len(cols) > 1 else cols[0]  # a one-item list yields 1-tuples in newer pandas
+                    for key, part in df.groupby(by, observed=True, dropna=False, sort=True):
+                        key = key if isinstance(key, tuple) else (key,)
+                        rel = os.path.join(*[f"{c}={_partition_value(v)}" for c, v in zip(cols, key)])
+                        os.makedirs(os.path.join(tmp, rel))
+                        rel = os.path.join(rel, "part-0" + suffix)
+                        info = self._write_file(part.drop(columns=cols), os.path.join(tmp, rel), fmt)
+                        files.append({"path": os.path.join(os.path.basename(final), rel), **info})
+                _swap_in(tmp, final)
+            except BaseException:
+                _discard(tmp)
+                raise
+            wall = time.perf_counter() - start
+            logger.info("Wrote %s (%d rows, %d file(s)) in %.1f ms", final, len(df), len(files), wall * 1000.0)
+            records.append({
+                "table": name,
+                "format": fmt,
+                "path": os.path.abspath(final),
+                "rows": len(df),
+                "columns": [str(c) for c in df.columns],
+                "partition_by": cols,
+                "compression": self.parquet_compression if fmt == "parquet" else self.csv_compression,
+                "write_s": wall,
+                "files": files,
+            })
+        return records
+
+
+def get_writer(out_dir: str, fmt: str = "csv", partition_by: tuple[str, ...] = (),
+               csv_compression: str = "none", parquet_compression: str = "snappy",
+               threads: int = 0) -> OutputWriter:
+    """The process's writer for these options, created on first use (its thread pool is reused)."""
+    key = (out_dir, fmt, tuple(partition_by), csv_compression, parquet_compression, threads)
+    writer = _WRITERS.get(key)
+    if writer is None:
+        writer = _WRITERS[key] = OutputWriter(out_dir, fmt, tuple(partition_by), csv_compression,
+                                              parquet_compression, threads)
+    return writer
+
+
+def flush_outputs() -> list[dict]:
+    """Wait for every writer of this process; return and clear the records of the tables written."""
+    for writer in _WRITERS.values():
+        writer.flush()
+    out = list(_RECORDS)
+    _RECORDS.clear()
+    return out
+
+
+def record_outputs(records: list[dict]) -> None:
+    """Add output records from elsewhere (e.g. returned by worker processes)."""
+    _RECORDS.extend(records)
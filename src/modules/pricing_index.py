@@ -2,37 +2,66 @@
 from __future__ import annotations
 import numpy as np, pandas as pd
 from .logging_utils import get_logger, timeit
+from .aggregates import AggregateCache, cached
 
 logger = get_logger(__name__)
 
-@timeit(logger, "compute_price_index")
-def compute_price_index(df: pd.DataFrame):
-    work = df.copy()
-    logger.info("Computing price index on %d rows", len(work))
-    grp = work.groupby(["Store_Name","Sub_Department","Section","Supplier"]).agg(
-        avg_price=("realised_unit_price","mean"),
+KEYS = ["Store_Name","Sub_Department","Section"]
+NODE = "_node"  # constant grouping key, so the grand total groups like any other set
+ROLLING = (7, 28)
+SUMS = ["price_sum", "price_n", "units"]
+
+
+def _is_bidco(supplier: pd.Series) -> np.ndarray:
+    """Flag Bidco suppliers, matching the name once per distinct supplier."""
+    codes, uniques = pd.factorize(supplier)
+    flags = np.asarray(pd.Index(uniques).astype(str).str.contains("bidco", case=False), dtype=bool)
+    return (codes >= 0) & np.append(flags, False)[codes]
+
+
+def _weighted_side(grp: pd.DataFrame, mask: np.ndarray, prefix: str, keys: list[str] = KEYS) -> pd.DataFrame:
+    """Units-weighted supplier price per grain as sum(price*units)/sum(units).
+
+    Matches np.average semantics: NaN when units do not sum above zero or any
+    supplier price in the group is NaN.
+    """
+    part = grp[mask]
+    g = part.groupby(keys, observed=True)
+    wsum, units = g["price_x_units"].sum(), g["units"].sum()
+    has_nan = g["avg_price"].count() < g.size()
+    avg = (wsum / units).where((units > 0) & ~has_nan)
+    return pd.DataFrame({f"{prefix}_avg_price": avg, f"{prefix}_units": units}).reset_index()
+
+
+def supplier_grain(df: pd.DataFrame, extra_keys: list[str] | None = None) -> pd.DataFrame:
+    """Mergeable store × sub-dept × section × supplier (× extra_keys) sums of price and units."""
+    return df.groupby(KEYS + ["Supplier"] + (extra_keys or []), observed=True).agg(
+        price_sum=("realised_unit_price","sum"),
+        price_n=("realised_unit_price","count"),
         units=("Quantity","sum"),
     ).reset_index()
 
-    bidco = grp[grp["Supplier"].str.contains("bidco", case=False, na=False)].copy()
-    peers = grp[~grp["Supplier"].str.contains("bidco", case=False, na=False)].copy()
 
-    peer_agg = peers.groupby(["Store_Name","Sub_Department","Section"]).apply(
-        lambda g: pd.Series({
-            "peer_avg_price": np.average(g["avg_price"], weights=g["units"]) if g["units"].sum()>0 else np.nan,
-            "peer_units": g["units"].sum()
-        })
-    ).reset_index()
+def _index_from_sums(grain: pd.DataFrame, keys: list[str] = KEYS) -> pd.DataFrame:
+    """Bidco vs peer prices and index per keys from sums unique per keys × supplier."""
+    grp = grain[keys + ["Supplier"]].copy()
+    grp["avg_price"] = grain["price_sum"] / grain["price_n"].where(grain["price_n"] > 0)
+    grp["units"] = grain["units"]
+    grp["price_x_units"] = grp["avg_price"] * grp["units"]
 
-    bidco_agg = bidco.groupby(["Store_Name","Sub_Department","Section"]).apply(
-        lambda g: pd.Series({
-            "bidco_avg_price": np.average(g["avg_price"], weights=g["units"]) if g["units"].sum()>0 else np.nan,
-            "bidco_units": g["units"].sum()
-        })
-    ).reset_index()
+    is_bidco = _is_bidco(grp["Supplier"])
+    bidco_agg = _weighted_side(grp, is_bidco, "bidco", keys)
+    peer_agg = _weighted_side(grp, ~is_bidco, "peer", keys)
 
-    idx = bidco_agg.merge(peer_agg, on=["Store_Name","Sub_Department","Section"], how="outer")
+    idx = bidco_agg.merge(peer_agg, on=keys, how="outer")
     idx["price_index"] = idx["bidco_avg_price"] / idx["peer_avg_price"]
+    return idx
+
+
+def index_from_grain(grain: pd.DataFrame):
+    """Price index and roll-up from supplier_grain sums (re-aggregated over any extra keys)."""
+    grain = grain.groupby(KEYS + ["Supplier"], observed=True)[SUMS].sum().reset_index()
+    idx = _index_from_sums(grain)
     logger.info("Computed price index rows: %d", len(idx))
 
     def wavg(series, weights):
@@ -46,3 +75,181 @@ def compute_price_index(df: pd.DataFrame):
     rollup["price_index_rollup"] = rollup["bidco_avg_price_rollup"] / rollup["peer_avg_price_rollup"]
     logger.info("Roll-up price index: %s", rollup["price_index_rollup"].iloc[0])
     return idx, rollup
+
+
+def _side_prices(point: np.ndarray, n_points: int, bidco: np.ndarray, avg: np.ndarray, units: np.ndarray):
+    """Units-weighted side price per evaluation point (NaN on no units or any NaN supplier price)."""
+    out = {}
+    for prefix, mask in (("bidco", bidco), ("peer", ~bidco)):
+        pt, a, u = point[mask], avg[mask], units[mask]
+        wsum = np.bincount(pt, weights=np.where(np.isnan(a), 0.0, a * u), minlength=n_points)
+        usum = np.bincount(pt, weights=u, minlength=n_points)
+        has_nan = np.bincount(pt, weights=np.isnan(a), minlength=n_points) > 0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            out[f"{prefix}_avg_price"] = np.where((usum > 0) & ~has_nan, wsum / usum, np.nan)
+        out[f"{prefix}_units"] = np.where(np.bincount(pt, minlength=n_points) > 0, usum, np.nan)
+    return out
+
+
+def _window_ends(group: np.ndarray, day: np.ndarray, n: int, last_day: int):
+    """Every (group, end day) whose n-day window holds a sale day of the group, up to last_day.
+
+    group/day are the sorted sale days; the ends are the union of [day, day + n - 1]
+    per group, expanded from the merged intervals.
+    """
+    start = np.ones(len(day), dtype=bool)
+    start[1:] = (group[1:] != group[:-1]) | (day[1:] - day[:-1] > n)
+    stop = np.append(start[1:], True)
+    lo, hi = day[start], np.minimum(day[stop] + n - 1, last_day)
+    lengths = hi - lo + 1
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.repeat(group[start], lengths), np.repeat(lo, lengths) + offsets
+
+
+def price_series(grain: pd.DataFrame, since=None, rolling: tuple[int, ...] = ROLLING) -> pd.DataFrame:
+    """
+    Long-format price index over time from a supplier_grain by Date_Of_Sale.
+
+    Periods: "daily", "weekly" (weeks ending Sunday) and "rolling_<n>" windows
+    ending on each day whose window holds sales of the store × sub-dept × section. Each window
+    combines supplier prices like index_from_grain does for the whole period.
+    Window sums are differences of per-supplier cumulative sums located with
+    searchsorted, so no window re-aggregates rows. Roll-up rows have null keys
+    and grouping_id 7 (every key aggregated, as in price_cube); group rows have
+    grouping_id 0. since limits the output to windows ending on or after that
+    date (enough to append new days to an earlier series).
+    """
+    g = grain[grain["Date_Of_Sale"].notna()]
+    g = g.groupby(KEYS + ["Supplier", "Date_Of_Sale"], observed=True, sort=True)[
+        ["price_sum", "price_n", "units"]].sum().reset_index()
+    sup_key = g.groupby(KEYS + ["Supplier"], observed=True, sort=True)
+    sk = sup_key.ngroup().to_numpy()
+    sups = sup_key.size().reset_index()
+    grp_key = sups.groupby(KEYS, observed=True, sort=True)
+    sk_group = grp_key.ngroup().to_numpy()
+    groups = grp_key.size()
+    first_sk = np.concatenate([[0], np.cumsum(groups.to_numpy())])
+    bidco_sk = _is_bidco(sups["Supplier"])
+
+    day = g["Date_Of_Sale"].to_numpy(dtype="datetime64[D]").astype(np.int64)
+    longest = max((1, 7) + tuple(rolling))
+    origin = (day.min() if len(day) else 0) - longest - 1
+    width = (day.max() - origin if len(day) else 0) + 8  # room for week ends past the last day
+    key = sk * width + (day - origin)  # g is sorted by supplier key then day
+    # cumulative sums restart per supplier key, so a window only cancels within its own history
+    seg_start = np.searchsorted(sk, sk, side="left")
+    cum = {c: g[c].astype(float).groupby(sk).cumsum().to_numpy() for c in ("price_sum", "price_n", "units")}
+
+    gday = np.unique(sk_group[sk] * width + (day - origin))
+    sale_group, sale_day = gday // width, gday % width + origin
+    last_day = day.max() if len(day) else 0
+    week_end = sale_day + (6 - (sale_day + 3) % 7)  # day 0 (1970-01-01) was a Thursday
+    wk = np.unique(sale_group * width + (week_end - origin))
+    periods = [("weekly", 7, wk // width, wk % width + origin)]
+    periods += [(f"rolling_{n}" if n > 1 else "daily", n, *_window_ends(sale_group, sale_day, n, last_day))
+                for n in (1,) + tuple(rolling)]
+    since_day = None if since is None else pd.Timestamp(since).to_datetime64().astype("datetime64[D]").astype(np.int64)
+
+    group_keys = groups.reset_index()[KEYS]
+    frames = []
+    for period, n, pg, end in periods:
+        if since_day is not None:
+            pg, end = pg[end >= since_day], end[end >= since_day]
+        # one (point, supplier) pair per supplier of the point's group
+        counts = first_sk[pg + 1] - first_sk[pg]
+        point = np.repeat(np.arange(len(pg)), counts)
+        pair_sk = np.repeat(first_sk[pg], counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        lo = np.searchsorted(key, pair_sk * width + (np.repeat(end, counts) - n + 1 - origin), side="left")
+        hi = np.searchsorted(key, pair_sk * width + (np.repeat(end, counts) - origin), side="right")
+        sold = hi > lo
+        before = lo > seg_start[np.minimum(lo, len(sk) - 1)]
+        win = {c: np.where(sold, v[np.maximum(hi - 1, 0)], 0.0) - np.where(sold & before, v[np.maximum(lo - 1, 0)], 0.0)
+               for c, v in cum.items()}
+        with np.errstate(divide="ignore", invalid="ignore"):
+            avg = np.where(win["price_n"] > 0, win["price_sum"] / win["price_n"], np.nan)
+        sides = _side_prices(point[sold], len(pg), bidco_sk[pair_sk[sold]], avg[sold], win["units"][sold])
+
+        out = group_keys.iloc[pg].reset_index(drop=True)
+        out.insert(0, "period", period)
+        out.insert(1, "date", end.astype("datetime64[D]").astype("datetime64[ns]"))
+        out.insert(2, "window_start", (end - n + 1).astype("datetime64[D]").astype("datetime64[ns]"))
+        out.insert(3, "grouping_id", 0)
+        for c, v in sides.items():
+            out[c] = v
+        out["price_index"] = out["bidco_avg_price"] / out["peer_avg_price"]
+        frames.append(out)
+
+        # roll-up: units-weighted mean of the group side prices, per window end
+        d_id, d_end = pd.factorize(end, sort=True)
+        roll = pd.DataFrame({"period": period, "date": d_end.astype("datetime64[D]").astype("datetime64[ns]"),
+                             "window_start": (d_end - n + 1).astype("datetime64[D]").astype("datetime64[ns]"),
+                             "grouping_id": (1 << len(KEYS)) - 1})
+        for k in KEYS:
+            roll[k] = None
+        for prefix in ("bidco", "peer"):
+            p, u = out[f"{prefix}_avg_price"].to_numpy(), out[f"{prefix}_units"].to_numpy()
+            ok = ~np.isnan(p) & ~np.isnan(u)
+            wsum = np.bincount(d_id[ok], weights=p[ok] * u[ok], minlength=len(d_end))
+            usum = np.bincount(d_id[ok], weights=u[ok], minlength=len(d_end))
+            with np.errstate(divide="ignore", invalid="ignore"):
+                roll[f"{prefix}_avg_price"] = np.where(usum > 0, wsum / usum, np.nan)
+            roll[f"{prefix}_units"] = np.bincount(d_id, weights=np.nan_to_num(u), minlength=len(d_end))
+        roll["price_index"] = roll["bidco_avg_price"] / roll["peer_avg_price"]
+        frames.append(roll)
+
+    for f in frames:
+        for k in KEYS:
+            f[k] = f[k].astype(object)
+    series = pd.concat(frames, ignore_index=True)
+    logger.info("Price index series rows: %d (%d store/sub-dept/section groups)", len(series), len(groups))
+    return series
+
+
+def price_cube(grain: pd.DataFrame) -> pd.DataFrame:
+    """
+    Price index at every grouping set of KEYS (SQL CUBE), one row per node.
+
+    Aggregated keys are null and grouping_id has bit i set when KEYS[i] is
+    aggregated (Store_Name is the high bit), as SQL GROUPING_ID does, so
+    grouping_id (not the key values) tells roll-up rows apart. Each set's
+    supplier sums are rolled up from its smallest already computed parent set,
+    never from rows, and priced like index_from_grain. The finest set equals
+    price_index; the apex pools every supplier's sums, whereas
+    price_index_rollup averages the group indices.
+    """
+    base = grain.groupby(KEYS + ["Supplier"], observed=True)[SUMS].sum().reset_index()
+    for k in KEYS:
+        base[k] = base[k].astype(object)
+    bits = {k: 1 << (len(KEYS) - 1 - i) for i, k in enumerate(KEYS)}
+    sums = {0: base}
+    frames = []
+    for gid in sorted(range(1 << len(KEYS)), key=lambda g: (bin(g).count("1"), g)):
+        kept = [k for k, b in bits.items() if not gid & b]
+        if gid:
+            parent = min((sums[gid & ~b] for b in bits.values() if gid & b), key=len)
+            sums[gid] = parent.groupby(kept + ["Supplier"], observed=True, sort=True)[SUMS].sum().reset_index()
+        idx = _index_from_sums(sums[gid].assign(**{NODE: 0}), [NODE] + kept).drop(columns=NODE)
+        idx = idx.assign(**{k: None for k in KEYS if k not in kept})
+        idx = idx[KEYS + [c for c in idx.columns if c not in KEYS]]
+        idx.insert(0, "grouping_id", gid)
+        frames.append(idx)
+    cube = pd.concat(frames, ignore_index=True)
+    logger.info("Price index cube rows: %d over %d grouping sets", len(cube), len(frames))
+    return cube
+
+
+@timeit(logger, "compute_price_cube")
+def compute_price_cube(df: pd.DataFrame, cache: AggregateCache | None = None) -> pd.DataFrame:
+    return price_cube(cached(cache, df, "supplier_grain", supplier_grain))
+
+
+@timeit(logger, "compute_price_series")
+def compute_price_series(df: pd.DataFrame, cache: AggregateCache | None = None) -> pd.DataFrame:
+    grain = cached(cache, df, "supplier_grain", supplier_grain, extra_keys=["Date_Of_Sale"])
+    return price_series(grain)
+
+
+@timeit(logger, "compute_price_index")
+def compute_price_index(df: pd.DataFrame, cache: AggregateCache | None = None):
+    logger.info("Computing price index on %d rows", len(df))
+    return index_from_grain(cached(cache, df, "supplier_grain", supplier_grain))
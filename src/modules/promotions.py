@@ -1,106 +1,343 @@
 """
 Promotion detection and KPI computations: uplift, coverage, and price deltas.
+
+Everything is derived from one store × item × day aggregate (see daily_grain),
+computed once; per-SKU and per-item KPIs are key-aligned reductions of it.
 """
 from __future__ import annotations
-import logging
 import numpy as np
 import pandas as pd
 from .logging_utils import get_logger, timeit
+from .aggregates import AggregateCache, cached
 
 logger = get_logger(__name__)
 
+DAY_KEYS = ["Store_Name", "Item_Code", "Date_Of_Sale"]
+SKU_KEYS = ["Store_Name", "Item_Code"]
+ATTR_COLS = ["Description", "Supplier", "Sub_Department", "Section"]
 
-@timeit(logger, "detect_promotions")
-def detect_promotions(df: pd.DataFrame, discount_threshold: float = 0.10, promo_min_days: int = 2) -> pd.DataFrame:
+
+def _as_category(s: pd.Series) -> pd.Series:
+    return s if isinstance(s.dtype, pd.CategoricalDtype) else s.astype("category")
+
+
+def _first_attrs(attrs: pd.DataFrame, by) -> pd.DataFrame:
+    """groupby(by).first() on categorical attributes via their codes (keeps the cython path)."""
+    cats = {c: _as_category(attrs[c]) for c in attrs.columns}
+    codes = pd.DataFrame({c: s.cat.codes.where(s.notna()) for c, s in cats.items()})
+    first = codes.groupby(by, observed=True, sort=True).first()
+    return pd.DataFrame({
+        c: pd.Categorical.from_codes(first[c].fillna(-1).astype(int), dtype=cats[c].dtype)
+        for c in attrs.columns
+    }, index=first.index)
+
+
+def daily_grain(df: pd.DataFrame, discount_threshold: float = 0.10) -> pd.DataFrame:
     """
-    Tag per-row promo flags and aggregate to SKU/store-level promo days, uplift and coverage.
-    Adds baseline vs promo average realised unit prices.
+    Aggregate rows to store × item × day: units, sums/counts of price, RRP and
+    discount depth (so means stay mergeable), the promo-day flag and the first
+    seen item attributes. Rows without a sale date are dropped.
     """
-    work = df.copy()
-    logger.info("Starting promo detection on %d rows", len(work))
-    work["discount_depth"] = (
-        work["RRP"] - work["realised_unit_price"]) / work["RRP"]
-    work["is_promo_day"] = (work["realised_unit_price"] <= (
-        1 - discount_threshold) * work["RRP"]) & work["RRP"].notna() & work["realised_unit_price"].notna()
-
-    promo_days = (
-        work.dropna(subset=["Date_Of_Sale"])
-        .groupby(["Store_Name", "Item_Code", "Date_Of_Sale"])["is_promo_day"]
-        .max()
-        .groupby(level=[0, 1])
-        .sum()
-        .reset_index(name="promo_days")
-    )
-    work = work.merge(promo_days, on=["Store_Name", "Item_Code"], how="left")
-    work["on_promo"] = work["promo_days"].fillna(0) >= promo_min_days
-    logger.info("SKUs on_promo across stores: %d", int(
-        work.groupby(["Store_Name", "Item_Code"])["on_promo"].max().sum()))
-
-    daily = work.groupby(["Store_Name", "Item_Code", "Date_Of_Sale"]).agg(
-        units=("Quantity", "sum"),
-        price=("realised_unit_price", "mean"),
-        rrp=("RRP", "mean"),
-        promo=("is_promo_day", "max"),
-    ).reset_index()
-
-    base = daily.loc[~daily["promo"].fillna(False)].groupby(["Store_Name", "Item_Code"])[
-        "units"].mean().reset_index().rename(columns={"units": "baseline_units"})
-    prom = daily.loc[daily["promo"].fillna(False)].groupby(["Store_Name", "Item_Code"])[
-        "units"].mean().reset_index().rename(columns={"units": "promo_units"})
-    uplift = base.merge(prom, on=["Store_Name", "Item_Code"], how="outer").fillna(
-        {"baseline_units": 0.0, "promo_units": 0.0})
-    # uplift["promo_uplift_pct"] = np.where(uplift["baseline_units"]>0, (uplift["promo_units"]-uplift["baseline_units"])/uplift["baseline_units"], np.nan)
-    uplift["promo_days_count"] = (
-        daily[daily["promo"].fillna(False)]
-        .groupby(["Store_Name", "Item_Code"])["Date_Of_Sale"]
-        .nunique()
-        .reset_index(drop=True)
+    price, rrp = df["realised_unit_price"], df["RRP"]
+    work = pd.DataFrame({
+        **{c: df[c] for c in DAY_KEYS},
+        "units": df["Quantity"],
+        "price": price,
+        "rrp": rrp,
+        "depth": (rrp - price) / rrp,
+        "promo": (price <= (1 - discount_threshold) * rrp) & rrp.notna() & price.notna(),
+    })
+    dated = df["Date_Of_Sale"].notna()
+    keys = [work.loc[dated, k] for k in DAY_KEYS]
+    daily = work[dated].groupby(keys, observed=True).agg(
+        units=("units", "sum"),
+        price_sum=("price", "sum"), price_n=("price", "count"),
+        rrp_sum=("rrp", "sum"), rrp_n=("rrp", "count"),
+        depth_sum=("depth", "sum"), depth_n=("depth", "count"),
+        promo=("promo", "max"),
     )
+    attrs = _first_attrs(df.loc[dated, ATTR_COLS], keys)
+    return pd.concat([daily, attrs], axis=1).reset_index()
+
+
+def _mean(total: pd.Series, n: pd.Series) -> pd.Series:
+    return (total / n.where(n > 0)).astype(float)
+
+
+def _sku_uplift(sku_id: np.ndarray, n_sku: int, promo: np.ndarray, units: np.ndarray) -> pd.DataFrame:
+    """Baseline vs promo day counts, mean daily units and uplift per SKU id."""
+    promo_days = np.bincount(sku_id, weights=promo, minlength=n_sku)
+    base_days = np.bincount(sku_id, weights=~promo, minlength=n_sku)
+    promo_units = np.bincount(sku_id, weights=np.where(promo, units, 0.0), minlength=n_sku)
+    base_units = np.bincount(sku_id, weights=np.where(promo, 0.0, units), minlength=n_sku)
+
+    out = pd.DataFrame(index=pd.RangeIndex(n_sku))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out["baseline_units"] = np.where(base_days > 0, base_units / base_days, 0.0)
+        out["promo_units"] = np.where(promo_days > 0, promo_units / promo_days, 0.0)
+    out["promo_days_count"] = promo_days.astype(int)
+    out["baseline_days_count"] = base_days.astype(int)
+    b, p = out["baseline_units"], out["promo_units"]
+    # only compute if both sides have enough data; avoid -1 artefact from literal 0 promo units
+    valid = (out["baseline_days_count"] >= 2) & (out["promo_days_count"] >= 2) & (b > 0) & (p != 0)
+    out["promo_uplift_pct"] = ((p - b) / b.where(valid)).astype(float)
+    return out
+
+
+def _day_numbers(daily: pd.DataFrame) -> np.ndarray:
+    return daily["Date_Of_Sale"].to_numpy(dtype="datetime64[D]").astype(np.int64)
 
-    uplift["baseline_days_count"] = (
-        daily[~daily["promo"].fillna(False)]
-        .groupby(["Store_Name", "Item_Code"])["Date_Of_Sale"]
-        .nunique()
-        .reset_index(drop=True)
+
+def _promo_runs(sku_id: np.ndarray, day: np.ndarray, promo: np.ndarray, max_gap_days: int = 1):
+    """
+    Run-length encode promo days of a grain sorted by SKU then day.
+
+    Returns (rows, episode, first): the row positions of promo days, the episode
+    number of each, and a mask of the rows that start an episode. A run breaks
+    at a SKU change or when the next promo day is more than max_gap_days later.
+    """
+    rows = np.flatnonzero(promo)
+    s, d = sku_id[rows], day[rows]
+    first = np.ones(len(rows), dtype=bool)
+    first[1:] = (s[1:] != s[:-1]) | (d[1:] - d[:-1] > max_gap_days)
+    return rows, np.cumsum(first) - 1, first
+
+
+def summarize_daily(daily: pd.DataFrame, promo_min_days: int = 2, consecutive: bool = False) -> pd.DataFrame:
+    """
+    Turn the daily grain into the SKU/store promo summary: baseline vs promo units,
+    day counts, uplift, SKU promo coverage across stores and price statistics.
+
+    consecutive=True puts a SKU on promo only if one episode (run of consecutive
+    promo days) lasts promo_min_days, rather than its promo days in total; the
+    grain must then be sorted by DAY_KEYS, as daily_grain returns it.
+    """
+    promo = daily["promo"].to_numpy(dtype=bool)
+    units = daily["units"].to_numpy(dtype=float)
+    price = _mean(daily["price_sum"], daily["price_n"])
+
+    # store × item: every reduction shares one grouper, so results align by key
+    by_sku = daily.groupby(SKU_KEYS, observed=True, sort=True)
+    sku_id = by_sku.ngroup().to_numpy()
+    n_sku = by_sku.ngroups
+    uplift = pd.concat([by_sku.size().reset_index()[SKU_KEYS], _sku_uplift(sku_id, n_sku, promo, units)], axis=1)
+
+    if consecutive:
+        rows, episode, _ = _promo_runs(sku_id, _day_numbers(daily), promo)
+        longest = np.zeros(n_sku, dtype=np.int64)
+        np.maximum.at(longest, sku_id[rows], np.bincount(episode)[episode])
+        on_promo_sku = longest >= promo_min_days
+    else:
+        on_promo_sku = uplift["promo_days_count"].to_numpy() >= promo_min_days
+    logger.info("SKUs on_promo across stores: %d", int(on_promo_sku.sum()))
+    on_promo = on_promo_sku[sku_id]
+
+    attrs = _first_attrs(daily[ATTR_COLS], sku_id).reset_index(drop=True)
+    sku_coverage = (
+        pd.Series(on_promo_sku, index=uplift["Item_Code"])
+        .groupby(level=0, observed=True).mean()
+        .rename("promo_coverage_sku")
     )
 
-    # only compute if both sides have enough data
-    mask = (uplift["baseline_days_count"] >= 2) & (
-        uplift["promo_days_count"] >= 2)
-    uplift.loc[~mask, "promo_uplift_pct"] = np.nan
-
-    # avoid -1 artefact from literal 0 promo units
-    uplift.loc[uplift["promo_units"] == 0, "promo_uplift_pct"] = np.nan
-
-    base_p = daily.loc[~daily["promo"].fillna(False)].groupby(["Item_Code"])[
-        "price"].mean().reset_index().rename(columns={"price": "baseline_avg_price"})
-    promo_p = daily.loc[daily["promo"].fillna(False)].groupby(["Item_Code"])[
-        "price"].mean().reset_index().rename(columns={"price": "promo_avg_price"})
-
-    sku_store_promo = work.groupby(["Item_Code", "Store_Name"])[
-        "on_promo"].max().reset_index()
-    sku_coverage = sku_store_promo.groupby("Item_Code")["on_promo"].mean(
-    ).reset_index().rename(columns={"on_promo": "promo_coverage_sku"})
-
-    price_stats = work.groupby(["Item_Code", "on_promo"]).agg(
-        avg_price=("realised_unit_price", "mean"),
-        avg_rrp=("RRP", "mean"),
-        avg_discount_depth=("discount_depth", "mean"),
-        units=("Quantity", "sum"),
-    ).reset_index()
-
-    summary = (
-        uplift
-        .merge(work[["Item_Code", "Description", "Supplier", "Sub_Department", "Section"]].drop_duplicates(), on="Item_Code", how="left")
-        .merge(sku_coverage, on="Item_Code", how="left")
-        .merge(price_stats.groupby("Item_Code").agg(
-            avg_price_all=("avg_price", "mean"),
-            avg_rrp_all=("avg_rrp", "mean"),
-            avg_discount_depth_all=("avg_discount_depth", "mean"),
-            units_all=("units", "sum"),
-        ).reset_index(), on="Item_Code", how="left")
-        .merge(base_p, on="Item_Code", how="left")
-        .merge(promo_p, on="Item_Code", how="left")
+    price_stats = (
+        daily[["Item_Code", "price_sum", "price_n", "rrp_sum", "rrp_n", "depth_sum", "depth_n", "units"]]
+        .assign(on_promo=on_promo)
+        .groupby(["Item_Code", "on_promo"], observed=True).sum()
+    )
+    item_stats = pd.DataFrame({
+        "avg_price": _mean(price_stats["price_sum"], price_stats["price_n"]),
+        "avg_rrp": _mean(price_stats["rrp_sum"], price_stats["rrp_n"]),
+        "avg_discount_depth": _mean(price_stats["depth_sum"], price_stats["depth_n"]),
+        "units": price_stats["units"],
+    }).groupby(level="Item_Code", observed=True).agg(
+        avg_price_all=("avg_price", "mean"),
+        avg_rrp_all=("avg_rrp", "mean"),
+        avg_discount_depth_all=("avg_discount_depth", "mean"),
+        units_all=("units", "sum"),
     )
+
+    day_price = pd.DataFrame({"Item_Code": daily["Item_Code"], "price": price})
+    base_p = day_price[~promo].groupby("Item_Code", observed=True)["price"].mean().rename("baseline_avg_price")
+    promo_p = day_price[promo].groupby("Item_Code", observed=True)["price"].mean().rename("promo_avg_price")
+
+    summary = pd.concat([uplift, attrs], axis=1)
+    for item_level in (sku_coverage, item_stats, base_p, promo_p):
+        summary = summary.merge(item_level, left_on="Item_Code", right_index=True, how="left")
+    return summary
+
+
+def episodes_from_daily(daily: pd.DataFrame, window_days: int = 7, max_gap_days: int = 1) -> pd.DataFrame:
+    """
+    Promo episodes (runs of promo days per store × item) from the daily grain.
+
+    The grain is ordered once by SKU and day; runs come from _promo_runs and are
+    reduced with bincount. Pre/post baselines average the units of non-promo
+    days within window_days before the start / after the end, read off
+    cumulative sums over the ordered grain with searchsorted, so the whole
+    computation is linear after the sort. Days without sales are not in the
+    grain, so baselines are per observed day, as in summarize_daily.
+    """
+    by_sku = daily.groupby(SKU_KEYS, observed=True, sort=True)
+    sku_id = by_sku.ngroup().to_numpy()
+    day = _day_numbers(daily)
+    origin = (day.min() if len(day) else 0) - window_days - 1
+    width = (day.max() - origin if len(day) else 0) + window_days + 2
+    key = sku_id * width + (day - origin)
+    order = None if np.all(key[1:] >= key[:-1]) else np.argsort(key, kind="stable")
+    if order is not None:
+        daily, sku_id, day, key = daily.iloc[order], sku_id[order], day[order], key[order]
+
+    promo = daily["promo"].to_numpy(dtype=bool)
+    units = daily["units"].to_numpy(dtype=float)
+    rows, episode, first = _promo_runs(sku_id, day, promo, max_gap_days)
+    # a run ends where the next one starts; without promo days there are no runs (and no last row)
+    starts, ends = rows[first], rows[np.append(first[1:], True) if len(rows) else first]
+    sku_e, start_day, end_day = sku_id[starts], day[starts], day[ends]
+
+    def total(col):
+        # float even without episodes (an empty weighted bincount comes back as int64)
+        return np.bincount(episode, weights=daily[col].to_numpy(dtype=float)[rows],
+                           minlength=len(starts)).astype(float, copy=False)
+
+    base_units = np.concatenate([[0.0], np.cumsum(np.where(promo, 0.0, units))])
+    base_days = np.concatenate([[0], np.cumsum(~promo)])
+
+    def baseline(lo, hi):
+        a = np.searchsorted(key, sku_e * width + (lo - origin), side="left")
+        b = np.searchsorted(key, sku_e * width + (hi - origin), side="right")
+        n = base_days[b] - base_days[a]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return n, np.where(n > 0, (base_units[b] - base_units[a]) / n, np.nan)
+
+    pre_n, pre_units = baseline(start_day - window_days, start_day - 1)
+    post_n, post_units = baseline(end_day + 1, end_day + window_days)
+    sku_start = np.flatnonzero(np.append(True, sku_e[1:] != sku_e[:-1]))
+    promo_days = np.bincount(episode, minlength=len(starts))
+    units_e = total("units")
+
+    out = daily.iloc[starts][SKU_KEYS].reset_index(drop=True)
+    out["episode"] = np.arange(len(starts)) - np.repeat(sku_start, np.diff(np.append(sku_start, len(starts)))) + 1
+    out["start_date"] = daily["Date_Of_Sale"].to_numpy()[starts]
+    out["end_date"] = daily["Date_Of_Sale"].to_numpy()[ends]
+    out["span_days"] = end_day - start_day + 1
+    out["promo_days"] = promo_days
+    out["units"] = units_e
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out["units_per_day"] = units_e / promo_days
+        out["avg_discount_depth"] = total("depth_sum") / np.where(total("depth_n") > 0, total("depth_n"), np.nan)
+        out["avg_price"] = total("price_sum") / np.where(total("price_n") > 0, total("price_n"), np.nan)
+    out["pre_baseline_days"] = pre_n
+    out["pre_baseline_units"] = pre_units
+    out["post_baseline_days"] = post_n
+    out["post_baseline_units"] = post_units
+    pre = out["pre_baseline_units"]
+    out["episode_uplift_pct"] = (out["units_per_day"] - pre) / pre.where(pre > 0)
+    return out
+
+
+@timeit(logger, "detect_episodes")
+def detect_episodes(df: pd.DataFrame, discount_threshold: float = 0.10, window_days: int = 7,
+                    cache: AggregateCache | None = None) -> pd.DataFrame:
+    """Promo episodes with pre/post baselines (see episodes_from_daily)."""
+    daily = cached(cache, df, "daily_grain", daily_grain, discount_threshold=discount_threshold)
+    episodes = episodes_from_daily(daily, window_days)
+    logger.info("Promo episodes: %d over %d SKUs", len(episodes),
+                len(episodes.drop_duplicates(SKU_KEYS)) if len(episodes) else 0)
+    return episodes
+
+
+@timeit(logger, "detect_promotions")
+def detect_promotions(df: pd.DataFrame, discount_threshold: float = 0.10, promo_min_days: int = 2,
+                      cache: AggregateCache | None = None, consecutive: bool = False) -> pd.DataFrame:
+    """
+    Tag per-row promo flags and aggregate to SKU/store-level promo days, uplift and coverage.
+    Adds baseline vs promo average realised unit prices.
+    """
+    logger.info("Starting promo detection on %d rows", len(df))
+    daily = cached(cache, df, "daily_grain", daily_grain, discount_threshold=discount_threshold)
+    logger.info("Daily grain rows: %d", len(daily))
+    summary = summarize_daily(daily, promo_min_days, consecutive)
     logger.info("Promotion summary rows: %d", len(summary))
     return summary
+
+
+def promo_day_matrix(df: pd.DataFrame, thresholds: np.ndarray) -> np.ndarray:
+    """
+    Promo-day flags of the daily grain for every threshold at once (days × thresholds).
+
+    A row is on promo at t when price <= (1 - t) * rrp. With RRP > 0 that holds for
+    every t up to the row's discount depth, so the number of thresholds a row
+    clears is one searchsorted of its depth into the sorted grid (then checked
+    against the exact comparison at the boundary); a day clears the max over its
+    rows. The rare rows with RRP <= 0 are compared with each threshold directly.
+    thresholds must be sorted and unique.
+    """
+    dated = df["Date_Of_Sale"].notna().to_numpy()
+    keys = [df.loc[dated, k] for k in DAY_KEYS]
+    day = keys[0].groupby(keys, observed=True).ngroup().fillna(-1).to_numpy(dtype=np.int64)
+    n_days = day.max() + 1 if len(day) else 0
+    # rows with a null store or item belong to no day of the grain
+    price = np.where(day >= 0, df["realised_unit_price"].to_numpy(dtype=float)[dated], np.nan)
+    rrp = df["RRP"].to_numpy(dtype=float)[dated]
+    n_t = len(thresholds)
+
+    def clears(j, p, r):
+        jj = np.clip(j, 0, n_t - 1)
+        return (j >= 0) & (j < n_t) & (p <= (1 - thresholds[jj]) * r)
+
+    pos = rrp > 0
+    p, r = price[pos], rrp[pos]
+    with np.errstate(invalid="ignore"):
+        k = np.searchsorted(thresholds, (r - p) / r, side="right")
+        k = np.where(clears(k, p, r), k + 1, k)
+        k = np.where((k > 0) & ~clears(k - 1, p, r), k - 1, k)
+    k = np.where(np.isnan(p), 0, k)
+    cleared = np.zeros(n_days, dtype=np.int64)
+    np.maximum.at(cleared, day[pos], k)
+    matrix = np.arange(n_t)[None, :] < cleared[:, None]
+
+    odd = (rrp <= 0) & ~np.isnan(price)
+    if odd.any():
+        flags = price[odd, None] <= (1 - thresholds[None, :]) * rrp[odd, None]
+        np.logical_or.at(matrix, day[odd], flags)
+    return matrix
+
+
+@timeit(logger, "sweep_promotions")
+def sweep_promotions(df: pd.DataFrame, thresholds, min_days, cache: AggregateCache | None = None) -> pd.DataFrame:
+    """
+    Per-SKU uplift and coverage for every (discount threshold, min promo days)
+    combination in one pass, as a tidy table with one row per SKU per combination.
+
+    The daily grain is built once; only the promo-day flag depends on the
+    threshold, and it comes for the whole grid from promo_day_matrix. Values
+    match detect_promotions run with each combination.
+    """
+    thresholds = np.unique(np.asarray(list(thresholds), dtype=float))
+    min_days = sorted({int(m) for m in min_days})
+    logger.info("Sweeping %d thresholds × %d min-days values on %d rows", len(thresholds), len(min_days), len(df))
+    daily = cached(cache, df, "daily_grain", daily_grain, discount_threshold=float(thresholds[0]))
+    promo = promo_day_matrix(df, thresholds)
+    units = daily["units"].to_numpy(dtype=float)
+
+    by_sku = daily.groupby(SKU_KEYS, observed=True, sort=True)
+    sku_id = by_sku.ngroup().to_numpy()
+    n_sku = by_sku.ngroups
+    skus = by_sku.size().reset_index()[SKU_KEYS]
+    item_id, _ = pd.factorize(skus["Item_Code"])
+    item_skus = np.bincount(item_id)
+
+    frames = []
+    for j, thr in enumerate(thresholds):
+        uplift = _sku_uplift(sku_id, n_sku, promo[:, j], units)
+        for m in min_days:
+            on_promo = uplift["promo_days_count"].to_numpy() >= m
+            coverage = np.bincount(item_id, weights=on_promo, minlength=len(item_skus)) / item_skus
+            frames.append(pd.concat([skus, uplift], axis=1).assign(
+                on_promo=on_promo, promo_coverage_sku=coverage[item_id],
+                discount_threshold=thr, promo_min_days=m))
+    sweep = pd.concat(frames, ignore_index=True)
+    front = ["discount_threshold", "promo_min_days"]
+    sweep = sweep[front + [c for c in sweep.columns if c not in front]]
+    logger.info("Promo sweep rows: %d (%d SKUs × %d combinations)", len(sweep), n_sku, len(frames))
+    return sweep
@@ -1,11 +1,52 @@
-"""ydata-profiling integration."""
+"""Profile reports: the built-in sketch profile (JSON/HTML) and optional ydata-profiling."""
 from __future__ import annotations
-import os, pandas as pd
+import os, json, html, pandas as pd
 
-def generate_profile_html(df: pd.DataFrame, reports_dir: str, filename: str = "data_profile.html") -> str:
-    """Generate profiling HTML using ydata-profiling and return its path."""
+def generate_profile_html(df: pd.DataFrame, reports_dir: str, filename: str = "data_profile.html",
+                          sample_rows: int | None = None) -> str:
+    """Generate profiling HTML using ydata-profiling (optionally on a row sample) and return its path."""
     from ydata_profiling import ProfileReport
+    if sample_rows and len(df) > sample_rows:
+        df = df.sample(sample_rows, random_state=0)
     profile = ProfileReport(df, title="Bidco POS Data Profile", explorative=True, minimal=True)
     out_path = os.path.join(reports_dir, filename)
     profile.to_file(out_path)
     return out_path
+
+
+def _cell(v) -> str:
+    if v is None:
+        return ""
+    if isinstance(v, float):
+        return f"{v:,.4g}"
+    return html.escape(str(v))
+
+
+def write_profile_report(profile: dict, reports_dir: str, name: str = "data_profile") -> tuple[str, str]:
+    """Write a profiler.profile_frames result as JSON and a compact HTML table; return both paths."""
+    json_path = os.path.join(reports_dir, f"{name}.json")
+    with open(json_path, "w", encoding="utf-8") as fh:
+        json.dump(profile, fh, indent=2, default=str)
+
+    qnames = next((list(c["quantiles"]) for c in profile["columns"] if c["quantiles"]), [])
+    head = ["column", "kind", "null_rate", "distinct_approx", "min", "max"] + qnames + ["top values"]
+    rows = []
+    for c in profile["columns"]:
+        q = c["quantiles"] or {}
+        top = ", ".join(f"{t['value']} ({t['count']})" for t in c["top"][:5])
+        cells = [c["column"], c["kind"], c["null_rate"], c["distinct_approx"], c["min"], c["max"]]
+        cells += [q.get(n) for n in qnames] + [top]
+        rows.append("<tr>" + "".join(f"<td>{_cell(v)}</td>" for v in cells) + "</tr>")
+    page = (
+        "<!doctype html><html><head><meta charset='utf-8'><title>Data profile</title>"
+        "<style>body{font-family:sans-serif;font-size:13px}table{border-collapse:collapse}"
+        "td,th{border:1px solid #ccc;padding:3px 6px;text-align:left;vertical-align:top}</style></head><body>"
+        f"<h2>Data profile</h2><p>{profile['rows']:,} rows, {len(profile['columns'])} columns, "
+        f"{profile['chunks']} chunk(s). Distinct counts (HyperLogLog), quantiles (KLL) and top values "
+        "are approximate.</p><table><tr>" + "".join(f"<th>{html.escape(h)}</th>" for h in head) + "</tr>"
+        + "".join(rows) + "</table></body></html>"
+    )
+    html_path = os.path.join(reports_dir, f"{name}.html")
+    with open(html_path, "w", encoding="utf-8") as fh:
+        fh.write(page)
+    return json_path, html_path
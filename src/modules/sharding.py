@@ -0,0 +1,107 @@
+"""
+Store-sharded execution of the data-quality, promotions and pricing stages.
+
+The input is partitioned by Store_Name into row-balanced shards, each written as
+its own Arrow file so a worker only maps its stores. Workers return mergeable
+partials (health counters / store × item × day grain / supplier price sums)
+that the parent merges into the same final tables as the in-memory path.
+"""
+from __future__ import annotations
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from .logging_utils import get_logger, timeit
+from .scheduler import share_frame, load_shared_frame
+from .data_quality import dup_key_cols, flag_rows, partial_health, merge_health, finalize_health
+from .dq_rules import RuleSet, get_rules
+from .promotions import DAY_KEYS, daily_grain, summarize_daily
+from .pricing_index import supplier_grain, index_from_grain
+
+logger = get_logger(__name__)
+
+
+def plan_shards(df: pd.DataFrame, n_shards: int) -> list[list]:
+    """Assign stores to n_shards shards, largest first onto the lightest shard."""
+    sizes = df["Store_Name"].value_counts(dropna=True)
+    shards: list[list] = [[] for _ in range(max(1, min(n_shards, len(sizes))))]
+    load = np.zeros(len(shards))
+    for store, rows in sizes.items():
+        i = int(load.argmin())
+        shards[i].append(store)
+        load[i] += rows
+    return shards
+
+
+def _write_shards(df: pd.DataFrame, shards: list[list], directory: str) -> list[str]:
+    store = df["Store_Name"]
+    paths = []
+    for i, stores in enumerate(shards):
+        # rows without a store still count towards the supplier summary
+        mask = store.isin(stores) | (store.isna() if i == 0 else False)
+        paths.append(share_frame(df[mask], directory, f"shard-{i}"))
+    return paths
+
+
+def _health_shard(path: str, extreme_price_factor: float, key_cols: list[str] | None, rules: RuleSet):
+    df = load_shared_frame(path)
+    flags = flag_rows(df, extreme_price_factor, key_cols, rules=rules)
+    return (
+        partial_health(df, ["Store_Name"], flags=flags, rules=rules),
+        partial_health(df, ["Supplier"], flags=flags, rules=rules),
+    )
+
+
+def _promo_shard(path: str, discount_threshold: float) -> pd.DataFrame:
+    return daily_grain(load_shared_frame(path), discount_threshold)
+
+
+def _price_shard(path: str) -> pd.DataFrame:
+    return supplier_grain(load_shared_frame(path))
+
+
+def _map_shards(df: pd.DataFrame, jobs: int, n_shards: int, func, *params) -> list:
+    shards = plan_shards(df, n_shards or jobs)
+    logger.info("Sharding %d rows by store into %d shards over %d workers", len(df), len(shards), jobs)
+    scratch = tempfile.mkdtemp(prefix="fmcg-shards-")
+    try:
+        paths = _write_shards(df, shards, scratch)
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            return list(pool.map(func, paths, *[[p] * len(paths) for p in params]))
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+@timeit(logger, "score_health_sharded")
+def score_health_sharded(df: pd.DataFrame, extreme_price_factor: float = 10.0, jobs: int = 2, n_shards: int = 0,
+                         rules: RuleSet | None = None):
+    """score_health over store shards; supplier-level results are merged from partial counters."""
+    rules = rules or get_rules()
+    # the duplicate key choice depends on the whole frame, so it is made once up front
+    key_cols = dup_key_cols(df, rules)
+    parts = _map_shards(df, jobs, n_shards, _health_shard, extreme_price_factor, key_cols, rules)
+    store = finalize_health(*merge_health([p[0] for p in parts], ["Store_Name"]), ["Store_Name"], rules)
+    supplier = finalize_health(*merge_health([p[1] for p in parts], ["Supplier"]), ["Supplier"], rules)
+    logger.info("Health summaries — stores: %d, suppliers: %d", len(store), len(supplier))
+    return store, supplier
+
+
+@timeit(logger, "detect_promotions_sharded")
+def detect_promotions_sharded(df: pd.DataFrame, discount_threshold: float = 0.10, promo_min_days: int = 2,
+                              jobs: int = 2, n_shards: int = 0, consecutive: bool = False) -> pd.DataFrame:
+    """detect_promotions with the daily grain built per store shard; cross-store KPIs use the merged grain."""
+    parts = _map_shards(df, jobs, n_shards, _promo_shard, discount_threshold)
+    # restore the in-memory grain order so downstream sums add up in the same order
+    daily = pd.concat(parts, ignore_index=True).sort_values(DAY_KEYS, ignore_index=True)
+    logger.info("Daily grain rows: %d", len(daily))
+    summary = summarize_daily(daily, promo_min_days, consecutive)
+    logger.info("Promotion summary rows: %d", len(summary))
+    return summary
+
+
+@timeit(logger, "compute_price_index_sharded")
+def compute_price_index_sharded(df: pd.DataFrame, jobs: int = 2, n_shards: int = 0):
+    """compute_price_index from supplier price sums built per store shard (the roll-up spans stores)."""
+    logger.info("Computing price index on %d rows", len(df))
+    return index_from_grain(pd.concat(_map_shards(df, jobs, n_shards, _price_shard), ignore_index=True))
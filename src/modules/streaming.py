@@ -0,0 +1,174 @@
+"""
+Chunked data-quality scoring for inputs larger than memory.
+
+The source is read chunk by chunk (io_ops.iter_source) and folded into the same
+mergeable counters score_health uses: flagged-row counts per group and RRP
+n/mean/var per group × Item_Code. Duplicates can span chunks, so the duplicate
+rule's keys are tracked as 64-bit hashes with their row counts; a second, column-projected
+pass then counts the rows whose key occurs more than once per group. Memory is
+bounded by the distinct groups, group × item pairs and key hashes, not by rows.
+"""
+from __future__ import annotations
+import numpy as np
+import pandas as pd
+from .logging_utils import get_logger, timeit
+from .io_ops import iter_source
+from .data_quality import flag_rows, _merge_moments, finalize_health
+from .dq_rules import RuleSet, count_flags, get_rules, key_hash
+
+logger = get_logger(__name__)
+
+GROUPS = ["Store_Name", "Supplier"]
+COMPACT_AT = 4_000_000  # pending hash / moment entries before they are merged
+
+
+class _Ids:
+    """Stable integer ids for the values of a column across chunks (-1 for nulls)."""
+
+    def __init__(self):
+        self.ids: dict = {}
+        self.values: list = []
+
+    def encode(self, s: pd.Series) -> np.ndarray:
+        codes, uniques = pd.factorize(s)
+        lookup = np.empty(len(uniques) + 1, dtype=np.int64)
+        for i, v in enumerate(uniques):
+            if v not in self.ids:
+                self.ids[v] = len(self.values)
+                self.values.append(v)
+            lookup[i] = self.ids[v]
+        lookup[-1] = -1
+        return lookup[codes]
+
+
+class _HashCounts:
+    """Row counts per 64-bit key hash, kept as sorted unique arrays."""
+
+    def __init__(self):
+        self.keys = np.empty(0, dtype=np.uint64)
+        self.counts = np.empty(0, dtype=np.int64)
+        self.pending: list[tuple[np.ndarray, np.ndarray]] = []
+        self.n_pending = 0
+
+    def add(self, h: np.ndarray) -> None:
+        keys, counts = np.unique(h, return_counts=True)
+        self.pending.append((keys, counts))
+        self.n_pending += len(keys)
+        if self.n_pending >= COMPACT_AT:
+            self._compact()
+
+    def _compact(self) -> None:
+        keys = np.concatenate([self.keys] + [k for k, _ in self.pending])
+        counts = np.concatenate([self.counts] + [c for _, c in self.pending])
+        self.keys, inverse = np.unique(keys, return_inverse=True)
+        self.counts = np.bincount(inverse, weights=counts).astype(np.int64)
+        self.pending, self.n_pending = [], 0
+
+    def repeated(self) -> np.ndarray:
+        """Sorted hashes seen on more than one row."""
+        self._compact()
+        return self.keys[self.counts > 1]
+
+
+def _count_by(ids: np.ndarray, words: np.ndarray, names, acc: pd.DataFrame | None) -> pd.DataFrame:
+    valid = ids >= 0
+    part = count_flags([ids[valid]], words[valid], names)
+    return part if acc is None else acc.add(part, fill_value=0)
+
+
+def _rrp_moments(rrp: pd.Series, gid: np.ndarray, iid: np.ndarray) -> pd.DataFrame:
+    valid = (gid >= 0) & (iid >= 0)
+    r = rrp[valid].groupby([gid[valid], iid[valid]])
+    out = pd.DataFrame({"n": r.count(), "mean": r.mean(), "var": r.var()})
+    out.index.names = ["g", "item"]
+    return out.reset_index()
+
+
+def _fold_moments(parts: list[pd.DataFrame], force: bool = False) -> list[pd.DataFrame]:
+    """Merge pending moment partials into one table once they outgrow COMPACT_AT (or when forced)."""
+    if len(parts) > 1 and (force or sum(len(p) for p in parts[1:]) >= COMPACT_AT):
+        parts = [_merge_moments(pd.concat(parts, ignore_index=True), ["g", "item"])]
+    return parts
+
+
+def _group_table(acc: pd.DataFrame, ids: _Ids, group: str) -> pd.DataFrame:
+    out = acc.astype("int64")
+    out.insert(0, group, [ids.values[i] for i in out.index])
+    return out
+
+
+@timeit(logger, "score_health_stream")
+def score_health_stream(path: str, chunk_rows: int = 1_000_000, extreme_price_factor: float = 10.0,
+                        rules: RuleSet | None = None):
+    """
+    score_health over a CSV/Parquet file read in chunks of chunk_rows rows.
+
+    Returns the same (store, supplier) tables as the in-memory path: counts are
+    exact, and RRP moments of items spanning chunks are merged (so avg_rrp_std
+    can differ from a one-shot computation in the last floating-point bits).
+    Key hashes are 64-bit, so a false duplicate needs a hash collision.
+    """
+    rules = rules or get_rules()
+    dup = rules.duplicate
+    gids = {g: _Ids() for g in GROUPS}
+    items = _Ids()
+    counts = {g: None for g in GROUPS}
+    moments = {g: [] for g in GROUPS}
+    primary = _HashCounts()
+    primary_has_nulls = False
+    n_rows = n_chunks = 0
+
+    for chunk in iter_source(path, chunk_rows):
+        n_rows += len(chunk)
+        n_chunks += 1
+        flags = flag_rows(chunk, extreme_price_factor, with_dups=False, rules=rules)
+        iid = items.encode(chunk["Item_Code"])
+        for g in GROUPS:
+            gid = gids[g].encode(chunk[g])
+            counts[g] = _count_by(gid, flags, rules.flags, counts[g])
+            moments[g] = _fold_moments(moments[g] + [_rrp_moments(chunk["RRP"], gid, iid)])
+        if dup is not None:
+            primary_has_nulls = primary_has_nulls or bool(chunk[dup["keys"]].isna().any().any())
+            if not primary_has_nulls or not dup.get("fallback"):
+                primary.add(key_hash(chunk, dup["keys"]))
+        logger.debug("Chunk %d folded (%d rows so far)", n_chunks, n_rows)
+    logger.info("Scored %d rows in %d chunks of up to %d rows", n_rows, n_chunks, chunk_rows)
+
+    dups = {g: None for g in GROUPS}
+    if dup is not None:
+        # the duplicate key choice depends on every row, so it is only known now
+        key_cols, hashes = dup["keys"], primary
+        if primary_has_nulls and dup.get("fallback"):
+            key_cols = dup["fallback"]
+            logger.info("Duplicate key columns have nulls; hashing the fallback key %s", key_cols)
+            hashes = _HashCounts()
+            for chunk in iter_source(path, chunk_rows, key_cols):
+                hashes.add(key_hash(chunk, key_cols))
+        repeated = hashes.repeated()
+        logger.info("Duplicate keys: %d hashes seen on more than one row", len(repeated))
+
+        for chunk in iter_source(path, chunk_rows, key_cols + GROUPS):
+            h = key_hash(chunk, key_cols)
+            pos = np.minimum(np.searchsorted(repeated, h), max(len(repeated) - 1, 0))
+            is_dup = (repeated[pos] == h) if len(repeated) else np.zeros(len(h), bool)
+            for g in GROUPS:
+                dups[g] = _count_by(gids[g].encode(chunk[g]), is_dup.astype(np.uint8), [dup["name"]], dups[g])
+
+    out = []
+    for g in GROUPS:
+        acc = counts[g]
+        if dups[g] is not None:
+            acc = acc.drop(columns=dup["name"]).join(dups[g].drop(columns="rows")).fillna(0)
+        table = _group_table(acc, gids[g], g)
+        table = table.sort_values(g, ignore_index=True)[[g, "rows", *rules.flags]]
+        # item order matters to the float sums in finalize_health, so match score_health's
+        rrp = _fold_moments(moments[g], force=True)[0]
+        rrp = rrp.assign(**{g: [gids[g].values[i] for i in rrp["g"]],
+                            "Item_Code": [items.values[i] for i in rrp["item"]]})
+        rrp = rrp.sort_values([g, "Item_Code"], ignore_index=True)
+        health = finalize_health(table, rrp, [g], rules)
+        health[g] = health[g].astype(pd.CategoricalDtype(ordered=True))  # as load_any types dimensions
+        out.append(health)
+    store, supplier = out
+    logger.info("Health summaries — stores: %d, suppliers: %d", len(store), len(supplier))
+    return store, supplier
@@ -0,0 +1,141 @@
+"""
+Synthetic POS data shaped like a real extract, for scaling benchmarks.
+
+fit_profile captures what matters for the pipeline from a loaded frame (store
+and item mix, Bidco share, quantity and price/RRP distributions, duplicate,
+bad-RRP and missing-supplier rates); generate/iter_chunks draw any number of
+rows from it, extending the calendar as the row count grows.
+"""
+from __future__ import annotations
+import numpy as np
+import pandas as pd
+from .logging_utils import get_logger
+from .pricing_index import _is_bidco
+
+logger = get_logger(__name__)
+
+ITEM_ATTRS = ["Item_Barcode", "Description", "Category", "Department", "Sub_Department", "Section", "Supplier"]
+
+
+def fit_profile(df: pd.DataFrame) -> dict:
+    """Summarize the distributions of a standardized frame (output of load_any)."""
+    coded = df.dropna(subset=["Item_Code"])
+    g = coded.groupby("Item_Code", observed=True)
+    items = (
+        pd.DataFrame({"rows": g.size(), "rrp": g["RRP"].median()})
+        .join(coded.drop_duplicates("Item_Code").set_index("Item_Code")[ITEM_ATTRS])
+        .reset_index()
+    )
+    for c in ITEM_ATTRS:
+        if isinstance(items[c].dtype, pd.CategoricalDtype):
+            items[c] = items[c].astype(object)
+    items["rrp"] = items["rrp"].fillna(df["RRP"].median())
+    ratio = (df["realised_unit_price"] / df["RRP"]).replace([np.inf, -np.inf], np.nan).dropna()
+    qty = df["Quantity"].dropna().value_counts(normalize=True)
+    stores = df["Store_Name"].value_counts(normalize=True)
+    dates = df["Date_Of_Sale"].dropna()
+    n_days = max(1, dates.nunique())
+    key = ["Store_Name", "Date_Of_Sale", "Item_Code"]
+    return {
+        "stores": stores.index.astype(str).tolist(),
+        "store_p": stores.to_numpy(),
+        "items": items,
+        "bidco_share": float(_is_bidco(df["Supplier"]).mean()),
+        "qty_values": qty.index.to_numpy(dtype=float),
+        "qty_p": qty.to_numpy(),
+        "price_ratio": ratio.to_numpy(dtype=float),
+        "dup_rate": float(df.duplicated(subset=key).mean()),
+        "bad_rrp_rate": float(((df["RRP"] <= 0) | df["RRP"].isna()).mean()),
+        "missing_supplier_rate": float(df["Supplier"].isna().mean()),
+        "start_date": dates.min() if len(dates) else pd.Timestamp("2025-01-01"),
+        "rows_per_day": len(df) / n_days,
+    }
+
+
+def _item_weights(profile: dict, bidco_share: float | None) -> np.ndarray:
+    items = profile["items"]
+    w = items["rows"].to_numpy(dtype=float)
+    w /= w.sum()
+    share = profile["bidco_share"] if bidco_share is None else bidco_share
+    bidco = _is_bidco(items["Supplier"])
+    if bidco.any() and (~bidco).any():
+        w[bidco] *= share / w[bidco].sum()
+        w[~bidco] *= (1 - share) / w[~bidco].sum()
+    return w
+
+
+def iter_chunks(profile: dict, n_rows: int, chunk_rows: int = 1_000_000, seed: int = 0,
+                bidco_share: float | None = None):
+    """Yield standardized frames totalling n_rows; the calendar grows with n_rows."""
+    rng = np.random.default_rng(seed)
+    items = profile["items"]
+    item_w = _item_weights(profile, bidco_share)
+    n_days = max(1, int(np.ceil(n_rows / profile["rows_per_day"])))
+    start = pd.Timestamp(profile["start_date"]).normalize()
+    # fixed dtypes and item -> code lookups, so every chunk shares one dictionary per column
+    store_dtype = pd.CategoricalDtype(sorted(profile["stores"]), ordered=True)
+    store_codes = store_dtype.categories.get_indexer(profile["stores"])
+    dtypes = {c: pd.CategoricalDtype(sorted(items[c].dropna().unique()), ordered=True)
+              for c in ["Item_Code"] + ITEM_ATTRS if c != "Item_Barcode"}
+    item_codes = {c: dt.categories.get_indexer(items[c]) for c, dt in dtypes.items()}
+    barcodes = items["Item_Barcode"].to_numpy()
+    item_rrp = items["rrp"].to_numpy(dtype=float)
+    done = 0
+    while done < n_rows:
+        n = min(chunk_rows, n_rows - done)
+        it = rng.choice(len(items), size=n, p=item_w)
+        store = rng.choice(len(profile["stores"]), size=n, p=profile["store_p"])
+        day = rng.integers(0, n_days, size=n)
+        if profile["dup_rate"] > 0 and n > 1:
+            # duplicates: copy the store/day/item key of another row in the chunk
+            dup = rng.random(n) < profile["dup_rate"]
+            src = rng.integers(0, n, size=int(dup.sum()))
+            it[dup], store[dup], day[dup] = it[src], store[src], day[src]
+        qty = rng.choice(profile["qty_values"], size=n, p=profile["qty_p"])
+        rrp = item_rrp[it] * rng.uniform(0.97, 1.03, size=n)
+        ratio = rng.choice(profile["price_ratio"], size=n) if len(profile["price_ratio"]) else np.ones(n)
+        bad = rng.random(n) < profile["bad_rrp_rate"]
+        sales = qty * rrp * ratio
+        rrp[bad] = np.where(rng.random(int(bad.sum())) < 0.5, 0.0, np.nan)
+        frame = {"Store_Name": pd.Categorical.from_codes(store_codes[store], dtype=store_dtype)}
+        for c in ["Item_Code"] + ITEM_ATTRS:
+            if c == "Item_Barcode":
+                frame[c] = barcodes[it]
+            else:
+                frame[c] = pd.Categorical.from_codes(item_codes[c][it], dtype=dtypes[c])
+        chunk = pd.DataFrame(frame)
+        chunk["Quantity"] = qty
+        chunk["Total_Sales"] = sales
+        chunk["RRP"] = rrp
+        missing = rng.random(n) < profile["missing_supplier_rate"]
+        chunk.loc[missing, "Supplier"] = np.nan
+        chunk["Date_Of_Sale"] = start + pd.to_timedelta(day, unit="D")
+        chunk["realised_unit_price"] = np.where(qty > 0, sales / np.where(qty > 0, qty, 1), np.nan)
+        chunk = chunk[["Store_Name", "Item_Code", "Item_Barcode", "Description", "Category", "Department",
+                       "Sub_Department", "Section", "Quantity", "Total_Sales", "RRP", "Supplier",
+                       "Date_Of_Sale", "realised_unit_price"]]
+        done += n
+        yield chunk
+
+
+def generate(profile: dict, n_rows: int, seed: int = 0, bidco_share: float | None = None) -> pd.DataFrame:
+    """Draw n_rows synthetic rows in the load_any schema."""
+    return pd.concat(list(iter_chunks(profile, n_rows, seed=seed, bidco_share=bidco_share)), ignore_index=True)
+
+
+def write_parquet(profile: dict, n_rows: int, path: str, seed: int = 0, bidco_share: float | None = None) -> str:
+    """Stream n_rows synthetic rows to a Parquet file without holding them all in memory."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    writer = None
+    try:
+        for chunk in iter_chunks(profile, n_rows, seed=seed, bidco_share=bidco_share):
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+    logger.info("Wrote %d synthetic rows to %s", n_rows, path)
+    return path
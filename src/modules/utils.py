@@ -1,6 +1,7 @@
 """Utilities for argparse and logging."""
 from __future__ import annotations
 import argparse, logging, os
+from .outputs import CSV_COMPRESSION, PARQUET_COMPRESSION
 
 def setup_logging(verbosity: int = 1) -> None:
     """Configure logging."""
@@ -14,20 +15,50 @@ def setup_logging(verbosity: int = 1) -> None:
 def parse_args() -> argparse.Namespace:
     """Parse CLI args and ensure output directories exist."""
     p = argparse.ArgumentParser(prog="fmcgBusinessCase", description="KPIs pipeline")
-    p.add_argument("--input_path", default="C:/Users/jkab0/OneDrive/Documents/GitHub/fmcgBusinessCase/data/Test_Data.xlsx")
+    p.add_argument("--input_path", default="C:/Users/jkab0/OneDrive/Documents/GitHub/fmcgBusinessCase/data/Test_Data.xlsx", help="file, directory or glob (quote it); every sheet of a multi-sheet workbook is read")
+    p.add_argument("--load_jobs", type=int, default=0, help="processes parsing a multi-file input (0 = one per CPU)")
     p.add_argument("--output_dir", default="C:/Users/jkab0/OneDrive/Documents/GitHub/fmcgBusinessCase/output")
     p.add_argument("--reports_dir", default="C:/Users/jkab0/OneDrive/Documents/GitHub/fmcgBusinessCase/reports")
     p.add_argument("--viz_dir", default="C:/Users/jkab0/OneDrive/Documents/GitHub/fmcgBusinessCase/viz")
+    p.add_argument("--state_dir", default="C:/Users/jkab0/OneDrive/Documents/GitHub/fmcgBusinessCase/state")
+    p.add_argument("--reset_state", action="store_true", help="ingest: discard the stored aggregates and start over")
+    p.add_argument("--cache_dir", default="C:/Users/jkab0/OneDrive/Documents/GitHub/fmcgBusinessCase/.cache")
+    p.add_argument("--no_cache", action="store_true", help="parse the input directly, bypassing the load cache")
+    p.add_argument("--rebuild_cache", action="store_true", help="reparse the input and overwrite its cache entry")
     p.add_argument("--promo_discount_threshold", type=float, default=0.10)
     p.add_argument("--promo_min_days", type=int, default=2)
+    p.add_argument("--promo_consecutive", action="store_true", help="on_promo needs promo_min_days consecutive promo days (one episode)")
+    p.add_argument("--episode_window_days", type=int, default=7, help="days before/after a promo episode used as its baseline")
     p.add_argument("--extreme_price_factor", type=float, default=10.0)
-    p.add_argument("--save_parquet", action="store_true")
+    p.add_argument("--dq_rules", default=None, help="data-quality/ingest: JSON file of health rules and score weights (default: the built-in rules)")
+    p.add_argument("--sweep_thresholds", default="0.05,0.10,0.15,0.20,0.25", help="promos-sweep: comma-separated discount thresholds")
+    p.add_argument("--sweep_min_days", default="1,2,3,5", help="promos-sweep: comma-separated minimum promo days")
+    p.add_argument("--save_parquet", action="store_true", help="same as --output_format both")
+    p.add_argument("--output_format", choices=["csv","parquet","both"], default=None, help="output tables as CSV, Parquet or both (default csv)")
+    p.add_argument("--partition_by", default="", help="comma-separated store,date: write tables with those columns as Hive-style directories")
+    p.add_argument("--csv_compression", choices=list(CSV_COMPRESSION), default="none")
+    p.add_argument("--parquet_compression", choices=list(PARQUET_COMPRESSION), default="snappy")
+    p.add_argument("--writer_threads", type=int, default=2, help="background threads writing output tables (0 = write inline)")
+    p.add_argument("--engine", choices=["pandas","duckdb"], default="pandas", help="data-quality/promos/pricing/run-all: compute in pandas or as DuckDB SQL over the input files")
+    p.add_argument("--duckdb_threads", type=int, default=0, help="--engine duckdb: worker threads (0 = one per CPU)")
+    p.add_argument("--duckdb_memory_limit", default="", help="--engine duckdb: memory cap, e.g. 4GB; larger intermediates spill to --duckdb_temp_dir")
+    p.add_argument("--duckdb_temp_dir", default="", help="--engine duckdb: spill directory (default: DuckDB's own)")
+    p.add_argument("--jobs", type=int, default=1, help="worker processes for run-all stages (1 = sequential)")
+    p.add_argument("--shards", type=int, default=0, help="split data-quality/promos/pricing index by store into N shards run on --jobs workers (0 = off)")
+    p.add_argument("--chunk_rows", type=int, default=0, help="data-quality/profile: stream a CSV/Parquet input in chunks of N rows (0 = load it whole)")
+    p.add_argument("--ydata", action="store_true", help="profile: run ydata-profiling instead of the built-in profiler")
+    p.add_argument("--ydata_sample", type=int, default=0, help="profile --ydata: profile a random sample of N rows (0 = all)")
+    p.add_argument("--trace_memory", action="store_true", help="record tracemalloc peaks per stage (slower)")
+    p.add_argument("--profile_stages", default="", help="comma-separated timeit labels to profile, or 'all'")
+    p.add_argument("--profiler", choices=["cprofile","sampling"], default="cprofile", help="sampling uses pyinstrument if installed")
     p.add_argument("-v","--verbose", action="count", default=0)
     sub = p.add_subparsers(dest="command", required=True)
-    for cmd in ["data-quality","promos","pricing","profile","run-all"]:
+    for cmd in ["data-quality","promos","promos-sweep","pricing","profile","run-all","ingest"]:
         sub.add_parser(cmd)
     args = p.parse_args()
     os.makedirs(args.output_dir, exist_ok=True)
     os.makedirs(args.reports_dir, exist_ok=True)
     os.makedirs(args.viz_dir, exist_ok=True)
+    if not args.no_cache:
+        os.makedirs(args.cache_dir, exist_ok=True)
     return args
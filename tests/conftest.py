@@ -0,0 +1,62 @@
+"""Shared fixtures: a small hand-built sales extract and the sample workbook."""
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+sys.path.insert(0, os.path.join(ROOT, "viz"))
+
+SAMPLE = os.path.join(ROOT, "data", "Test_Data.xlsx")
+
+ITEMS = [  # item code, description, supplier, sub-department, section, RRP
+    (101, "BIDCO OIL 1L", "BIDCO AFRICA", "FOODS", "OILS", 300.0),
+    (102, "PEER OIL 1L", "PEER FOODS", "FOODS", "OILS", 280.0),
+    (201, "BIDCO SOAP", "BIDCO AFRICA", "HOME", "SOAPS", 120.0),
+    (301, "PEER TEA", "PEER FOODS", "FOODS", "TEA", 90.0),
+]
+
+
+def make_sales() -> pd.DataFrame:
+    """Two stores × four items over ten days, with a promo run and a few bad rows."""
+    rows = []
+    for store in ("STORE A", "STORE B"):
+        for code, desc, supplier, sub, section, rrp in ITEMS:
+            for day in range(1, 11):
+                qty = 2.0 + (code + day) % 3
+                price = rrp
+                if store == "STORE A" and code == 101 and day in (4, 5, 6):
+                    price, qty = rrp * 0.8, qty + 6  # a three-day promo
+                rows.append({"Store_Name": store, "Item_Code": code, "Item_Barcode": 6000000 + code,
+                             "Description": desc, "Category": "FMCG", "Department": "GROCERY",
+                             "Sub_Department": sub, "Section": section, "Quantity": qty,
+                             "Total_Sales": qty * price, "RRP": rrp, "Supplier": supplier,
+                             "Date_Of_Sale": pd.Timestamp("2025-01-01") + pd.Timedelta(days=day - 1)})
+    df = pd.DataFrame(rows)
+    df.loc[12, "Quantity"] = -1.0           # a return
+    df.loc[15, "RRP"] = np.nan              # missing RRP
+    df.loc[25, "Supplier"] = None           # missing supplier
+    return pd.concat([df, df.iloc[[7]]], ignore_index=True)  # one duplicated row
+
+
+@pytest.fixture
+def sales_path(tmp_path) -> str:
+    path = tmp_path / "sales.csv"
+    make_sales().to_csv(path, index=False)
+    return str(path)
+
+
+@pytest.fixture
+def sales(sales_path) -> pd.DataFrame:
+    from modules.io_ops import load_any
+    return load_any(sales_path)
+
+
+@pytest.fixture(scope="session")
+def sample() -> pd.DataFrame:
+    if not os.path.exists(SAMPLE):
+        pytest.skip("sample workbook not available")
+    from modules.io_ops import load_any
+    return load_any(SAMPLE)
@@ -0,0 +1,44 @@
+import pandas as pd
+import pytest
+from data_access import CUBE_KEYS, OutputStore
+from modules.outputs import OutputWriter
+from modules.pricing_index import price_cube, supplier_grain
+
+
+@pytest.mark.parametrize("fmt", ["csv", "parquet"])
+@pytest.mark.parametrize("partition_by", [(), ("store",), ("store", "date")])
+def test_tables_keep_the_written_column_order(sales, tmp_path, fmt, partition_by):
+    df = sales.rename(columns={"Date_Of_Sale": "date"})
+    OutputWriter(str(tmp_path), fmt, partition_by).write(df, "sales")
+    store = OutputStore(str(tmp_path))
+    assert store.table("sales").column_names == list(df.columns)
+    assert store.table("sales", store="STORE B").column_names == list(df.columns)
+    assert store.table("sales", ["Quantity", "Store_Name"]).column_names == ["Quantity", "Store_Name"]
+
+
+@pytest.mark.parametrize("fmt", ["csv", "parquet"])
+@pytest.mark.parametrize("partition_by", [(), ("store",)])
+def test_cube_lookup_matches_a_filtered_scan(sales, tmp_path, fmt, partition_by):
+    cube = price_cube(supplier_grain(sales))
+    OutputWriter(str(tmp_path), fmt, partition_by).write(cube, "price_index_cube")
+    store = OutputStore(str(tmp_path))
+    scan = store.frame("price_index_cube")
+    for _, row in cube.iterrows():
+        node = tuple(None if pd.isna(v) else v for v in row[CUBE_KEYS])
+        hit = pd.Series(True, index=scan.index)
+        for col, v in zip(CUBE_KEYS, node):
+            hit &= scan[col].isna() if v is None else scan[col] == v
+        expected = scan[hit].reset_index(drop=True)
+        assert len(expected) == 1
+        pd.testing.assert_frame_equal(store.lookup("price_index_cube", CUBE_KEYS, node), expected)
+    assert store.lookup("price_index_cube", CUBE_KEYS, (3, "NO SUCH STORE", None, None)).empty
+
+
+@pytest.mark.parametrize("fmt", ["csv", "parquet"])
+@pytest.mark.parametrize("partition_by", [(), ("store",)])
+def test_no_columns_selects_no_columns(sales, tmp_path, fmt, partition_by):
+    OutputWriter(str(tmp_path), fmt, partition_by).write(sales, "sales")
+    store = OutputStore(str(tmp_path))
+    assert store.table("sales", []).column_names == []
+    view, total = store.page("sales", [("Quantity", "ascending")], 0, 10, columns=[])
+    assert list(view.columns) == [] and total == len(sales)
@@ -0,0 +1,37 @@
+import copy
+import pytest
+from modules.data_quality import score_health
+from modules.dq_rules import DEFAULT_RULES, RuleSet
+
+
+def rules_with(**changes) -> dict:
+    """DEFAULT_RULES with the extreme_price rule updated by changes."""
+    config = copy.deepcopy(DEFAULT_RULES)
+    next(r for r in config["rules"] if r["name"] == "extreme_price").update(changes)
+    return config
+
+
+@pytest.mark.parametrize("changes", [{"column": "Unit_Price"}, {"ref": "rrp"}])
+def test_unknown_column_names_the_rule(changes):
+    with pytest.raises(ValueError, match="rule 'extreme_price' refers to unknown columns"):
+        RuleSet(rules_with(**changes))
+
+
+def test_unknown_key_column_names_the_rule():
+    config = copy.deepcopy(DEFAULT_RULES)
+    config["rules"][1]["fallback"] = ["Store_Name", "Barcode"]
+    with pytest.raises(ValueError, match=r"rule 'dup_key' refers to unknown columns \['Barcode'\]"):
+        RuleSet(config)
+
+
+@pytest.mark.parametrize("factor", [0, -2.5, None])
+def test_factor_must_be_positive(factor):
+    with pytest.raises(ValueError, match="rule 'extreme_price' needs a factor > 0"):
+        RuleSet(rules_with(factor=factor))
+
+
+def test_factor_parameter_is_checked_when_resolved(sales):
+    rules = RuleSet(rules_with())
+    score_health(sales, 3.0, rules=rules)
+    with pytest.raises(ValueError, match="rule 'extreme_price' needs a factor > 0"):
+        score_health(sales, 0.0, rules=rules)
@@ -0,0 +1,50 @@
+import sys
+import pytest
+from benchmark import frame_diffs
+from modules.data_quality import score_health
+from modules.promotions import daily_grain, detect_promotions, episodes_from_daily
+from modules.pricing_index import compute_price_index
+from modules.duckdb_engine import DuckDBEngine
+
+pytest.importorskip("duckdb")  # the engine is optional; see requirements.txt
+
+
+def assert_same(expected, got):
+    expected = expected if isinstance(expected, tuple) else (expected,)
+    got = got if isinstance(got, tuple) else (got,)
+    for a, b in zip(expected, got):
+        assert frame_diffs(a, b, 1e-9) == []
+
+
+@pytest.fixture(params=["scan", "frame"])
+def engine(request, sales_path, sales):
+    """The engine over the CSV file (scanned by DuckDB) and over the loaded frame."""
+    return DuckDBEngine(sales_path if request.param == "scan" else sales)
+
+
+def test_health_parity(engine, sales):
+    assert_same(score_health(sales), engine.score_health())
+    assert_same(score_health(sales, 3.0), engine.score_health(3.0))
+
+
+@pytest.mark.parametrize("consecutive", [False, True])
+def test_promo_parity(engine, sales, consecutive):
+    assert_same(detect_promotions(sales, consecutive=consecutive), engine.detect_promotions(consecutive=consecutive))
+    assert_same(episodes_from_daily(daily_grain(sales)), episodes_from_daily(engine.daily_grain()))
+
+
+def test_promo_parity_without_promo_days(engine, sales):
+    assert_same(detect_promotions(sales, 2.0), engine.detect_promotions(2.0))
+    episodes = episodes_from_daily(engine.daily_grain(2.0))
+    assert episodes.empty
+    assert_same(episodes_from_daily(daily_grain(sales, 2.0)), episodes)
+
+
+def test_price_parity(engine, sales):
+    assert_same(compute_price_index(sales), engine.compute_price_index())
+
+
+def test_missing_duckdb_is_reported(monkeypatch, sales):
+    monkeypatch.setitem(sys.modules, "duckdb", None)
+    with pytest.raises(ImportError, match="--engine duckdb needs the duckdb package"):
+        DuckDBEngine(sales)
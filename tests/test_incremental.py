@@ -0,0 +1,83 @@
+import json
+import pandas as pd
+import pytest
+from modules.incremental import ingest, outputs_from_state
+
+DAY = pd.Timestamp("2025-01-03")
+
+
+def _outputs(batches, state_dir):
+    tables = None
+    for i, batch in enumerate(batches):
+        tables = ingest(batch, str(state_dir), reset=i == 0)
+    return outputs_from_state(tables)
+
+
+def _series(df):
+    """The price series in a fixed row order (ingest appends windows in batch order)."""
+    keys = ["period", "date", "grouping_id", "Store_Name", "Sub_Department", "Section"]
+    return df.astype({k: object for k in keys[3:]}).sort_values(keys, ignore_index=True)
+
+
+def _assert_same(a, b):
+    for name in ("data_quality_store", "data_quality_supplier", "promo_summary", "price_index"):
+        pd.testing.assert_frame_equal(a[name].reset_index(drop=True), b[name].reset_index(drop=True),
+                                      check_dtype=False, check_categorical=False, rtol=1e-9, obj=name)
+    pd.testing.assert_frame_equal(_series(a["price_index_series"]), _series(b["price_index_series"]),
+                                  check_dtype=False, rtol=1e-9, obj="price_index_series")
+
+
+def test_partial_day_batch_keeps_other_stores(sales, tmp_path):
+    """A late file with one store's day replaces only that store's rows for the day."""
+    late = sales[(sales["Store_Name"] == "STORE A") & (sales["Date_Of_Sale"] == DAY)].copy()
+    late["Quantity"] *= 2
+    late["Total_Sales"] *= 2
+    tables = ingest(sales, str(tmp_path / "state"), reset=True)
+    before = tables["promo_daily"]
+    tables = ingest(late, str(tmp_path / "state"))
+    daily = tables["promo_daily"]
+
+    on_day = daily[daily["Date_Of_Sale"] == DAY]
+    assert set(on_day["Store_Name"]) == {"STORE A", "STORE B"}
+    b_rows = lambda d: d[(d["Store_Name"] == "STORE B") & (d["Date_Of_Sale"] == DAY)].reset_index(drop=True)
+    pd.testing.assert_frame_equal(b_rows(daily), b_rows(before))
+    assert len(daily) == len(before)
+
+    corrected = pd.concat([sales.drop(late.index), late]).sort_index()
+    _assert_same(outputs_from_state(tables), _outputs([corrected], tmp_path / "fresh"))
+
+
+def test_store_batches_match_one_batch(sales, tmp_path):
+    by_store = [g for _, g in sales.dropna(subset=["Store_Name"]).groupby("Store_Name", observed=True)]
+    _assert_same(_outputs(by_store, tmp_path / "split"), _outputs([sales], tmp_path / "whole"))
+
+
+def test_old_state_layout_needs_reset(sales, tmp_path):
+    ingest(sales, str(tmp_path / "state"), reset=True)
+    meta_path = tmp_path / "state" / "state.json"
+    meta = json.loads(meta_path.read_text())
+    meta["version"] = 1
+    meta_path.write_text(json.dumps(meta))
+    with pytest.raises(ValueError, match="reset_state"):
+        ingest(sales, str(tmp_path / "state"))
+
+
+def test_daily_batches_across_a_gap_day_match_one_batch(sales, tmp_path):
+    """Rolling windows ending on a day without sales are still added once later days arrive."""
+    sales = sales[sales["Date_Of_Sale"] != pd.Timestamp("2025-01-05")]
+    by_day = [g for _, g in sales.dropna(subset=["Date_Of_Sale"]).groupby("Date_Of_Sale")]
+    _assert_same(_outputs(by_day, tmp_path / "daily"), _outputs([sales], tmp_path / "whole"))
+
+
+def test_duplicate_key_is_chosen_once_per_state(sales, tmp_path):
+    """A batch without null item codes still counts duplicates on the fallback key the state chose."""
+    sales = sales.copy()
+    sales.loc[sales["Store_Name"] == "STORE A", "Item_Code"] = sales["Item_Code"].where(sales.index != 0)
+    b = sales[sales["Store_Name"] == "STORE B"]
+    twin = b.iloc[[0]].assign(Item_Barcode=1, Description="OTHER PACK")  # same item code, other product
+    sales = pd.concat([sales, twin])
+    by_store = [g for _, g in sales.dropna(subset=["Store_Name"]).groupby("Store_Name", observed=True)]
+    assert by_store[1]["Item_Code"].notna().all()
+    _assert_same(_outputs(by_store, tmp_path / "split"), _outputs([sales], tmp_path / "whole"))
+    meta = json.loads((tmp_path / "split" / "state.json").read_text())
+    assert meta["dup_key"] == ["Store_Name", "Date_Of_Sale", "Item_Barcode", "Description"]
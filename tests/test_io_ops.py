@@ -0,0 +1,117 @@
+import os
+import pandas as pd
+import pytest
+from conftest import make_sales
+from modules import io_ops
+from modules.io_ops import expand_inputs, input_sources, load_any
+
+ALIASES = {"Quantity": "Qty", "Date_Of_Sale": "Sale_Date", "Store_Name": "Store"}
+
+
+def store_frames():
+    """The fixture split by store; the second uses other column names in reverse order."""
+    df = make_sales()
+    a, b = df[df["Store_Name"] == "STORE A"], df[df["Store_Name"] == "STORE B"]
+    return a, b, b[b.columns[::-1]].rename(columns=ALIASES)
+
+
+@pytest.fixture
+def expected(tmp_path):
+    a, b, _ = store_frames()
+    path = tmp_path / "whole.csv"
+    pd.concat([a, b]).to_csv(path, index=False)
+    return load_any(str(path))
+
+
+@pytest.fixture
+def inputs(tmp_path):
+    a, _, b_reordered = store_frames()
+    d = tmp_path / "inputs"
+    d.mkdir()
+    a.to_csv(d / "day1.csv", index=False)
+    b_reordered.to_parquet(d / "day2.parquet", index=False)
+    (d / "day3.parquet").write_bytes(b"not a parquet file")
+    (d / "~$day1.xlsx").write_bytes(b"")  # Excel lock file
+    (d / "notes.md").write_text("not an input")
+    return d
+
+
+def assert_loaded(df, expected):
+    pd.testing.assert_frame_equal(df.reset_index(drop=True), expected, check_dtype=False)
+
+
+def test_directory_loads_every_file_in_a_pool_and_reports_failures(inputs, expected):
+    assert [os.path.basename(f) for f in expand_inputs(str(inputs))] == ["day1.csv", "day2.parquet", "day3.parquet"]
+    df = load_any(str(inputs), jobs=2)
+    assert_loaded(df, expected)
+    report = {os.path.basename(r["source"]): r for r in df.attrs["inputs"]}
+    assert report["day1.csv"]["error"] is None and report["day2.parquet"]["rows"] == len(store_frames()[1])
+    assert report["day3.parquet"]["rows"] is None and report["day3.parquet"]["error"]
+
+
+def test_glob_selects_matching_files(inputs, expected):
+    a = load_any(str(inputs / "day1*"))
+    assert_loaded(load_any(str(inputs / "*.csv")), a)
+    assert len(load_any(str(inputs / "day[12].*"), jobs=1)) == len(expected)
+
+
+def test_multi_sheet_workbook_loads_every_sheet(tmp_path, expected):
+    a, _, b_reordered = store_frames()
+    path = tmp_path / "week.xlsx"
+    with pd.ExcelWriter(path) as book:
+        a.to_excel(book, sheet_name="store a", index=False)
+        b_reordered.to_excel(book, sheet_name="store b", index=False)
+    assert input_sources(str(path)) == [(str(path), "store a"), (str(path), "store b")]
+    assert_loaded(load_any(str(path)), expected)
+
+
+def test_only_unreadable_inputs_raise(inputs):
+    (inputs / "day4.csv").write_text("x,y\n1,2\n")  # no standard columns
+    with pytest.raises(ValueError, match="None of the 2 input sources could be loaded: .*day3.*day4"):
+        load_any(str(inputs / "day[34].*"))
+    with pytest.raises(FileNotFoundError):
+        load_any(str(inputs / "*.xlsx"))
+
+
+@pytest.fixture
+def parses(monkeypatch):
+    """Counts source parses (cache misses) by load_any."""
+    calls = []
+    read = io_ops._read_source
+    monkeypatch.setattr(io_ops, "_read_source", lambda *a, **k: calls.append(a[0]) or read(*a, **k))
+    return calls
+
+
+def test_cache_rebuilds_when_the_source_is_rewritten(sales_path, tmp_path, parses):
+    cache = str(tmp_path / "cache")
+    first = load_any(sales_path, cache_dir=cache)
+    assert_loaded(load_any(sales_path, cache_dir=cache), first)
+    assert len(parses) == 1
+
+    st = os.stat(sales_path)
+    with open(sales_path, "r+", encoding="utf-8") as fh:  # same size, other content
+        text = fh.read().replace("STORE B", "STORE Z")
+        fh.seek(0)
+        fh.write(text)
+    os.utime(sales_path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert os.path.getsize(sales_path) == st.st_size
+    rewritten = load_any(sales_path, cache_dir=cache)
+    assert len(parses) == 2 and "STORE Z" in set(rewritten["Store_Name"])
+
+    os.utime(sales_path, ns=(st.st_atime_ns, st.st_mtime_ns + 2 * 10**9))  # touched only
+    assert_loaded(load_any(sales_path, cache_dir=cache), rewritten)
+    assert len(parses) == 3
+    load_any(sales_path, cache_dir=cache)
+    assert len(parses) == 3
+
+
+def test_cache_rebuilds_after_a_cache_version_bump(sales_path, tmp_path, parses, monkeypatch):
+    cache = str(tmp_path / "cache")
+    first = load_any(sales_path, cache_dir=cache)
+    load_any(sales_path, cache_dir=cache)
+    assert len(parses) == 1
+    monkeypatch.setattr(io_ops, "CACHE_VERSION", io_ops.CACHE_VERSION + 1)
+    assert_loaded(load_any(sales_path, cache_dir=cache), first)
+    assert len(parses) == 2
+    load_any(sales_path, cache_dir=cache)
+    assert len(parses) == 2
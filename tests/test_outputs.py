@@ -0,0 +1,21 @@
+import os
+import pandas as pd
+import pytest
+from modules.outputs import CSV_COMPRESSION, PARQUET_COMPRESSION, OutputWriter, flush_outputs
+
+
+def read_back(path: str, fmt: str) -> pd.DataFrame:
+    return pd.read_parquet(path) if fmt == "parquet" else pd.read_csv(path, parse_dates=["Date_Of_Sale"])
+
+
+@pytest.mark.parametrize("fmt, codec", [("csv", c) for c in CSV_COMPRESSION] +
+                         [("parquet", c) for c in PARQUET_COMPRESSION])
+def test_every_codec_writes_a_readable_table(sales, tmp_path, fmt, codec):
+    kwargs = {"csv_compression": codec} if fmt == "csv" else {"parquet_compression": codec}
+    flush_outputs()
+    OutputWriter(str(tmp_path), fmt, **kwargs).write(sales, "sales")
+    [record] = flush_outputs()
+    assert record["compression"] == codec and record["rows"] == len(sales)
+    path = os.path.join(tmp_path, record["files"][0]["path"])
+    got = read_back(path, fmt)
+    pd.testing.assert_frame_equal(got, sales, check_dtype=False, check_categorical=False)
@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+import pytest
+from modules.pricing_index import compute_price_index, price_cube, price_series, supplier_grain
+
+KEYS = ["Store_Name", "Sub_Department", "Section"]
+
+
+def reference_price_index(df: pd.DataFrame):
+    """compute_price_index as it was before vectorization (groupby/apply with np.average)."""
+    grp = df.groupby(KEYS + ["Supplier"], observed=True).agg(
+        avg_price=("realised_unit_price", "mean"),
+        units=("Quantity", "sum"),
+    ).reset_index()
+    is_bidco = grp["Supplier"].str.contains("bidco", case=False, na=False)
+
+    def side(part, prefix):
+        return part.groupby(KEYS, observed=True).apply(lambda g: pd.Series({
+            f"{prefix}_avg_price": np.average(g["avg_price"], weights=g["units"]) if g["units"].sum() > 0 else np.nan,
+            f"{prefix}_units": g["units"].sum(),
+        })).reset_index()
+
+    idx = side(grp[is_bidco], "bidco").merge(side(grp[~is_bidco], "peer"), on=KEYS, how="outer")
+    idx["price_index"] = idx["bidco_avg_price"] / idx["peer_avg_price"]
+
+    def wavg(series, weights):
+        mask = series.notna() & weights.notna()
+        return np.average(series[mask], weights=weights[mask]) if mask.any() else np.nan
+
+    rollup = pd.DataFrame({
+        "bidco_avg_price_rollup": [wavg(idx["bidco_avg_price"], idx["bidco_units"])],
+        "peer_avg_price_rollup": [wavg(idx["peer_avg_price"], idx["peer_units"])],
+    })
+    rollup["price_index_rollup"] = rollup["bidco_avg_price_rollup"] / rollup["peer_avg_price_rollup"]
+    return idx, rollup
+
+
+def frame(rows) -> pd.DataFrame:
+    """Sales rows (store, sub-dept, section, supplier, quantity, realised price) with load_any's dtypes."""
+    df = pd.DataFrame(rows, columns=KEYS + ["Supplier", "Quantity", "realised_unit_price"])
+    for col in KEYS + ["Supplier"]:
+        df[col] = df[col].astype(pd.CategoricalDtype(ordered=True))
+    return df
+
+
+EDGE_CASES = {
+    "no_bidco_rows": [
+        ("S1", "FOODS", "OILS", "BIDCO", 2.0, 100.0), ("S1", "FOODS", "OILS", "PEER", 3.0, 90.0),
+        ("S1", "FOODS", "TEA", "PEER", 1.0, 50.0), ("S1", "FOODS", "TEA", "OTHER", 2.0, 55.0),
+    ],
+    "no_peer_rows": [
+        ("S1", "FOODS", "OILS", "BIDCO", 2.0, 100.0), ("S1", "FOODS", "OILS", "PEER", 3.0, 90.0),
+        ("S2", "HOME", "SOAP", "Bidco Africa", 4.0, 30.0),
+    ],
+    "zero_units": [
+        ("S1", "FOODS", "OILS", "BIDCO", 0.0, 100.0), ("S1", "FOODS", "OILS", "PEER", 3.0, 90.0),
+        ("S1", "FOODS", "TEA", "BIDCO", 2.0, 40.0), ("S1", "FOODS", "TEA", "PEER", 2.0, 45.0),
+        ("S1", "FOODS", "TEA", "OTHER", -2.0, 44.0),
+    ],
+    "nan_prices": [
+        ("S1", "FOODS", "OILS", "BIDCO", 2.0, np.nan), ("S1", "FOODS", "OILS", "PEER", 3.0, 90.0),
+        ("S1", "FOODS", "TEA", "BIDCO", 2.0, 40.0), ("S1", "FOODS", "TEA", "PEER", 2.0, np.nan),
+        ("S1", "FOODS", "TEA", "PEER", 1.0, 47.0), ("S1", "FOODS", "TEA", "OTHER", 2.0, np.nan),
+    ],
+}
+
+
+def assert_matches_reference(df):
+    idx, rollup = compute_price_index(df)
+    ref_idx, ref_rollup = reference_price_index(df)
+    pd.testing.assert_frame_equal(idx, ref_idx, check_dtype=False, check_categorical=False, rtol=1e-12)
+    pd.testing.assert_frame_equal(rollup, ref_rollup, rtol=1e-12)
+
+
+@pytest.mark.parametrize("case", sorted(EDGE_CASES))
+def test_matches_groupby_apply_on_edge_cases(case):
+    assert_matches_reference(frame(EDGE_CASES[case]))
+
+
+def test_matches_groupby_apply_on_fixture(sales):
+    assert_matches_reference(sales)
+
+
+def test_matches_groupby_apply_on_sample(sample):
+    assert_matches_reference(sample)
+
+
+def test_cube_rollups_are_marked_by_grouping_id_not_key_values():
+    """A store literally named "(All)" stays a store; roll-up rows have null keys."""
+    df = frame(EDGE_CASES["nan_prices"] + [("(All)", "FOODS", "OILS", "BIDCO", 1.0, 95.0),
+                                           ("(All)", "FOODS", "OILS", "PEER", 1.0, 85.0)])
+    cube = price_cube(supplier_grain(df))
+    leaves = cube[cube["grouping_id"] == 0]
+    pd.testing.assert_frame_equal(leaves.drop(columns="grouping_id").reset_index(drop=True),
+                                  compute_price_index(df)[0], check_dtype=False, check_categorical=False)
+    assert "(All)" in set(leaves["Store_Name"])
+    apex = cube[cube["grouping_id"] == 7]
+    assert len(apex) == 1 and apex[KEYS].isna().all(axis=None)
+    for gid, part in cube.groupby("grouping_id"):
+        for bit, key in enumerate(reversed(KEYS)):
+            assert part[key].isna().all() == bool(gid & 1 << bit)
+
+
+def test_series_rollups_are_marked_by_grouping_id(sales):
+    series = price_series(supplier_grain(sales, ["Date_Of_Sale"]))
+    rollup = series["grouping_id"] == 7
+    assert rollup.any() and series.loc[rollup, KEYS].isna().all(axis=None)
+    assert (series.loc[~rollup, "grouping_id"] == 0).all() and series.loc[~rollup, KEYS].notna().all(axis=None)
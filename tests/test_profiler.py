@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+import pytest
+from modules.profiler import HLL_P, KLL, QUANTILES, FrameProfile, HyperLogLog, _hash_values
+
+N = 200_000
+CHUNKS = 7
+HLL_ERROR = 3 * 1.04 / np.sqrt(1 << HLL_P)  # three standard errors
+KLL_RANK_ERROR = 0.01  # "about 1% rank error" (module docstring)
+
+
+def chunks(values):
+    return np.array_split(values, CHUNKS)
+
+
+@pytest.mark.parametrize("distinct", [1_000, 50_000, N])
+def test_hll_merge_equals_single_pass_within_bound(distinct):
+    values = pd.Series(np.random.default_rng(0).integers(0, distinct, N) * 7919)
+    single, merged = HyperLogLog(), HyperLogLog()
+    single.update(_hash_values(values))
+    for part in chunks(values):
+        sketch = HyperLogLog()
+        sketch.update(_hash_values(part))
+        merged.merge(sketch)
+    np.testing.assert_array_equal(merged.registers, single.registers)
+    true = values.nunique()
+    assert abs(merged.estimate() - true) / true < HLL_ERROR
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_kll_single_and_merged_quantiles_within_rank_error(seed):
+    values = np.random.default_rng(seed).permutation(N).astype(float)  # rank of v is v
+    single = KLL(seed=seed)
+    single.update(values)
+    merged = KLL(seed=seed)
+    for i, part in enumerate(chunks(values)):
+        sketch = KLL(seed=seed + i + 1)
+        sketch.update(part)
+        merged.merge(sketch)
+    assert merged.n == single.n == N
+    for sketch in (single, merged):
+        ranks = np.asarray(sketch.quantiles()) / N
+        assert np.abs(ranks - np.asarray(QUANTILES)).max() <= KLL_RANK_ERROR
+
+
+def test_merged_profile_matches_single_pass(sales):
+    single = FrameProfile().update(sales).to_dict()
+    merged = FrameProfile()
+    for part in np.array_split(np.arange(len(sales)), CHUNKS):
+        merged.merge(FrameProfile().update(sales.iloc[part]))
+    merged = merged.to_dict()
+    assert merged["rows"] == single["rows"] == len(sales)
+    for a, b in zip(single["columns"], merged["columns"]):
+        exact = {k: a[k] for k in ("column", "rows", "nulls", "min", "max", "distinct_approx", "top")}
+        assert {k: b[k] for k in exact} == exact
+        col = sales[a["column"]]
+        assert a["nulls"] == col.isna().sum() and a["distinct_approx"] == col.nunique()
+        counts = col.value_counts(sort=False)
+        assert [t["count"] for t in a["top"]] == sorted(counts[counts > 0], reverse=True)[:len(a["top"])]
@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+from modules.promotions import daily_grain, detect_episodes, detect_promotions, episodes_from_daily, sweep_promotions
+
+
+def test_episodes_from_daily_finds_the_promo_run(sales):
+    episodes = episodes_from_daily(daily_grain(sales))
+    assert len(episodes) == 1
+    ep = episodes.iloc[0]
+    assert (ep["Store_Name"], ep["Item_Code"], ep["promo_days"]) == ("STORE A", 101, 3)
+    assert ep["start_date"] == pd.Timestamp("2025-01-04")
+
+
+def test_episodes_without_promo_days_is_empty(sales):
+    promos = episodes_from_daily(daily_grain(sales))
+    none = episodes_from_daily(daily_grain(sales, discount_threshold=2.0))
+    assert none.empty
+    assert list(none.columns) == list(promos.columns)
+    assert (none.dtypes == promos.dtypes).all()
+
+
+def test_detect_episodes_on_an_empty_grain(sales):
+    assert detect_episodes(sales.iloc[:0]).empty
+
+
+def test_sweep_matches_detect_promotions_per_combination(sales):
+    sales = sales.copy()
+    deeper = (sales["Store_Name"] == "STORE B") & (sales["Item_Code"] == 301) & (sales["Date_Of_Sale"].dt.day <= 3)
+    sales.loc[deeper, "realised_unit_price"] *= 0.65
+    depth = ((sales["RRP"] - sales["realised_unit_price"]) / sales["RRP"]).dropna()
+    observed = np.unique(depth[depth > 0])
+    assert len(observed) == 2
+    thresholds = [0.0, 0.05, *observed, 0.5]  # observed depths sit exactly on the searchsorted boundary
+    sweep = sweep_promotions(sales, thresholds, [1, 2, 3])
+    assert len(sweep.groupby(["discount_threshold", "promo_min_days"])) == len(thresholds) * 3
+    for (thr, m), got in sweep.groupby(["discount_threshold", "promo_min_days"]):
+        expected = detect_promotions(sales, thr, m)
+        got = got.drop(columns=["discount_threshold", "promo_min_days", "on_promo"]).reset_index(drop=True)
+        pd.testing.assert_frame_equal(got, expected[got.columns], check_dtype=False, obj=f"{thr}/{m}")
+        assert (got["promo_days_count"] > 0).any() == (thr <= observed.max())
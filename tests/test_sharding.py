@@ -0,0 +1,49 @@
+import pandas as pd
+import pytest
+from conftest import make_sales
+from modules.data_quality import score_health
+from modules.io_ops import load_any
+from modules.pricing_index import compute_price_index
+from modules.promotions import detect_promotions
+from modules.sharding import (compute_price_index_sharded, detect_promotions_sharded, plan_shards,
+                              score_health_sharded)
+
+N_SHARDS = 3
+
+
+@pytest.fixture
+def chain(tmp_path) -> pd.DataFrame:
+    """Four stores selling the same items (suppliers and SKUs span shards), one null item code and store."""
+    base = make_sales()
+    c = base[base["Store_Name"] == "STORE A"].assign(Store_Name="STORE C", Quantity=lambda d: d["Quantity"] + 1)
+    d = base[base["Store_Name"] == "STORE B"].assign(Store_Name="STORE D", Total_Sales=lambda d: d["Total_Sales"] * 0.9)
+    df = pd.concat([base, c, d], ignore_index=True)
+    df.loc[df.index[-3], "Item_Code"] = None  # only one shard sees it; the duplicate key is chosen chain-wide
+    df.loc[df.index[-5], "Store_Name"] = None
+    path = tmp_path / "chain.csv"
+    df.to_csv(path, index=False)
+    return load_any(str(path))
+
+
+def test_shards_split_stores_not_keys(chain):
+    shards = plan_shards(chain, N_SHARDS)
+    assert len(shards) == N_SHARDS and all(shards)
+    suppliers = [set(chain.loc[chain["Store_Name"].isin(s), "Supplier"].dropna()) for s in shards]
+    assert set.intersection(*suppliers)
+
+
+def test_health_matches_in_memory(chain):
+    for a, b in zip(score_health(chain), score_health_sharded(chain, jobs=2, n_shards=N_SHARDS)):
+        pd.testing.assert_frame_equal(a, b, rtol=1e-12)
+
+
+@pytest.mark.parametrize("consecutive", [False, True])
+def test_promos_match_in_memory(chain, consecutive):
+    pd.testing.assert_frame_equal(detect_promotions(chain, consecutive=consecutive),
+                                  detect_promotions_sharded(chain, jobs=2, n_shards=N_SHARDS,
+                                                            consecutive=consecutive), rtol=1e-12)
+
+
+def test_pricing_matches_in_memory(chain):
+    for a, b in zip(compute_price_index(chain), compute_price_index_sharded(chain, jobs=2, n_shards=N_SHARDS)):
+        pd.testing.assert_frame_equal(a, b, rtol=1e-12)
@@ -0,0 +1,30 @@
+import pandas as pd
+import pytest
+from conftest import make_sales
+from modules.data_quality import score_health
+from modules.io_ops import load_any
+from modules.streaming import score_health_stream
+
+CHUNK_ROWS = 7  # does not divide the fixture's row count, and splits the duplicated rows apart
+
+
+def sales_file(tmp_path, fmt: str, null_items: bool) -> str:
+    df = make_sales()
+    df = pd.concat([df, df.iloc[[3, 60]]], ignore_index=True)  # more duplicates, far from the originals
+    if null_items:
+        df.loc[[5, 44], "Item_Code"] = None  # the duplicate rule falls back to its other key
+    path = str(tmp_path / f"sales.{fmt}")
+    df.to_csv(path, index=False) if fmt == "csv" else df.to_parquet(path, index=False)
+    return path
+
+
+@pytest.mark.parametrize("fmt", ["csv", "parquet"])
+@pytest.mark.parametrize("null_items", [False, True])
+def test_stream_matches_in_memory(tmp_path, fmt, null_items):
+    path = sales_file(tmp_path, fmt, null_items)
+    assert len(load_any(path)) % CHUNK_ROWS
+    expected = score_health(load_any(path))
+    got = score_health_stream(path, CHUNK_ROWS)
+    for name, a, b in zip(("store", "supplier"), expected, got):
+        assert (a["dup_rate"] > 0).any()
+        pd.testing.assert_frame_equal(a, b, check_categorical=False, rtol=1e-12, obj=name)
@@ -0,0 +1,202 @@
+"""
+Read side of the pipeline outputs for the dashboard.
+
+OutputStore finds each table in the output directory as Parquet (a file or a
+Hive-partitioned directory written with --partition_by) or, failing that, CSV,
+and keeps what it reads in an LRU cache keyed by the file's mtime, so reruns
+only touch disk when the pipeline has rewritten a table. Parquet reads project
+the requested columns and push the store filter down (partition pruning and
+row-group statistics); CSV tables are parsed once and filtered in memory.
+Partitioned tables come back in the column order they were written in (the
+writer's _columns.json), not with the partition columns last.
+Sort orders and top-k selections are computed with Arrow once per table
+version and reused, so pages and insights only convert the rows shown; lookup
+finds a row by its key (e.g. a price cube node) through a dict index built
+once per table version. Empty CSV fields read as null, as in the Parquet
+outputs.
+"""
+from __future__ import annotations
+import os
+import json
+from collections import OrderedDict
+from typing import Any, Callable
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.dataset as ds
+
+STORE = "Store_Name"
+COLUMNS_FILE = "_columns.json"  # written by modules.outputs into partitioned tables
+CUBE_KEYS = ["grouping_id", "Store_Name", "Sub_Department", "Section"]  # price_index_cube node key
+
+
+class OutputStore:
+    """Cached, column- and store-projected access to the tables in out_dir."""
+
+    def __init__(self, out_dir: str, max_entries: int = 64):
+        self.out_dir = out_dir
+        self.max_entries = max_entries
+        self._cache: OrderedDict[tuple, Any] = OrderedDict()
+
+    def _source(self, name: str) -> tuple[str, str, bool] | None:
+        """(path, format, partitioned) of a table; Parquet wins over CSV."""
+        for fmt, suffixes in (("parquet", (".parquet",)), ("csv", (".csv", ".csv.gz", ".csv.bz2", ".csv.xz"))):
+            for suffix in suffixes:
+                path = os.path.join(self.out_dir, name + suffix)
+                if os.path.exists(path):
+                    return path, fmt, os.path.isdir(path)
+        return None
+
+    def _version(self, name: str):
+        """Cache key of the table's current file: a rewrite (file or swapped-in directory) changes it."""
+        src = self._source(name)
+        if src is None:
+            return None
+        st = os.stat(src[0])
+        return src, st.st_mtime_ns, st.st_ino, st.st_size
+
+    def _memo(self, key: tuple, build: Callable[[], Any]) -> Any:
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        value = self._cache[key] = build()
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        return value
+
+    def exists(self, name: str) -> bool:
+        return self._source(name) is not None
+
+    def table(self, name: str, columns: list[str] | None = None, store: str | None = None) -> pa.Table | None:
+        """The table (optionally only some columns and one store's rows) as Arrow, or None if missing."""
+        version = self._version(name)
+        if version is None:
+            return None
+        cols = tuple(columns) if columns is not None else None
+        # one contiguous chunk per column: sorts and takes on many small chunks are several times slower
+        return self._memo(("table", name, version, cols, store),
+                          lambda: self._read(version, cols, store).unify_dictionaries().combine_chunks())
+
+    def _read(self, version: tuple, columns: tuple | None, store: str | None) -> pa.Table:
+        src = version[0]
+        if src[1] == "csv":
+            # CSV has no pushdown: parse the whole file once, then project/filter the cached table
+            table = self._memo(("csv", version), lambda: _written_order(self._dataset(src).to_table(), src))
+            if store is not None and STORE in table.column_names:
+                table = table.filter(pc.equal(table[STORE], store))
+            return table.select([c for c in columns if c in table.column_names]) if columns is not None else table
+        dataset = self._dataset(src)
+        names = dataset.schema.names
+        filt = ds.field(STORE) == store if store is not None and STORE in names else None
+        project = [c for c in columns if c in names] if columns is not None else None  # [] selects no columns
+        table = dataset.to_table(columns=project, filter=filt)
+        return table if columns is not None else _written_order(table, src)
+
+    @staticmethod
+    def _dataset(src: tuple[str, str, bool]) -> ds.Dataset:
+        path, fmt, partitioned = src
+        if fmt == "csv":
+            fmt = ds.CsvFileFormat(convert_options=pacsv.ConvertOptions(strings_can_be_null=True))
+        return ds.dataset(path, format=fmt, partitioning="hive" if partitioned else None)
+
+    def frame(self, name: str, columns: list[str] | None = None, store: str | None = None) -> pd.DataFrame:
+        """table() as pandas (empty when the table is missing); meant for small tables."""
+        version = self._version(name)
+        if version is None:
+            return pd.DataFrame()
+        cols = tuple(columns) if columns is not None else None
+        return self._memo(("frame", name, version, cols, store),
+                          lambda: self.table(name, columns, store).to_pandas())
+
+    def distinct(self, name: str, column: str) -> list:
+        """Sorted non-null values of a column."""
+        version = self._version(name)
+        if version is None:
+            return []
+        def build():
+            values = pc.unique(self.table(name, [column]).column(column).combine_chunks())
+            return sorted(v for v in values.to_pylist() if v is not None)
+        return self._memo(("distinct", name, version, column), build)
+
+    def _order(self, name: str, sort_by: tuple, store: str | None, where: tuple) -> pa.Array:
+        """Row positions of the (store-filtered) table matching where, in sort_by order."""
+        version = self._version(name)
+        def build():
+            table = self.table(name, sorted({c for c, _ in sort_by} | {c for c, _, _ in where}), store)
+            keep = None
+            if where:
+                keep = pc.indices_nonzero(_mask(table, where))
+                table = table.take(keep)
+            order = pc.sort_indices(table, sort_keys=list(sort_by), null_placement="at_end")
+            return order if keep is None else keep.take(order)
+        return self._memo(("order", name, version, sort_by, store, where), build)
+
+    def page(self, name: str, sort_by: list[tuple[str, str]], page: int = 0, page_size: int = 50,
+             columns: list[str] | None = None, store: str | None = None,
+             where: list[tuple[str, str, Any]] | None = None) -> tuple[pd.DataFrame, int]:
+        """
+        One page of the sorted table and the number of matching rows.
+
+        sort_by is Arrow's [(column, "ascending"|"descending"), ...]; where is a
+        list of (column, op, value) conditions that must all hold, e.g.
+        [("promo_uplift_pct", ">=", 0.4)].
+        """
+        if not self.exists(name):
+            return pd.DataFrame(), 0
+        order = self._order(name, tuple(sort_by), store, tuple(where or ()))
+        rows = order[page * page_size:(page + 1) * page_size]
+        return self.table(name, columns, store).take(rows).to_pandas(), len(order)
+
+    def top_k(self, name: str, k: int, sort_by: list[tuple[str, str]], columns: list[str] | None = None,
+              store: str | None = None, where: list[tuple[str, str, Any]] | None = None) -> pd.DataFrame:
+        """The first k rows in sort_by order (among the rows matching where)."""
+        return self.page(name, sort_by, 0, k, columns, store, where)[0]
+
+    def lookup(self, name: str, keys: list[str], values: tuple, columns: list[str] | None = None) -> pd.DataFrame:
+        """The row whose keys equal values (None matches null), found in O(1); empty if there is none."""
+        version = self._version(name)
+        if version is None:
+            return pd.DataFrame()
+        def build():
+            table = self.table(name, keys)
+            return {key: i for i, key in enumerate(zip(*(table.column(c).to_pylist() for c in keys)))}
+        pos = self._memo(("index", name, version, tuple(keys)), build).get(tuple(values))
+        return self.table(name, columns).take(pa.array([] if pos is None else [pos], pa.int64())).to_pandas()
+
+    def sample(self, name: str, columns: list[str], n: int = 5000, seed: int = 0) -> pd.DataFrame:
+        """At most n rows with non-null columns, chosen at random once per table version (for charts)."""
+        version = self._version(name)
+        if version is None:
+            return pd.DataFrame()
+        def build():
+            table = self.table(name, columns).drop_null()
+            if table.num_rows > n:
+                rows = np.sort(np.random.default_rng(seed).choice(table.num_rows, n, replace=False))
+                table = table.take(pa.array(rows))
+            return table.to_pandas()
+        return self._memo(("sample", name, version, tuple(columns), n, seed), build)
+
+
+def _written_order(table: pa.Table, src: tuple[str, str, bool]) -> pa.Table:
+    """A partitioned table's columns in the order the writer recorded (as is for files or without a record)."""
+    path = os.path.join(src[0], COLUMNS_FILE)
+    if not src[2] or not os.path.exists(path):
+        return table
+    with open(path, "r", encoding="utf-8") as fh:
+        order = [c for c in json.load(fh) if c in table.column_names]
+    return table.select(order + [c for c in table.column_names if c not in order])
+
+
+_OPS = {"==": pc.equal, "!=": pc.not_equal, "<": pc.less, "<=": pc.less_equal,
+        ">": pc.greater, ">=": pc.greater_equal}
+
+
+def _mask(table: pa.Table, where: tuple) -> pa.Array:
+    """AND of (column, op, value) conditions, as pyarrow's filters use; null compares as False."""
+    keep = None
+    for col, op, value in where:
+        cond = pc.fill_null(_OPS[op](table[col], value), False)
+        keep = cond if keep is None else pc.and_(keep, cond)
+    return keep